@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''Compares the table formatter against the PrettyTable-based one it replaced.
+
+Usage: python benchmarks/bench_table.py [rows]
+
+Needs halonctl to be importable (e.g. ``pip install -e .``) and prettytable,
+which halonctl itself no longer depends on (``pip install prettytable``).
+The "stream" timing includes value conversion, the others only time the
+rendering.'''
+from __future__ import print_function
+import sys
+import time
+from six.moves import StringIO
+from prettytable import PrettyTable
+from halonctl.formatters.table import formatter
+
+class Args(object):
+	raw = False
+
+def make_data(n):
+	yield (u"Cluster", u"Node", u"Message ID", u"From", u"To", u"Subject")
+	for i in range(n):
+		subject = u"Ärende {0}".format(i) if i % 10 else u"件名 {0}".format(i)
+		yield (u"c1", u"n{0}".format(i % 4), u"<{0}@example.com>".format(i), u"sender{0}@example.com".format(i),
+			u"rcpt{0}@example.org".format(i % 100), subject)
+
+def run_prettytable(rows):
+	table = PrettyTable(rows[0])
+	table.align = "l"
+	table.border = False
+	table.left_padding_width = 0
+	table.right_padding_width = 2
+	for row in rows[1:]:
+		table.add_row(row)
+	return table.get_string()
+
+def run_native(rows):
+	return formatter.format(rows, Args())
+
+def run_stream(rows):
+	buf = StringIO()
+	formatter.stream(rows, Args(), buf)
+	return buf.getvalue()
+
+if __name__ == '__main__':
+	n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+	
+	# Value conversion is the same for both, so only time the rendering
+	rows = list(formatter.iter_rows(make_data(n), Args()))
+	
+	for name, f in [('prettytable', run_prettytable), ('native', run_native), ('stream', run_stream)]:
+		started = time.time()
+		f(rows)
+		print(u"{name:12} {rows} rows: {t:.3f}s".format(name=name, rows=n, t=time.time() - started))
@@ -5,6 +5,7 @@ import six
 import os, sys
 import re
 import inspect
+import itertools
 import pkgutil
 import importlib
 import argparse
@@ -13,14 +14,21 @@ import logging
 import arrow
 import requests
 import getpass
+import atexit
+import tempfile
+import threading
 from collections import OrderedDict
+from concurrent.futures import as_completed, TimeoutError as FuturesTimeoutError
 from natsort import natsorted
 from .models import *
 from .util import *
 from .roles import Role
+from .proxies import get_timeout
 from . import __version__
 from . import cache
 from . import config as g_config
+from .stats import stats
+from .health import health
 
 # Figure out where this script is, and change the PATH appropriately
 BASE = os.path.abspath(os.path.dirname(sys.modules[__name__].__file__))
@@ -175,28 +183,76 @@ def apply_filter(available_nodes, available_clusters, nodes, clusters, slice_=''
 	
 	return NodeList(targets.values())
 
+def fetch_wsdl(node, path, verify, won, lock):
+	'''Downloads the WSDL from a node, racing other nodes to the cache.
+	
+	The file is streamed to a temporary file next to ``path``, then renamed
+	into place if no other node has won the race yet. Returns True if this
+	node's download was the one that ended up in the cache.'''
+	
+	timeout = get_timeout('wsdl')
+	if timeout is None or won.is_set():
+		return False
+	
+	r = requests.get(u"{scheme}://{host}/remote/?wsdl".format(scheme=node.scheme, host=node.host), stream=True, timeout=timeout, verify=False if node.no_verify else verify)
+	if r.status_code != 200:
+		# Streamed responses keep their connection until closed
+		r.close()
+		return False
+	
+	fd, tmp_path = tempfile.mkstemp(prefix=cache.get_filename(u"wsdl."), dir=os.path.dirname(path))
+	try:
+		with os.fdopen(fd, 'wb') as f:
+			for chunk in r.iter_content(65536):
+				if won.is_set():
+					return False
+				f.write(chunk)
+		
+		with lock:
+			if won.is_set():
+				return False
+			rename_atomic(tmp_path, path)
+			won.set()
+			return True
+	finally:
+		r.close()
+		if os.path.exists(tmp_path):
+			os.remove(tmp_path)
+
 def download_wsdl(nodes, verify):
 	path = cache.get_path(u"wsdl.xml")
 	min_mtime = arrow.utcnow().replace(hours=-12)
-	if not os.path.exists(path) or arrow.get(os.path.getmtime(path)) < min_mtime:
-		has_been_downloaded = False
-		for node in nodes:
+	if os.path.exists(path) and arrow.get(os.path.getmtime(path)) >= min_mtime:
+		return
+	
+	# Ask every node at once, and go with whichever answers first; a single
+	# dead node shouldn't hold up the rest
+	won = threading.Event()
+	lock = threading.Lock()
+	futures = { executor.submit(fetch_wsdl, node, path, verify, won, lock): node for node in nodes }
+	
+	ssl_error_node = None
+	try:
+		for future in as_completed(futures, timeout=deadline.time_left()):
 			try:
-				r = requests.get(u"{scheme}://{host}/remote/?wsdl".format(scheme=node.scheme, host=node.host), stream=True, verify=False if node.no_verify else verify)
-				if r.status_code == 200:
-					with open(path, 'wb') as f:
-						for chunk in r.iter_content(256):
-							f.write(chunk)
-					has_been_downloaded = True
+				if future.result():
 					break
 			except requests.exceptions.SSLError:
-				print_ssl_error(node)
-				sys.exit(1)
-			except:
+				ssl_error_node = ssl_error_node or futures[future]
+			except Exception:
 				pass
-		
-		if not has_been_downloaded:
-			sys.exit("None of your nodes are available, can't download WSDL")
+	except FuturesTimeoutError:
+		deadline.missed = True
+	finally:
+		won.set()
+		for future in futures:
+			future.cancel()
+	
+	if not os.path.exists(path) or arrow.get(os.path.getmtime(path)) < min_mtime:
+		if ssl_error_node:
+			print_ssl_error(ssl_error_node)
+			sys.exit(1)
+		sys.exit("None of your nodes are available, can't download WSDL")
 
 
 
@@ -239,6 +295,8 @@ def main():
 	
 	parser.add_argument('-i', '--ignore-partial', action='store_true',
 		help=u"exit normally even for partial results")
+	parser.add_argument('-D', '--deadline', type=float, metavar='SECONDS',
+		help=u"give up on nodes that haven't answered within this time")
 	parser.add_argument('-f', '--format', choices=list(formatters.keys()), default='table',
 		help=u"use the specified output format (default: table)")
 	parser.add_argument('-r', '--raw', action='store_true',
@@ -247,16 +305,47 @@ def main():
 		help=u"group output; ignored for table-like formats")
 	parser.add_argument('-k', '--key', dest='group_key', action='store_true',
 		help=u"assume grouper is unique, and key only a single value to it")
+	parser.add_argument('--sort-by', metavar="COLUMN",
+		help=u"sort output by a column, even if it doesn't fit in memory")
+	parser.add_argument('--top', type=int, metavar="N",
+		help=u"only output the first N rows, in sorted order")
+	parser.add_argument('--desc', dest='reverse', action='store_true',
+		help=u"sort in descending order")
 	
 	parser.add_argument('--clear-cache', action='store_true',
-		help=u"clear the WSDL cache")
+		help=u"clear the WSDL and result caches")
+	parser.add_argument('--refresh', action='store_true',
+		help=u"don't use cached results, but cache new ones")
+	parser.add_argument('--force-retry', action='store_true',
+		help=u"contact nodes even if they were recently unreachable")
+	parser.add_argument('--stats', action='store_true',
+		help=u"print resource usage statistics to stderr at exit")
 	
 	# Parse!
 	args = parser.parse_args()
 	
+	# Start collecting statistics as early as possible, and print them no
+	# matter how we exit
+	if args.stats:
+		stats.enable()
+		atexit.register(stats.print_summary)
+	
+	# Start the clock on the deadline; nodes that haven't answered by the
+	# time it runs out will be treated as unreachable
+	if args.deadline is not None:
+		deadline.start(args.deadline)
+	
 	# Clear cache if requested
 	if args.clear_cache:
-		os.remove(cache.get_path(u"wsdl.xml"))
+		if os.path.exists(cache.get_path(u"wsdl.xml")):
+			os.remove(cache.get_path(u"wsdl.xml"))
+		cache.clear_results()
+	cache.refresh = args.refresh
+	
+	# Load the health store, and remember what we learn about nodes this time
+	health.force = args.force_retry
+	health.load()
+	atexit.register(health.save)
 	
 	# Load configuration
 	config = load_config(args.config or open_config())
@@ -328,27 +417,41 @@ def main():
 			print(u"  - {name} ({cluster})".format(name=node.name, cluster=node.cluster.name))
 		return
 	
-	# Download WSDL and create client objects
-	download_wsdl(target_nodes, verify=config.get('verify_ssl', True))
-	for node in target_nodes:
-		node.load_wsdl()
+	# Modules working with local data don't need the nodes to be ready
+	mod = args._mod
+	if not mod.is_offline(args):
+		# Start checking if recently unreachable nodes are back up, while we
+		# get everything else ready
+		if not health.force:
+			health.start_probes(target_nodes)
+		
+		# Download WSDL and create client objects
+		download_wsdl(target_nodes, verify=config.get('verify_ssl', True))
+		for node in target_nodes:
+			node.load_wsdl()
 	
 	# Run the selected module
-	mod = args._mod
 	retval = mod.run(target_nodes, args)
 	
-	# Normalize generator mods into lists (lets us detect emptiness)
+	# Peek at the first row of generator mods, to detect emptiness without
+	# having to hold the entire result in memory
 	if inspect.isgenerator(retval):
-		retval = list(retval)
+		first = next(retval, None)
+		retval = itertools.chain([first], retval) if first is not None else None
 	
-	# Print something, if there's anything to print
+	# Print something, if there's anything to print; formatters that can are
+	# fed rows as the module yields them
 	if retval:
 		if hasattr(retval, 'draw'):
 			print(retval.draw())
 		elif isinstance(retval, Role):
 			print(retval.raw() if args.raw else retval.human())
 		else:
-			print(formatters[args.format].run(retval, args))
+			formatters[args.format].stream(retval, args, sys.stdout)
+	
+	# Anything cut short by the deadline means we're missing results
+	if deadline.missed:
+		mod.partial = True
 	
 	# Let the module decide the exit code - either by explicitly setting it, or
 	# by marking the result as partial, in which case a standard exit code is
@@ -1,7 +1,14 @@
 from __future__ import print_function
 import six
 import os
+import time
+import json
+import shutil
+import hmac
+import hashlib
 import tempfile
+from .config import config
+from .util import rename_atomic
 
 def get_filename(name):
 	return u"halonctl_{name}".format(name=name)
@@ -12,10 +19,179 @@ def get_path(name):
 def get(name):
 	path = get_path(name)
 	if os.path.exists(path):
-		with open(get_path(name), 'rU') as f:
+		with open(path, 'r') as f:
 			return f.read()
 
 def set(name, data):
 	path = get_path(name)
-	with open(get_path(name), 'wU') as f:
+	with open(path, 'w') as f:
 		f.write(data)
+
+# Set to True to ignore cached results, while still caching new ones
+refresh = False
+
+def get_private_dir(name):
+	'''Returns a directory for things private to the user, creating it if
+	needed, or None if it can't be used.
+	
+	Unlike the WSDL, these are kept in the user's own cache directory
+	(``$XDG_CACHE_HOME``, or ``~/.cache``), which must only be accessible to
+	them; if anyone else owns it, or can get into it, it's not used.'''
+	
+	base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser(u"~"), u".cache")
+	path = os.path.join(base, u"halonctl", name)
+	try:
+		if not os.path.isdir(path):
+			os.makedirs(path, 0o700)
+		st = os.stat(path)
+	except OSError:
+		return None
+	
+	if hasattr(os, 'getuid') and (st.st_uid != os.getuid() or st.st_mode & 0o077):
+		return None
+	return path
+
+def get_results_dir():
+	'''Returns the :func:`private directory <get_private_dir>` cached results
+	are kept in, or None if it can't be used, in which case nothing is
+	cached.'''
+	
+	return get_private_dir(u"results")
+
+def write_atomic(directory, name, data):
+	'''Writes a file by writing a temporary file and renaming it into place,
+	so other halonctl processes reading it at the same time never see half of
+	it. Returns False if it couldn't be written.'''
+	
+	try:
+		fd, tmp_path = tempfile.mkstemp(prefix=u".{0}.".format(name), dir=directory)
+	except (IOError, OSError):
+		return False
+	
+	try:
+		with os.fdopen(fd, 'w') as f:
+			f.write(data)
+		rename_atomic(tmp_path, os.path.join(directory, name))
+		return True
+	except (IOError, OSError):
+		return False
+	finally:
+		if os.path.exists(tmp_path):
+			os.remove(tmp_path)
+
+def get_state(name):
+	'''Returns the contents of a file saved with :func:`set_state`, or None.'''
+	
+	directory = get_private_dir(u"state")
+	if directory is None:
+		return None
+	
+	try:
+		with open(os.path.join(directory, name), 'r') as f:
+			return f.read()
+	except (IOError, OSError):
+		return None
+
+def set_state(name, data):
+	'''Saves something that should outlive this process in the user's
+	:func:`private directory <get_private_dir>`. Failing to isn't an error;
+	it just won't be remembered.'''
+	
+	directory = get_private_dir(u"state")
+	if directory is not None:
+		write_atomic(directory, name, data)
+
+def get_secret(directory):
+	'''Returns the random secret cache keys are made with, creating it the
+	first time, so that they can't be guessed from the things they're made
+	from.'''
+	
+	path = os.path.join(directory, u"secret")
+	if not os.path.exists(path):
+		fd, tmp_path = tempfile.mkstemp(prefix=u".secret.", dir=directory)
+		try:
+			with os.fdopen(fd, 'wb') as f:
+				f.write(os.urandom(32))
+			rename_atomic(tmp_path, path)
+		finally:
+			if os.path.exists(tmp_path):
+				os.remove(tmp_path)
+	
+	# Read it back, in case another process created one at the same time
+	with open(path, 'rb') as f:
+		return f.read()
+
+def get_ttl(name):
+	'''Returns how many seconds results of an operation may be cached for.
+	
+	TTLs are looked up in the ``result_cache`` configuration key, by the
+	operation's name; operations not listed there aren't cached.'''
+	
+	return config.get('result_cache', {}).get(name, 0)
+
+def make_key(*parts):
+	'''Makes a cache key from anything JSON-serializable, such as a node's
+	address, an operation and its arguments.
+	
+	Keys are HMACs, made with a random secret that's private to the user, so
+	secrets such as passwords may safely be part of them. Returns None if
+	there's no usable cache directory.'''
+	
+	directory = get_results_dir()
+	if directory is None:
+		return None
+	
+	try:
+		secret = get_secret(directory)
+	except (IOError, OSError):
+		return None
+	
+	data = json.dumps(parts, sort_keys=True, default=six.text_type)
+	return hmac.new(secret, data.encode('utf-8'), hashlib.sha256).hexdigest()
+
+def make_node_key(node, *parts):
+	'''Like :func:`make_key`, for something fetched from a node, with the
+	node's credentials, so a different login doesn't get the same result.'''
+	
+	return make_key(node.scheme, node.host, node.username, node.password, *parts)
+
+def get_result(key, ttl):
+	'''Returns a result stored with :func:`set_result`, if it's no more than
+	``ttl`` seconds old, or None; also if the entry is damaged. Callers should
+	still check that the value is what they expect.'''
+	
+	if key is None or not ttl or refresh:
+		return None
+	
+	try:
+		with open(os.path.join(get_results_dir(), key), 'r') as f:
+			entry = json.load(f)
+		age = time.time() - entry['time']
+		value = entry['value']
+	except (IOError, OSError, TypeError, ValueError, KeyError, AttributeError):
+		# Anything we can't make sense of is as good as missing
+		return None
+	
+	if age > ttl:
+		return None
+	return value
+
+def set_result(key, value):
+	'''Stores a JSON-serializable result in the on-disk cache.
+	
+	Entries are written with :func:`write_atomic`, so other halonctl
+	processes reading the cache at the same time never see half of one.
+	Failing to write one isn't an error; it just won't be cached.'''
+	
+	directory = get_results_dir()
+	if key is None or directory is None:
+		return
+	
+	write_atomic(directory, key, json.dumps({ 'time': time.time(), 'value': value }))
+
+def clear_results():
+	'''Removes every cached result.'''
+	
+	directory = get_results_dir()
+	if directory is not None:
+		shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,241 @@
+from __future__ import print_function
+import six
+import sys
+import json
+import zlib
+import struct
+from array import array
+
+# Identifies the file format, and its version
+MAGIC = b"HCOL\x01"
+
+# Number of rows to buffer before writing them out as a row group
+ROW_GROUP_SIZE = 10000
+
+# Stands in for None in integer columns
+INT_NULL = -(1 << 63)
+
+# Stands in for None in dictionary-encoded columns
+CODE_NULL = 0xFFFFFFFF
+
+INT = u"int"
+STR = u"str"
+
+def _to_bytes(a):
+	'''Serializes an array as little-endian bytes.'''
+	
+	if sys.byteorder == 'big':
+		a = array(a.typecode, a)
+		a.byteswap()
+	return a.tostring() if six.PY2 else a.tobytes()
+
+def _from_bytes(typecode, data):
+	a = array(typecode)
+	if six.PY2:
+		a.fromstring(data)
+	else:
+		a.frombytes(data)
+	if sys.byteorder == 'big':
+		a.byteswap()
+	return a
+
+def _write_block(f, data):
+	data = zlib.compress(data)
+	f.write(struct.pack('<I', len(data)))
+	f.write(data)
+
+def _read_block(f):
+	length, = struct.unpack('<I', _read_exactly(f, 4))
+	return zlib.decompress(_read_exactly(f, length))
+
+def _read_exactly(f, n):
+	data = f.read(n)
+	if len(data) != n:
+		raise ValueError(u"Truncated file")
+	return data
+
+def _is_int(value):
+	return value is None or (isinstance(value, six.integer_types) and not isinstance(value, bool))
+
+def encode_column(values):
+	'''Encodes a column of values, returning ``(type, blocks)``.
+	
+	Columns of nothing but integers (and None) are stored as 64-bit integer
+	arrays; anything else is stored as text, dictionary-encoded, which is
+	very compact for repetitive values such as domains or transports.'''
+	
+	if all(_is_int(v) for v in values):
+		return (INT, [_to_bytes(array('q', [INT_NULL if v is None else v for v in values]))])
+	
+	codes = array('I')
+	dictionary = {}
+	for v in values:
+		if v is None:
+			codes.append(CODE_NULL)
+			continue
+		
+		v = six.text_type(v)
+		code = dictionary.get(v)
+		if code is None:
+			code = dictionary[v] = len(dictionary)
+		codes.append(code)
+	
+	entries = sorted(dictionary, key=dictionary.get)
+	return (STR, [json.dumps(entries).encode('utf-8'), _to_bytes(codes)])
+
+def decode_column(type_, blocks):
+	'''Decodes a column; see :func:`encode_column`.
+	
+	Integer columns are returned as an ``array('q')``, with None as
+	:data:`INT_NULL`; text columns are returned as ``(entries, codes)``,
+	where ``codes`` is an ``array('I')`` of indices into ``entries``, with
+	None as :data:`CODE_NULL`.'''
+	
+	if type_ == INT:
+		return _from_bytes('q', blocks[0])
+	return (json.loads(blocks[0].decode('utf-8')), _from_bytes('I', blocks[1]))
+
+def expand_column(type_, column):
+	'''Turns a decoded column into a list of values.'''
+	
+	if type_ == INT:
+		return [None if v == INT_NULL else v for v in column]
+	
+	entries, codes = column
+	entries = entries + [None]
+	return [entries[-1 if c == CODE_NULL else c] for c in codes]
+
+class Writer(object):
+	'''Writes rows to a file in a compact, columnar format.
+	
+	Rows are buffered, and written out ``row_group_size`` at a time as a row
+	group, with each column compressed separately; only one row group is
+	ever held in memory. Call :func:`close` when done, or use it as a
+	context manager, which leaves the file incomplete (and unreadable to
+	the end) if an exception is raised.
+	
+	Example::
+	
+		with Writer(open('out.hcol', 'wb'), ['node', 'time']) as w:
+			w.write([u"n1", 1400000000])
+	'''
+	
+	def __init__(self, f, columns, row_group_size=ROW_GROUP_SIZE):
+		self.f = f
+		self.columns = list(columns)
+		self.row_group_size = row_group_size
+		self.rows = []
+		self.count = 0
+		
+		f.write(MAGIC)
+		_write_block(f, json.dumps({ 'columns': self.columns }).encode('utf-8'))
+	
+	def __enter__(self):
+		return self
+	
+	def __exit__(self, type_, value, traceback):
+		# If something went wrong, leave the end marker out, so the file can't
+		# be mistaken for a complete one
+		if type_ is None:
+			self.close()
+		else:
+			self.f.close()
+	
+	def write(self, row):
+		'''Writes a row, which must have a value for every column.'''
+		
+		self.rows.append(row)
+		self.count += 1
+		if len(self.rows) >= self.row_group_size:
+			self.flush()
+	
+	def flush(self):
+		'''Writes out any buffered rows as a row group.'''
+		
+		if not self.rows:
+			return
+		
+		encoded = [encode_column(list(values)) for values in zip(*self.rows)]
+		self.f.write(struct.pack('<I', len(self.rows)))
+		_write_block(self.f, json.dumps([type_ for type_, blocks in encoded]).encode('utf-8'))
+		for type_, blocks in encoded:
+			for block in blocks:
+				_write_block(self.f, block)
+		self.rows = []
+	
+	def close(self):
+		'''Flushes any remaining rows, marks the end, and closes the file.'''
+		
+		self.flush()
+		self.f.write(struct.pack('<I', 0))
+		self.f.close()
+
+class Reader(object):
+	'''Reads files written by :class:`Writer`.
+	
+	Iterating over a reader gives rows as lists, one row group at a time;
+	:func:`to_numpy` loads entire columns into NumPy arrays instead. Call
+	:func:`close` when done, or use it as a context manager.
+	
+	:ivar list columns: The names of the columns
+	'''
+	
+	def __init__(self, f):
+		self.f = f
+		if f.read(len(MAGIC)) != MAGIC:
+			raise ValueError(u"Not a columnar export, or an unsupported version")
+		self.columns = json.loads(_read_block(f).decode('utf-8'))['columns']
+	
+	def __enter__(self):
+		return self
+	
+	def __exit__(self, type_, value, traceback):
+		self.close()
+	
+	def close(self):
+		self.f.close()
+	
+	def iter_row_groups(self):
+		'''Yields every row group as a list of ``(type, column)`` tuples, in
+		the form returned by :func:`decode_column`.'''
+		
+		while True:
+			count, = struct.unpack('<I', _read_exactly(self.f, 4))
+			if count == 0:
+				return
+			
+			types = json.loads(_read_block(self.f).decode('utf-8'))
+			yield [
+				(type_, decode_column(type_, [_read_block(self.f) for _ in range(1 if type_ == INT else 2)]))
+				for type_ in types
+			]
+	
+	def __iter__(self):
+		for group in self.iter_row_groups():
+			for row in zip(*[expand_column(type_, column) for type_, column in group]):
+				yield list(row)
+	
+	def to_numpy(self):
+		'''Loads every column into a NumPy array, returning a dict of them.
+		
+		Integer columns become ``int64`` arrays, masked where there's no
+		value; text columns become object arrays. Requires NumPy.'''
+		
+		import numpy
+		
+		parts = [[] for _ in self.columns]
+		for group in self.iter_row_groups():
+			for i, (type_, column) in enumerate(group):
+				if type_ == INT:
+					parts[i].append(numpy.ma.masked_equal(numpy.frombuffer(_to_bytes(column), dtype='<i8'), INT_NULL))
+				else:
+					entries, codes = column
+					lookup = numpy.array(entries + [None], dtype=object)
+					codes = numpy.frombuffer(_to_bytes(codes), dtype='<u4').astype('int64')
+					codes[codes == CODE_NULL] = len(entries)
+					parts[i].append(numpy.ma.masked_array(lookup[codes]))
+		
+		result = {}
+		for name, columns in zip(self.columns, parts):
+			result[name] = numpy.ma.concatenate(columns) if columns else numpy.ma.masked_array([])
+		return result
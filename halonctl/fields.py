@@ -0,0 +1,112 @@
+from __future__ import print_function
+import six
+from .roles import UTCDate, Base64Text
+
+def attr(name):
+	'''Returns an extractor for an attribute that may be missing.
+	
+	Older nodes don't return fields added in later versions, so those are
+	treated as None rather than errors.'''
+	
+	def extract(node, msg):
+		return getattr(msg, name, None)
+	return extract
+
+def node_name(node, msg):
+	return node.name
+
+def cluster_name(node, msg):
+	return node.cluster.name
+
+def subject(node, msg):
+	return Base64Text(getattr(msg, 'msgsubject', None))
+
+def timestamp(timezone):
+	def extract(node, msg):
+		return UTCDate(getattr(msg, 'msgts0', None), timezone)
+	return extract
+
+def domain(address):
+	'''Returns the domain part of an email address, in lowercase.'''
+	
+	return address.rpartition('@')[2].lower() if address else None
+
+def domain_of(extract):
+	def extract_domain(node, msg):
+		return domain(extract(node, msg))
+	return extract_domain
+
+# Fields available for both the queue and history, and their extractors;
+# factories take (history, timezone) and return an extractor
+common_fields = {
+	'action': lambda history, timezone: attr('msgaction'),
+	'actionid': lambda history, timezone: attr('msgactionid'),
+	'cluster': lambda history, timezone: cluster_name,
+	'from': lambda history, timezone: attr('msgfrom'),
+	'helo': lambda history, timezone: attr('msghelo'), # Added in 3.3
+	'ip': lambda history, timezone: attr('msgfromserver'),
+	'messageid': lambda history, timezone: attr('msgid'),
+	'node': lambda history, timezone: node_name,
+	'queueid': lambda history, timezone: attr('msgqueueid' if history else 'id'),
+	'sasl': lambda history, timezone: attr('msgsasl'),
+	'server': lambda history, timezone: attr('msglistener'),
+	'size': lambda history, timezone: attr('msgsize'), # Added in 3.3
+	'subject': lambda history, timezone: subject,
+	'time': lambda history, timezone: timestamp(timezone),
+	'to': lambda history, timezone: attr('msgto'),
+	'transport': lambda history, timezone: attr('msgtransport'),
+}
+
+# Fields only available from one or the other
+history_only_fields = {
+	'historyid': lambda history, timezone: attr('id'),
+}
+
+queue_only_fields = {
+	'quarantine': lambda history, timezone: attr('msgquarantine'),
+	'retry': lambda history, timezone: attr('msgretries'),
+}
+
+# Fields computed from other fields, rather than returned by the node
+derived_fields = {
+	'fromdomain': lambda history, timezone: domain_of(attr('msgfrom')),
+	'todomain': lambda history, timezone: domain_of(attr('msgto')),
+}
+
+history_fields = dict(common_fields, **dict(history_only_fields, **derived_fields))
+queue_fields = dict(common_fields, **dict(queue_only_fields, **derived_fields))
+
+def get_supported_fields(history, derived=True):
+	'''Returns the names of all fields available from the queue or history.
+	
+	:param bool derived: Include fields computed from other fields
+	'''
+	
+	return sorted(common_fields) + sorted(history_only_fields if history else queue_only_fields) + \
+		(sorted(derived_fields) if derived else [])
+
+def compile_fields(fields, history=False, timezone=None):
+	'''Compiles a list of field names into a function extracting them.
+	
+	The returned function takes a ``(node, msg)`` pair, where ``msg`` is an
+	item from a ``mailQueue`` or ``mailHistory`` call, and returns a list of
+	the fields' values. The field names are only looked up once, here, so
+	this is cheap to call for every message.
+	
+	:raises KeyError: If a field isn't supported
+	'''
+	
+	available = history_fields if history else queue_fields
+	extractors = tuple(available[f](history, timezone) for f in fields)
+	
+	def extract(node, msg):
+		return [e(node, msg) for e in extractors]
+	return extract
+
+def compile_field(field, history=False, timezone=None):
+	'''Compiles a single field name into a function extracting it.
+	
+	Like :func:`compile_fields`, but the function returns the value itself,
+	rather than a list.'''
+	
+	return (history_fields if history else queue_fields)[field](history, timezone)
@@ -8,5 +8,10 @@ class CSVFormatter(Formatter):
 		w = csv.writer(buf)
 		w.writerows(data)
 		return buf.getvalue()
+	
+	def stream(self, data, args, out):
+		w = csv.writer(out)
+		for row in self.iter_rows(data, args):
+			w.writerow(row)
 
 formatter = CSVFormatter()
@@ -2,6 +2,7 @@ import six
 import json
 from halonctl.modapi import DictFormatter
 from halonctl.util import textualize
+from halonctl.sorting import group_sorted
 
 class JSONFormatter(DictFormatter):
 	def format(self, data, args):
@@ -9,5 +10,37 @@ class JSONFormatter(DictFormatter):
 	
 	def format_key(self, header, args):
 		return six.text_type(header).lower().replace(' ', '_')
+	
+	def stream(self, data, args, out):
+		if args.group_by:
+			return self.stream_groups(data, args, out)
+		
+		# Write the array one item at a time, indented the same way as if it
+		# had been serialized all at once
+		separator = u"[\n    "
+		for row in self.iter_dicts(data, args):
+			out.write(separator)
+			out.write(self.format(row, args).replace(u"\n", u"\n    "))
+			separator = u",\n    "
+		
+		out.write(u"[]\n" if separator == u"[\n    " else u"\n]\n")
+	
+	def stream_groups(self, data, args, out):
+		'''Writes grouped output one group at a time, in key order.
+		
+		Rows are grouped with :func:`halonctl.sorting.group_sorted`, which
+		spills to disk for large results, rather than a dict in memory.'''
+		
+		groups = group_sorted(self.iter_dicts(data, args),
+			lambda row: row.get(args.group_by, None), args.group_key)
+		
+		# Serialize each group as a dict of its own, and strip off the braces
+		separator = u"{\n"
+		for key, group in groups:
+			out.write(separator)
+			out.write(self.format({ key: group }, args)[2:-2])
+			separator = u",\n"
+		
+		out.write(u"{}\n" if separator == u"{\n" else u"\n}\n")
 
 formatter = JSONFormatter()
@@ -0,0 +1,41 @@
+import sys
+import six
+from halonctl.modapi import DictFormatter
+
+try:
+	import msgpack
+except ImportError:
+	msgpack = None
+
+class MessagePackFormatter(DictFormatter):
+	'''A stream of MessagePack maps; one per row.
+	
+	Requires the msgpack package to be installed.'''
+	
+	native = True
+	
+	def format(self, data, args):
+		if msgpack is None:
+			sys.exit(u"The msgpack output format requires the 'msgpack' package")
+		
+		packer = msgpack.Packer(use_bin_type=True)
+		return b"".join(packer.pack(row) for row in data)
+	
+	def format_key(self, header, args):
+		return six.text_type(header).lower().replace(' ', '_')
+	
+	def run(self, data, args):
+		# Grouping would turn this into a single map; ignore it
+		return self.format(self.iter_dicts(data, args), args)
+	
+	def stream(self, data, args, out):
+		if msgpack is None:
+			sys.exit(u"The msgpack output format requires the 'msgpack' package")
+		
+		# This is binary output, so bypass any text encoding on stdout
+		out = getattr(out, 'buffer', out)
+		packer = msgpack.Packer(use_bin_type=True)
+		for row in self.iter_dicts(data, args):
+			out.write(packer.pack(row))
+
+formatter = MessagePackFormatter()
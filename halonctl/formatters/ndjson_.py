@@ -0,0 +1,28 @@
+import six
+import json
+from halonctl.modapi import DictFormatter
+
+class NDJSONFormatter(DictFormatter):
+	'''Newline-delimited JSON; one compact object per row.
+	
+	Rows are written as soon as they're produced, and numbers are left as
+	numbers, so the output can be consumed by other tools as it arrives.'''
+	
+	native = True
+	
+	def format(self, data, args):
+		return u"\n".join(json.dumps(row, sort_keys=True, separators=(',', ':')) for row in data)
+	
+	def format_key(self, header, args):
+		return six.text_type(header).lower().replace(' ', '_')
+	
+	def run(self, data, args):
+		# Grouping would turn this into a single object; ignore it
+		return self.format(self.iter_dicts(data, args), args)
+	
+	def stream(self, data, args, out):
+		for row in self.iter_dicts(data, args):
+			out.write(json.dumps(row, sort_keys=True, separators=(',', ':')))
+			out.write(u"\n")
+
+formatter = NDJSONFormatter()
@@ -1,17 +1,93 @@
-from prettytable import PrettyTable
+import six
+import unicodedata
+from itertools import islice
 from halonctl.modapi import Formatter
 
+# Number of rows used to guess column widths when streaming
+SAMPLE_SIZE = 1000
+
+def _isascii_fallback(s):
+	try:
+		s.encode('ascii')
+		return True
+	except UnicodeError:
+		return False
+
+_isascii = getattr(six.text_type, 'isascii', _isascii_fallback)
+
+def display_width(s):
+	'''Returns the number of terminal columns a string takes up.
+	
+	East Asian wide and fullwidth characters take up two columns, combining
+	and control characters take up none.'''
+	
+	if _isascii(s):
+		return len(s)
+	
+	width = 0
+	for c in s:
+		if unicodedata.combining(c) or unicodedata.category(c) in ('Cc', 'Cf'):
+			continue
+		width += 2 if unicodedata.east_asian_width(c) in ('W', 'F') else 1
+	return width
+
 class TableFormatter(Formatter):
+	padding = 2
+	
 	def format(self, data, args):
-		table = PrettyTable(data[0])
+		measured = [self.measure(row) for row in data]
+		widths = self.get_widths(measured)
+		return u"\n".join(self.format_line(row, row_widths, widths) for row, row_widths in measured)
+	
+	def get_item_converter(self, type_, args):
+		converter = super(TableFormatter, self).get_item_converter(type_, args)
+		
+		# Human-readable values are already text, but raw ones may not be
+		if args.raw and converter is not six.text_type:
+			return lambda item: six.text_type(converter(item))
+		return converter
+	
+	def stream(self, data, args, out):
+		rows = (self.measure(row) for row in self.iter_rows(data, args))
+		
+		# Work out column widths from the first few rows; if there are only a
+		# few rows, this gives exactly the same output as format()
+		sample = list(islice(rows, SAMPLE_SIZE))
+		widths = self.get_widths(sample)
+		
+		for row, row_widths in sample:
+			out.write(self.format_line(row, row_widths, widths))
+			out.write(u"\n")
+		for row, row_widths in rows:
+			out.write(self.format_line(row, row_widths, widths))
+			out.write(u"\n")
+	
+	def measure(self, row):
+		'''Returns a tuple of ``(row, cell_widths)``.'''
+		
+		return (row, [display_width(cell) for cell in row])
+	
+	def get_widths(self, measured):
+		'''Returns the display width of every column.'''
 		
-		table.align = "l"
-		table.border = False
-		table.left_padding_width = 0
-		table.right_padding_width = 2
+		widths = []
+		for row, row_widths in measured:
+			if len(row_widths) > len(widths):
+				widths += [0] * (len(row_widths) - len(widths))
+			for i, w in enumerate(row_widths):
+				if w > widths[i]:
+					widths[i] = w
+		return widths
+	
+	def format_line(self, row, row_widths, widths):
+		'''Formats a row, left-aligning each cell in its column.'''
 		
-		for row in data[1:]:
-			table.add_row(row)
-		return table.get_string()
+		# Cells wider than their column (when streaming) push the rest of the
+		# row to the right, but are always followed by the padding
+		padding = self.padding
+		return u"".join([
+			cell + u" " * (max((widths[i] if i < len(widths) else 0) - row_widths[i], 0) + padding)
+			for i, cell in enumerate(row)
+		])
 
 formatter = TableFormatter()
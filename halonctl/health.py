@@ -0,0 +1,144 @@
+from __future__ import print_function
+import six
+import time
+import json
+import socket
+from threading import Lock
+from concurrent.futures import Future, TimeoutError
+from .config import config
+from .util import executor
+from . import cache
+
+DEFAULT_THRESHOLD = 1
+DEFAULT_COOLDOWN = 300
+DEFAULT_PROBE_TIMEOUT = 1.0
+
+def get_setting(name, default):
+	return config.get('health', {}).get(name, default)
+
+def probe(host, port, timeout):
+	'''Checks if anything is listening on the given host and port.
+	
+	This is a lot cheaper than a SOAP call, and lets us tell a node that's
+	powered off apart from one that's just slow, without waiting out a full
+	read timeout.'''
+	
+	try:
+		socket.create_connection((host, port), timeout).close()
+		return True
+	except (socket.error, socket.timeout):
+		return False
+
+class HealthStore(object):
+	'''Remembers which nodes have recently been unreachable.
+	
+	Outcomes of SOAP calls are recorded by :class:`halonctl.proxies.NodeSoapProxy`,
+	and persisted across invocations in the user's private cache directory. Nodes that have
+	failed ``threshold`` times in a row, within the last ``cooldown`` seconds,
+	are considered "tripped"; calls to them fail fast, unless a quick TCP probe
+	(started in the background by :func:`start_probes`) says they're back.
+	
+	:ivar bool force: Ignore tripped circuits, and always attempt calls
+	'''
+	
+	force = False
+	
+	def __init__(self):
+		self.lock = Lock()
+		self.entries = {}
+		self.probes = {}
+		self.loaded = False
+		self.dirty = False
+	
+	def get_key(self, node):
+		return u"{scheme}://{host}".format(scheme=node.scheme, host=node.host)
+	
+	def get_address(self, node):
+		'''Returns the ``(host, port)`` to probe for a node.'''
+		
+		host, _, port = node.host.partition(':')
+		return (host, int(port) if port else (443 if node.scheme == 'https' else 80))
+	
+	def load(self):
+		'''Loads the health store from the cache.'''
+		
+		data = cache.get_state(u"health.json")
+		try:
+			self.entries = json.loads(data) if data else {}
+		except ValueError:
+			# Someone else was writing to it at the same time; start over
+			self.entries = {}
+		self.loaded = True
+	
+	def save(self):
+		'''Saves the health store to the cache, if anything has changed.'''
+		
+		if not self.loaded or not self.dirty:
+			return
+		
+		with self.lock:
+			data = json.dumps(self.entries)
+		cache.set_state(u"health.json", data)
+	
+	def record_success(self, node):
+		key = self.get_key(node)
+		with self.lock:
+			# Whatever the last probe said is out of date now
+			self.probes.pop(node, None)
+			if key in self.entries:
+				del self.entries[key]
+				self.dirty = True
+	
+	def record_failure(self, node):
+		key = self.get_key(node)
+		with self.lock:
+			self.probes.pop(node, None)
+			entry = self.entries.setdefault(key, { 'failures': 0 })
+			entry['failures'] += 1
+			entry['last_failure'] = time.time()
+			self.dirty = True
+	
+	def is_tripped(self, node):
+		'''Returns True if the node has failed recently.'''
+		
+		entry = self.entries.get(self.get_key(node))
+		if not entry:
+			return False
+		
+		threshold = get_setting('threshold', DEFAULT_THRESHOLD)
+		cooldown = get_setting('cooldown', DEFAULT_COOLDOWN)
+		return entry['failures'] >= threshold and time.time() - entry['last_failure'] < cooldown
+	
+	def start_probes(self, nodes):
+		'''Starts probing any tripped nodes in the background.'''
+		
+		timeout = get_setting('probe_timeout', DEFAULT_PROBE_TIMEOUT)
+		for node in nodes:
+			if self.is_tripped(node) and not node in self.probes:
+				self.probes[node] = executor.submit(probe, *self.get_address(node), timeout=timeout)
+	
+	def allow(self, node):
+		'''Returns True if a call to the node should be attempted.
+		
+		Tripped nodes are let through if their probe succeeds; if it hasn't
+		completed yet, this will wait for it. A probe's result holds until the
+		next call to the node is recorded, after which it's probed again.'''
+		
+		if self.force or not self.is_tripped(node):
+			return True
+		
+		# Nobody started probing this node in advance, so do it right here,
+		# rather than risk waiting on a busy thread pool from inside it
+		timeout = get_setting('probe_timeout', DEFAULT_PROBE_TIMEOUT)
+		future = self.probes.get(node)
+		if future is None:
+			future = Future()
+			future.set_result(probe(*self.get_address(node), timeout=timeout))
+			self.probes[node] = future
+		
+		try:
+			return future.result(timeout + 1)
+		except TimeoutError:
+			return False
+
+health = HealthStore()
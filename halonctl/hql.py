@@ -0,0 +1,139 @@
+from __future__ import print_function
+import six
+import re
+
+hql_token_re = re.compile(r'''
+	\s*(?:
+		(?P<paren>[()])
+		| (?P<condition>
+			(?P<field>[a-zA-Z]+)\s*
+			(?P<op>!=|!~|>=|<=|=|~|>|<)\s*
+			(?P<value>"(?:[^"\\]|\\.)*"|[^\s()]+)
+		)
+		| (?P<keyword>and|or|not)(?=[\s(]|$)
+	)\s*
+''', re.VERBOSE | re.IGNORECASE)
+
+def tokenize_hql(hql):
+	'''Splits a HQL query into tokens.
+	
+	Returns a list of ``(kind, value)`` tuples, where ``kind`` is ``paren``,
+	``keyword`` or ``condition``; conditions' values are ``(field, op, value)``
+	tuples.
+	
+	:raises ValueError: If the query can't be parsed
+	'''
+	
+	tokens = []
+	pos = 0
+	hql = hql.strip()
+	while pos < len(hql):
+		m = hql_token_re.match(hql, pos)
+		if not m or m.end() == pos:
+			raise ValueError(u"Can't parse query at: {0}".format(hql[pos:]))
+		pos = m.end()
+		
+		if m.group('paren'):
+			tokens.append(('paren', m.group('paren')))
+		elif m.group('keyword'):
+			tokens.append(('keyword', m.group('keyword').lower()))
+		else:
+			value = m.group('value')
+			if value.startswith('"'):
+				value = re.sub(r'\\(.)', r'\1', value[1:-1])
+			tokens.append(('condition', (m.group('field').lower(), m.group('op'), value)))
+	return tokens
+
+def get_time_bounds(hql):
+	'''Returns the time range a HQL query is limited to.
+	
+	Returns a tuple of ``(after, before)`` UNIX timestamps, from conditions
+	such as ``time>X`` and ``time<Y``; either is None if the query doesn't
+	limit it. Conditions are assumed to be ANDed together.
+	
+	:raises ValueError: If the query can't be parsed
+	'''
+	
+	after = None
+	before = None
+	for kind, value in tokenize_hql(hql):
+		if kind != 'condition' or value[0] != 'time':
+			continue
+		
+		field, op, ts = value
+		try:
+			ts = int(ts)
+		except ValueError:
+			raise ValueError(u"Not a timestamp: {0}".format(ts))
+		
+		if op in ('>', '>='):
+			ts = ts - 1 if op == '>=' else ts
+			after = ts if after is None else max(after, ts)
+		elif op in ('<', '<='):
+			ts = ts + 1 if op == '<=' else ts
+			before = ts if before is None else min(before, ts)
+	
+	return (after, before)
+
+def split_time_range(after, before, n):
+	'''Splits a query's time range into ``n`` slices, as HQL conditions.
+	
+	The first and last slices are open-ended, so that together, the slices
+	match exactly the same messages as the unsliced query, even if it isn't
+	really limited to ``(after, before)``.'''
+	
+	n = max(1, min(n, before - after - 1))
+	step = float(before - after - 1) / n
+	bounds = [after + int(round(step * i)) for i in range(1, n)]
+	
+	edges = [None] + bounds + [None]
+	slices = []
+	for lower, upper in zip(edges, edges[1:]):
+		conditions = []
+		if lower is not None:
+			conditions.append(u"time>{0}".format(lower))
+		if upper is not None:
+			conditions.append(u"time<{0}".format(upper + 1))
+		slices.append(u" ".join(conditions))
+	return slices
+
+# HQL conditions matching a value of a field (as in halonctl.fields), for
+# the fields that can be matched exactly, as ``(field, op, pattern)``;
+# patterns for ``~`` are matched with ``%`` and ``_`` as wildcards
+facet_conditions = {
+	'action': (u"action", u"=", u"{0}"),
+	'from': (u"from", u"=", u"{0}"),
+	'fromdomain': (u"from", u"~", u"%@{0}"),
+	'helo': (u"helo", u"=", u"{0}"),
+	'ip': (u"ip", u"=", u"{0}"),
+	'sasl': (u"sasl", u"=", u"{0}"),
+	'server': (u"server", u"=", u"{0}"),
+	'to': (u"to", u"=", u"{0}"),
+	'todomain': (u"to", u"~", u"%@{0}"),
+	'transport': (u"transport", u"=", u"{0}"),
+}
+
+def quote_value(value):
+	'''Quotes a value for use in a HQL condition, if it needs to be.'''
+	
+	value = six.text_type(value)
+	if value and not re.search(r'[\s()"\\]', value):
+		return value
+	return u'"{0}"'.format(re.sub(r'(["\\])', r'\\\1', value))
+
+def escape_pattern(value):
+	'''Escapes the wildcards in a value, so that it's matched literally as
+	part of a ``~`` pattern.'''
+	
+	return re.sub(r'([%_\\])', r'\\\1', six.text_type(value))
+
+def facet_condition(field, value):
+	'''Returns a HQL condition matching messages where a field has a value.
+	
+	:raises KeyError: If the field can't be matched; see :data:`facet_conditions`
+	'''
+	
+	name, op, pattern = facet_conditions[field]
+	if op == u"~":
+		value = escape_pattern(value)
+	return u"{0}{1}{2}".format(name, op, quote_value(pattern.format(value)))
@@ -1,6 +1,8 @@
 from __future__ import print_function
 import six
-from halonctl.util import textualize, group_by
+import sys
+from halonctl.util import textualize, get_converter, group_by
+from halonctl.sorting import external_sort, top_n, sort_key
 
 class Module(object):
 	'''Base class for all modules.
@@ -84,20 +86,54 @@ class Module(object):
 		
 		if self.submodules:
 			return getattr(args, type(self).__name__ + '_mod').run(nodes, args)
+	
+	def is_offline(self, args):
+		'''
+		Returns True if the module won't talk to any nodes with the given
+		arguments, such as when it's working with local files.
+		
+		halonctl then skips anything it would otherwise do to prepare the nodes,
+		such as downloading their WSDL. The default implementation returns
+		False, or asks the selected subcommand.
+		'''
+		
+		if self.submodules:
+			return getattr(args, type(self).__name__ + '_mod').is_offline(args)
+		return False
 
 class Formatter(object):
-	'''Base class for all formatters.'''
+	'''Base class for all formatters.
+	
+	:ivar bool native: Leave numbers, booleans and None as they are, rather than making them text; for machine-readable formats
+	'''
+	
+	native = False
 	
 	def run(self, data, args):
 		'''
-		Calls :func:`format` with data prepared by :func:`format_item`.
+		Calls :func:`format` with data prepared by :func:`iter_rows`.
 		
 		Override if you'd like to customize the entire formatting process, such
 		as if you'd prefer to work with another data structure than a
 		two-dimensional list.
 		'''
 		
-		return self.format([[self.format_item(item, args) for item in row] for row in data], args)
+		return self.format(list(self.iter_rows(data, args)), args)
+	
+	def stream(self, data, args, out):
+		'''
+		Formats data, and writes it to the file-like object ``out``.
+		
+		This is what halonctl itself calls. The default implementation simply
+		writes the result of :func:`run`, which means the whole result has to
+		be held in memory first; formatters that can write their output one
+		row at a time should override it, and write each row as it arrives,
+		so that large results can be output with constant memory usage.
+		
+		``data`` may be any iterable, including a generator.
+		'''
+		
+		print(self.run(list(data), args), file=out)
 	
 	def format(self, data, args):
 		'''
@@ -111,14 +147,137 @@ class Formatter(object):
 		
 		raise NotImplementedError()
 	
+	def iter_rows(self, data, args):
+		'''
+		Lazily converts rows into their output-friendly form.
+		
+		The first row is taken to be the header, and is converted with
+		:func:`format_item`; the rest are converted with :func:`make_row_converter`.
+		'''
+		
+		rows = iter(data)
+		header = next(rows, None)
+		if header is None:
+			return
+		
+		# Look up the sort column before outputting anything
+		convert = self.make_row_converter(args)
+		rows = self.sort_rows(header, rows, convert, args)
+		
+		yield [self.format_item(item, args) for item in header]
+		for row in rows:
+			yield row
+	
+	def sort_rows(self, header, rows, convert, args):
+		'''
+		Returns an iterator over rows converted with ``convert``, sorted as
+		asked for by ``--sort-by``, ``--top`` and ``--desc``, if at all.
+		
+		The sort column is looked up right away, rather than when iterating,
+		so an unknown column exits before any output is written.
+		'''
+		
+		sort_by = getattr(args, 'sort_by', None)
+		top = getattr(args, 'top', None)
+		if not sort_by and not top:
+			return (convert(row) for row in rows)
+		
+		column = self.find_column(header, sort_by, args) if sort_by else 0
+		
+		# Sort by the raw value rather than the formatted one, or sizes and
+		# durations would be sorted alphabetically
+		def get_key(item):
+			return sort_key(get_converter(type(item), True, True)(item))
+		
+		pairs = ((get_key(row[column]), convert(row)) for row in rows)
+		reverse = getattr(args, 'reverse', False)
+		if top:
+			pairs = top_n(pairs, lambda pair: pair[0], top, reverse)
+		else:
+			pairs = external_sort(pairs, lambda pair: pair[0], reverse)
+		
+		return (row for _, row in pairs)
+	
+	def find_column(self, header, name, args):
+		'''Returns the index of a column by name, or exits if there's none.
+		
+		Names are case-insensitive, and underscores match spaces.'''
+		
+		wanted = name.lower().replace('_', ' ')
+		for i, item in enumerate(header):
+			if textualize(item).lower().replace('_', ' ') == wanted:
+				return i
+		
+		sys.exit(u"Can't sort by '{0}', there's no such column! Available: {1}".format(
+			name, u", ".join(textualize(item) for item in header)))
+	
+	def make_row_converter(self, args):
+		'''
+		Returns a function that converts a whole row.
+		
+		A converter is looked up once per column, from :func:`get_item_converter`,
+		based on the type of the first value in it that isn't None. Values of
+		any other type (such as None) are looked up as they come, so mixed
+		columns still come out right, but the common case costs a single
+		function call per value.
+		'''
+		
+		# Subclasses that predate converters may have overridden format_item
+		if type(self).format_item != Formatter.format_item:
+			return lambda row: [self.format_item(item, args) for item in row]
+		
+		types = []
+		funcs = []
+		resolved = {}
+		
+		def get(type_):
+			try:
+				return resolved[type_]
+			except KeyError:
+				func = resolved[type_] = self.get_item_converter(type_, args)
+				return func
+		
+		def convert(row):
+			if len(row) > len(types):
+				types.extend([None] * (len(row) - len(types)))
+				funcs.extend([None] * (len(row) - len(funcs)))
+			
+			result = []
+			for i, item in enumerate(row):
+				type_ = type(item)
+				if type_ is types[i]:
+					result.append(funcs[i](item))
+					continue
+				
+				func = get(type_)
+				if types[i] is None and item is not None:
+					types[i] = type_
+					funcs[i] = func
+				result.append(func(item))
+			return result
+		
+		return convert
+	
+	def get_item_converter(self, type_, args):
+		'''
+		Returns a function converting values of a type into an output-friendly
+		form.
+		
+		The default implementation looks it up with
+		:func:`halonctl.util.get_converter`.
+		'''
+		
+		return get_converter(type_, args.raw, self.native)
+	
 	def format_item(self, item, args):
 		'''
 		Takes an emitted item, and returns a more output-friendly form.
 		
-		The default implementation just calls :func:`halonctl.util.textualize`.
+		This is only used for headers, unless a subclass overrides it. The
+		default implementation just calls :func:`halonctl.util.textualize`.
 		'''
 		
-		return textualize(item, args.raw)
+		return textualize(item, args.raw, self.native)
 
 class DictFormatter(Formatter):
 	'''
@@ -130,12 +289,28 @@ class DictFormatter(Formatter):
 	'''
 	
 	def run(self, data, args):
-		keys = [self.format_key(header, args) for header in data[0]]
-		data2 = [{ keys[i]: self.format_item(item, args) for i, item in enumerate(row) } for row in data[1:]]
+		data2 = list(self.iter_dicts(data, args))
 		if args.group_by:
 			data2 = group_by(data2, args.group_by, args.group_key)
 		return self.format(data2, args)
 	
+	def iter_dicts(self, data, args):
+		'''
+		Lazily converts rows into dicts, keyed by :func:`format_key`.
+		
+		The first row is taken to be the header. Rows are sorted the same way
+		as by :func:`Formatter.iter_rows`.
+		'''
+		
+		rows = iter(data)
+		header = next(rows, None)
+		if header is None:
+			return
+		
+		keys = [self.format_key(item, args) for item in header]
+		for row in self.sort_rows(header, rows, self.make_row_converter(args), args):
+			yield dict(zip(keys, row))
+	
 	def format_key(self, header, args):
 		'''
 		Takes a header, and returns the key it should map to in the dictionary.
@@ -4,10 +4,11 @@ import socket
 import keyring
 import requests
 from threading import Lock
+from operator import attrgetter
 from suds.client import Client
 from suds.transport.http import HttpAuthenticated
 from .proxies import *
-from .util import async_dispatch, nodesort, to_base64, from_base64
+from .util import async_dispatch, nodesort, to_base64, from_base64, register_converter
 from . import cache
 
 
@@ -219,7 +220,7 @@ class NodeList(list):
 	def command(self, command, *args):
 		'''Executes a command across all contained nodes.'''
 		
-		return nodesort(async_dispatch({ node: (node.command, (command,) + args) for node in self }))
+		return nodesort(async_dispatch({ node: (node.command, (command,) + args) for node in self }, default=(0, None)))
 	
 	
 	
@@ -234,3 +235,6 @@ class NodeList(list):
 	
 	def __str__(self):
 		return u"{name} -> [{nodes}]".format(name=self.name, nodes=', '.join([node.name for node in self]))
+
+register_converter(Node, attrgetter('name'))
+register_converter(NodeList, attrgetter('name'))
@@ -0,0 +1,132 @@
+from __future__ import print_function
+import six
+from operator import itemgetter
+from halonctl.modapi import Module
+from halonctl.columnar import Reader
+from halonctl.fields import domain
+from halonctl.sorting import external_sort, merge_join, sort_key
+
+def get(row, columns, name):
+	return row[columns[name]] if name in columns else None
+
+class DiffModule(Module):
+	'''Compares two queue exports'''
+	
+	def register_arguments(self, parser):
+		parser.add_argument('before', metavar='BEFORE',
+			help=u"the earlier export, from \"query --export\"")
+		parser.add_argument('after', metavar='AFTER',
+			help=u"the later export")
+		parser.add_argument('-b', '--by', choices=['domain', 'node'], default='domain',
+			help=u"summarize changes per recipient domain or node (default: domain)")
+		parser.add_argument('-l', '--list', action='store_true',
+			help=u"list every added, removed and retried email, rather than a summary")
+	
+	def is_offline(self, args):
+		return True
+	
+	def open(self, path):
+		'''Opens an export, returning a ``(reader, columns)`` tuple, where
+		``columns`` maps column names to their index.'''
+		
+		f = open(path, 'rb')
+		try:
+			reader = Reader(f)
+			columns = { name: i for i, name in enumerate(reader.columns) }
+			for required in ('node', 'queueid', 'to'):
+				if not required in columns:
+					raise ValueError(u"{0} is missing the '{1}' field".format(path, required))
+			if 'historyid' in columns:
+				raise ValueError(u"{0} is a history export, only queue exports can be compared".format(path))
+		except ValueError:
+			f.close()
+			raise
+		return (reader, columns)
+	
+	def iter_sorted(self, reader, columns):
+		'''Yields ``(key, row)`` for every email in an export, sorted by key.
+		
+		Raises ValueError if a queue ID appears twice on the same node, which
+		:func:`halonctl.sorting.merge_join` can't handle.'''
+		
+		node, queueid = columns['node'], columns['queueid']
+		keyed = (((sort_key(row[node]), sort_key(row[queueid])), row) for row in reader)
+		last = None
+		for item in external_sort(keyed, key=itemgetter(0)):
+			if item[0] == last:
+				raise ValueError(u"queue ID {0} appears more than once on {1}".format(item[1][queueid], item[1][node]))
+			last = item[0]
+			yield item
+	
+	def iter_changes(self, before, before_columns, after, after_columns):
+		'''Walks both exports in ``(node, queueid)`` order, yielding
+		``(change, row, columns)`` for every email in either.'''
+		
+		joined = merge_join(self.iter_sorted(before, before_columns), self.iter_sorted(after, after_columns), itemgetter(0))
+		for old, new in joined:
+			if new is None:
+				yield (u"removed", old[1], before_columns)
+			elif old is None:
+				yield (u"added", new[1], after_columns)
+			elif (get(new[1], after_columns, 'retry') or 0) > (get(old[1], before_columns, 'retry') or 0):
+				yield (u"retried", new[1], after_columns)
+			else:
+				yield (u"unchanged", new[1], after_columns)
+	
+	def run(self, nodes, args):
+		try:
+			before, before_columns = self.open(args.before)
+		except (IOError, ValueError) as e:
+			print(u"Can't read export: {0}".format(e))
+			self.exitcode = 1
+			return
+		
+		with before:
+			try:
+				after, after_columns = self.open(args.after)
+			except (IOError, ValueError) as e:
+				print(u"Can't read export: {0}".format(e))
+				self.exitcode = 1
+				return
+			
+			with after:
+				try:
+					changes = self.iter_changes(before, before_columns, after, after_columns)
+					for row in (self.list_changes(changes) if args.list else self.summarize(changes, args.by)):
+						yield row
+				except ValueError as e:
+					print(u"Can't compare exports: {0}".format(e))
+					self.exitcode = 1
+	
+	def list_changes(self, changes):
+		yield (u"Change", u"Node", u"Queue ID", u"From", u"To", u"Retries")
+		for change, row, columns in changes:
+			if change != u"unchanged":
+				yield (change, get(row, columns, 'node'), get(row, columns, 'queueid'),
+					get(row, columns, 'from'), get(row, columns, 'to'), get(row, columns, 'retry'))
+	
+	def summarize(self, changes, by):
+		# Before, After, Added, Removed, Retried
+		totals = {}
+		for change, row, columns in changes:
+			key = domain(get(row, columns, 'to')) if by == 'domain' else get(row, columns, 'node')
+			counts = totals.get(key)
+			if counts is None:
+				counts = totals[key] = [0, 0, 0, 0, 0]
+			
+			if change != u"added":
+				counts[0] += 1
+			if change != u"removed":
+				counts[1] += 1
+			if change == u"added":
+				counts[2] += 1
+			elif change == u"removed":
+				counts[3] += 1
+			elif change == u"retried":
+				counts[4] += 1
+		
+		yield (by.capitalize(), u"Before", u"After", u"Added", u"Removed", u"Retried")
+		for key, counts in sorted(six.iteritems(totals), key=lambda item: (-item[1][1], sort_key(item[0]))):
+			yield [key] + counts
+
+module = DiffModule()
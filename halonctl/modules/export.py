@@ -0,0 +1,212 @@
+from __future__ import print_function
+import six
+import sys
+import time
+from threading import Lock, Thread
+from six.moves import BaseHTTPServer, socketserver
+from halonctl.modapi import Module
+from halonctl.util import executor
+
+def escape_label(value):
+	'''Escapes a label value for the Prometheus text format.'''
+	return six.text_type(value).replace(u'\\', u'\\\\').replace(u'"', u'\\"').replace(u'\n', u'\\n')
+
+def format_labels(labels):
+	return u",".join(u"{0}=\"{1}\"".format(k, escape_label(v)) for k, v in labels)
+
+class MetricsCache(object):
+	'''Holds the latest poll results for every node.
+	
+	Each node/query pair is polled independently, and replaces its own slice
+	of the cache when it completes; scrapes only ever render what's in here,
+	so a slow or dead node will never hold up a scrape.
+	'''
+	
+	families = [
+		('halon_up', u"Whether the node answered the last uptime poll"),
+		('halon_uptime_seconds', u"Node uptime, in seconds"),
+		('halon_statd', u"Value of a statd counter"),
+		('halon_stat_count', u"Value of a stat() counter"),
+		('halon_last_poll_timestamp_seconds', u"When a node was last successfully polled"),
+	]
+	
+	def __init__(self):
+		self.lock = Lock()
+		self.samples = {}
+	
+	def update(self, key, samples):
+		'''Replaces the samples for a given (node, query) key.'''
+		
+		with self.lock:
+			self.samples[key] = samples
+	
+	def mark_down(self, node, base_labels):
+		'''Replaces all of a node's samples with ``halon_up 0``; values that
+		can't be refreshed shouldn't be served as if they were current.'''
+		
+		with self.lock:
+			for key in [key for key in self.samples if key[0] == node]:
+				del self.samples[key]
+			self.samples[(node, ('uptime', None))] = [('halon_up', base_labels, 0)]
+	
+	def render(self):
+		'''Renders all cached samples in the Prometheus text format.'''
+		
+		with self.lock:
+			all_samples = list(six.itervalues(self.samples))
+		
+		by_family = {}
+		for samples in all_samples:
+			for name, labels, value in samples:
+				by_family.setdefault(name, []).append((labels, value))
+		
+		lines = []
+		for name, help_ in self.families:
+			if not name in by_family:
+				continue
+			lines.append(u"# HELP {0} {1}".format(name, help_))
+			lines.append(u"# TYPE {0} gauge".format(name))
+			for labels, value in by_family[name]:
+				lines.append(u"{0}{{{1}}} {2}".format(name, format_labels(labels), value))
+		
+		return u"\n".join(lines) + u"\n"
+
+class Poller(Thread):
+	'''Background thread that periodically polls all nodes.'''
+	
+	def __init__(self, nodes, args, cache):
+		super(Poller, self).__init__()
+		self.daemon = True
+		self.nodes = nodes
+		self.args = args
+		self.cache = cache
+		self.in_flight = {}
+	
+	def get_queries(self):
+		queries = [('uptime', None)]
+		queries += [('statd', counter) for counter in self.args.counters]
+		queries += [('stat', tuple(keys)) for keys in self.args.stats]
+		return queries
+	
+	def run(self):
+		queries = self.get_queries()
+		while True:
+			started = time.time()
+			
+			# Don't pile up requests to nodes that haven't answered the last
+			# round yet, just keep serving the old values for them
+			for node in self.nodes:
+				for query in queries:
+					key = (node, query)
+					future = self.in_flight.get(key)
+					if future is not None and not future.done():
+						continue
+					self.in_flight[key] = executor.submit(self.poll, node, query)
+			
+			time.sleep(max(self.args.interval - (time.time() - started), 0))
+	
+	def poll(self, node, query):
+		kind, arg = query
+		base_labels = [('cluster', node.cluster.name or u""), ('node', node.name)]
+		
+		try:
+			samples = getattr(self, 'poll_' + kind)(node, arg, base_labels)
+		except Exception as e:
+			print(u"Polling {0} on {1} failed: {2}".format(kind, node, e), file=sys.stderr)
+			samples = None
+		
+		# If the node is down, nothing it's reported is current anymore; but
+		# otherwise, leave old samples in place, since a counter dropping out
+		# for a round is worse than it being stale
+		if kind == 'uptime' and samples is None:
+			self.cache.mark_down(node, base_labels)
+		elif samples is not None:
+			self.cache.update((node, query), samples)
+	
+	def poll_uptime(self, node, arg, base_labels):
+		code, result = node.service.getUptime()
+		if code != 200:
+			return None
+		
+		return [
+			('halon_up', base_labels, 1),
+			('halon_uptime_seconds', base_labels, result),
+			('halon_last_poll_timestamp_seconds', base_labels, int(time.time())),
+		]
+	
+	def poll_statd(self, node, counter, base_labels):
+		code, cmd = node.command('statd', '-g', counter)
+		if code != 200:
+			return None
+		
+		samples = []
+		for line in [line.strip() for line in cmd.all().split('\n')]:
+			if not line:
+				continue
+			key, count = line.split('=', 2)
+			samples.append(('halon_statd', base_labels + [('counter', counter), ('key', key)], count))
+		return samples
+	
+	def poll_stat(self, node, keys, base_labels):
+		subs = { '.': None, '-': '' }
+		code, result = node.service.statList(*[k if k not in subs else subs[k] for k in keys], limit=10000)
+		if code != 200:
+			return None
+		
+		samples = []
+		for res in getattr(result, 'item', []):
+			labels = base_labels + [('key1', res.key1 or u""), ('key2', res.key2 or u""), ('key3', res.key3 or u"")]
+			samples.append(('halon_stat_count', labels, res.count))
+		return samples
+
+class MetricsServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+	daemon_threads = True
+
+class MetricsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+	cache = None
+	
+	def do_GET(self):
+		if self.path.split('?', 1)[0] != '/metrics':
+			self.send_error(404)
+			return
+		
+		body = self.cache.render().encode('utf-8')
+		self.send_response(200)
+		self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+	
+	def log_message(self, format, *args):
+		# Scrapes happen every few seconds, don't spam the console
+		pass
+
+class ExportModule(Module):
+	'''Serves node metrics to Prometheus'''
+	
+	def register_arguments(self, parser):
+		parser.add_argument('-l', '--listen', default='127.0.0.1', metavar='ADDR',
+			help=u"address to listen on (default: 127.0.0.1)")
+		parser.add_argument('-p', '--port', type=int, default=9411,
+			help=u"port to listen on (default: 9411)")
+		parser.add_argument('-i', '--interval', type=float, default=15,
+			help=u"seconds between polls of each node (default: 15)")
+		parser.add_argument('-s', '--statd', dest='counters', action='append', default=[], metavar='COUNTER',
+			help=u"export a statd counter, may be repeated")
+		parser.add_argument('-k', '--stat', dest='stats', action='append', default=[], nargs=3, metavar='KEY',
+			help=u"export stat() counters matching three keys, may be repeated")
+	
+	def run(self, nodes, args):
+		cache = MetricsCache()
+		Poller(nodes, args, cache).start()
+		
+		handler = type('BoundMetricsHandler', (MetricsHandler,), { 'cache': cache })
+		server = MetricsServer((args.listen, args.port), handler)
+		try:
+			server.serve_forever()
+		except KeyboardInterrupt:
+			pass
+		finally:
+			server.server_close()
+
+module = ExportModule()
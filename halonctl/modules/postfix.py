@@ -1,7 +1,17 @@
 import six
 import argparse
 from time import time
+from datetime import timedelta
 from halonctl.modapi import Module
+from halonctl.util import async_dispatch, iter_pages
+from halonctl.fields import attr, compile_field
+from halonctl.sketches import HyperLogLog, KLL
+
+# Number of messages to fetch from a node per call
+PAGE_SIZE = 5000
+
+# Age buckets, as the upper limit of each in minutes
+buckets = [10, 60, 120, 1440, None]
 
 class PostfixQshapeModule(Module):
 	'''Simulate postfix's qshape command'''
@@ -9,61 +19,126 @@ class PostfixQshapeModule(Module):
 	def register_arguments(self, parser):
 		parser.add_argument('-s', '--sender', action='store_true',
 			help=u"use sender instead of recipient")
+		parser.add_argument('-u', '--unique', action='store_true',
+			help=u"estimate the number of distinct addresses, rather than counting emails")
 	
 	def run(self, nodes, args):
-		stats = {}
 		t = time()
-		limit = 5000
-		offset = 0
-		field = 'msgfrom' if args.sender else 'msgto'
-		while True:
-			askMore = False
-			for node, (code, result) in six.iteritems(nodes.service.mailQueue(filter='action=DELIVER', offset=offset, limit=limit, options=None)):
-				if code != 200:
-					self.partial = True
-				elif 'item' in result['result']:
-					if len(result['result']['item']) == limit:
-						askMore = True
-					for msg in result['result']['item']:
-						minutes = int(t - getattr(msg, 'msgts0', None)) / 60
-						domain = getattr(msg, field, None)
-						domain = domain.split('@')[1] if domain else '<MAILER-DAEMON>'
-						email = getattr(msg, field, None);
-						if domain not in stats:
-							stats[domain] = {
-									'10': [],
-									'60': [],
-									'120': [],
-									'1440': [],
-									'1440+': []
-								}
-						if minutes < 10:
-							stats[domain]['10'].append(email)
-						elif minutes < 60:
-							stats[domain]['60'].append(email)
-						elif minutes < 120:
-							stats[domain]['120'].append(email)
-						elif minutes < 1440:
-							stats[domain]['1440'].append(email)
-						else:
-							stats[domain]['1440+'].append(email)
-			if not askMore:
-				break
-			offset = offset + limit
-
+		get_address = compile_field('from' if args.sender else 'to')
+		get_timestamp = attr('msgts0')
+		
+		def new_row():
+			if args.unique:
+				return [HyperLogLog() for b in buckets]
+			return [0] * len(buckets)
+		
+		# Every node is counted in parallel, then the counts are merged
+		def count(node):
+			stats = {}
+			code = 0
+			for code, items in iter_pages(node, 'mailQueue', 'action=DELIVER', PAGE_SIZE):
+				for msg in items:
+					minutes = (t - get_timestamp(node, msg)) / 60
+					email = get_address(node, msg)
+					domain = email.split('@')[1] if email else '<MAILER-DAEMON>'
+					
+					row = stats.get(domain)
+					if row is None:
+						row = stats[domain] = new_row()
+					
+					i = 0
+					while buckets[i] is not None and minutes >= buckets[i]:
+						i += 1
+					if args.unique:
+						row[i].add(email)
+					else:
+						row[i] += 1
+			return (code, stats)
+		
+		stats = {}
+		for node, (code, node_stats) in six.iteritems(async_dispatch({ node: (count, [node]) for node in nodes }, default=(0, None))):
+			if code != 200:
+				self.partial = True
+			for domain, row in six.iteritems(node_stats or {}):
+				if not domain in stats:
+					stats[domain] = row
+				elif args.unique:
+					stats[domain] = [a.merge(b) for a, b in zip(stats[domain], row)]
+				else:
+					stats[domain] = [a + b for a, b in zip(stats[domain], row)]
+		
+		if args.unique:
+			# Addresses can be in more than one bucket, so count the total too
+			rows = []
+			for domain, row in six.iteritems(stats):
+				total = row[0]
+				for hll in row[1:]:
+					total = total.merge(hll)
+				rows.append((domain, total.count(), [hll.count() for hll in row]))
+		else:
+			rows = [(domain, sum(row), row) for domain, row in six.iteritems(stats)]
+		
 		yield ['Domain', 'Total', '10', '60', '120', '1440', '1440+']
-		def total_compare(d1, d2):
-			return sum([len(y) for x, y in d2.iteritems()]) - sum([len(y) for x, y in d1.iteritems()])
-		for domain in sorted(stats, key=stats.get, cmp=total_compare):
-			data = stats[domain]
-			total = sum([len(y) for x, y in data.iteritems()])
-			yield [domain, total, len(data['10']), len(data['60']), len(data['120']), len(data['1440']), len(data['1440+'])]
+		for domain, total, row in sorted(rows, key=lambda r: r[1], reverse=True):
+			yield [domain, total] + row
+
+class PostfixQstatsModule(Module):
+	'''Show percentiles of queued messages' age and size'''
+	
+	def register_arguments(self, parser):
+		parser.add_argument('-b', '--by', choices=['domain', 'node'], default='domain',
+			help=u"show percentiles per domain or node (default: domain)")
+		parser.add_argument('-s', '--sender', action='store_true',
+			help=u"use sender instead of recipient domain")
+	
+	def run(self, nodes, args):
+		t = time()
+		get_domain = compile_field('fromdomain' if args.sender else 'todomain')
+		get_timestamp = attr('msgts0')
+		get_size = attr('msgsize') # Added in 3.3
+		
+		def new_row():
+			return [KLL(), KLL()]
+		
+		# Every node is summarized in parallel, then the sketches are merged
+		def count(node):
+			stats = {}
+			code = 0
+			for code, items in iter_pages(node, 'mailQueue', 'action=DELIVER', PAGE_SIZE):
+				for msg in items:
+					key = node if args.by == 'node' else (get_domain(node, msg) or '<MAILER-DAEMON>')
+					row = stats.get(key)
+					if row is None:
+						row = stats[key] = new_row()
+					
+					row[0].add(max(t - get_timestamp(node, msg), 0))
+					size = get_size(node, msg)
+					if size is not None:
+						row[1].add(size)
+			return (code, stats)
+		
+		stats = {}
+		for node, (code, node_stats) in six.iteritems(async_dispatch({ node: (count, [node]) for node in nodes }, default=(0, None))):
+			if code != 200:
+				self.partial = True
+			for key, row in six.iteritems(node_stats or {}):
+				stats[key] = [a.merge(b) for a, b in zip(stats[key], row)] if key in stats else row
+		
+		yield [args.by.capitalize(), 'Messages', 'Age p50', 'Age p90', 'Age p99', 'Age max',
+			'Size p50', 'Size p90', 'Size p99', 'Size max']
+		
+		quantiles = [0.5, 0.9, 0.99, 1]
+		for key, (ages, sizes) in sorted(six.iteritems(stats), key=lambda item: item[1][0].count, reverse=True):
+			yield [key, ages.count] + \
+				[timedelta(seconds=int(age)) for age in ages.quantiles(quantiles)] + \
+				sizes.quantiles(quantiles)
 
 class PostfixModule(Module):
 	'''Simulate postfix commands'''
 	
 	submodules = {
-		'qshape': PostfixQshapeModule()
+		'qshape': PostfixQshapeModule(),
+		'qstats': PostfixQstatsModule(),
 	}
 
 module = PostfixModule()
@@ -1,9 +1,23 @@
 from __future__ import print_function
 import six
+import os
+import sys
+import sqlite3
 import argparse
+from itertools import islice
+from collections import Counter
 from halonctl.modapi import Module
-from halonctl.util import hql_from_filters, filter_timestamp_re, ask_confirm, from_base64
-from halonctl.roles import UTCDate
+from halonctl.util import hql_from_filters, filter_timestamp_re, ask_confirm, async_dispatch, iter_dispatch_grouped, read_queue_ids, nodesort, iter_pages, iter_all_pages
+from halonctl.hql import get_time_bounds, split_time_range, facet_conditions, facet_condition
+from halonctl.fields import get_supported_fields, compile_fields, compile_field
+from halonctl.roles import Role, UTCDate
+from halonctl.sketches import HyperLogLog
+from halonctl.snapshot import Snapshot, columns as snapshot_columns
+from halonctl.columnar import Writer, Reader
+
+# Number of messages to fetch from a node per call, when paging through all
+# matching messages
+PAGE_SIZE = 1000
 
 class QueryModule(Module):
 	'''Queries emails and performs actions'''
@@ -23,6 +37,26 @@ class QueryModule(Module):
 			help=u"print selected fields")
 		parser.add_argument('-y', '--yes', action='store_true',
 			help=u"don't ask to perform wildcard actions")
+		parser.add_argument('-s', '--snapshot', metavar='FILE',
+			help=u"query a local history snapshot instead of the nodes")
+		parser.add_argument('--slices', type=int, metavar='N',
+			help=u"split the query's time range into N slices, and run them in parallel")
+		parser.add_argument('--slice-concurrency', type=int, metavar='N', default=4,
+			help=u"run at most N slices at a time on each node (default: 4)")
+		parser.add_argument('--distinct', metavar='FIELD',
+			help=u"estimate the number of distinct values of a field, instead of showing emails")
+		parser.add_argument('--per', metavar='FIELD',
+			help=u"with --distinct, estimate it for each value of another field")
+		parser.add_argument('--count-by', metavar='FIELD',
+			help=u"count matching emails per value of a field and node, without fetching them")
+		parser.add_argument('--values', metavar='x,y',
+			help=u"with --count-by, the values to count (default: the most common ones in a sample)")
+		parser.add_argument('--facets', type=int, metavar='N', default=10,
+			help=u"with --count-by and no --values, count the N most common values (default: 10)")
+		parser.add_argument('--export', metavar='FILE',
+			help=u"write all matching emails to a compact columnar file, instead of showing them")
+		parser.add_argument('--read', metavar='FILE',
+			help=u"show emails from a file written by --export, instead of querying the nodes")
 		
 		tzgroup = parser.add_mutually_exclusive_group()
 		tzgroup.add_argument('-u', '--utc', dest='timezone', action='store_const', const=0,
@@ -38,11 +72,21 @@ class QueryModule(Module):
 		actiongroup.add_argument('--deliver-duplicate', dest='action', action='store_const', const='deliver-duplicate',
 			help=u"attempt to deliver a copy of the matching emails")
 		
+		parser.add_argument('--ids-from', metavar='FILE',
+			help=u"with an action, act on the queue IDs listed in FILE ('-' for stdin), one per line, optionally after a node name")
+		parser.add_argument('--chunk-size', type=int, metavar='N', default=500,
+			help=u"with --ids-from, act on N emails per call (default: 500)")
+		parser.add_argument('--chunk-concurrency', type=int, metavar='N', default=4,
+			help=u"with --ids-from, make at most N calls at a time to each node (default: 4)")
+		
 		parser.add_argument('filter', nargs=argparse.REMAINDER, metavar="...",
 			help=u"HQL query matching all targeted emails; use 'id=X' to target a single one")
 		
 		parser.epilog = u"\"{YYYY-mm-dd HH:mm:ss}\" can be used to insert timestamps into queries. For safety reasons, if this is used, you must use --utc or --timezone to mark what timezone the timestamp is in."
 	
+	def is_offline(self, args):
+		return bool(args.snapshot or args.read)
+	
 	def run(self, nodes, args):
 		# Prevent accidents caused by calls such as "--delete --limit ..."
 		if args.action and (args.offset or args.limit or args.count):
@@ -55,33 +99,89 @@ class QueryModule(Module):
 			self.exitcode = 1
 			return
 		
+		if args.action and args.snapshot:
+			print(u"--snapshot cannot be used together with actions!")
+			self.exitcode = 1
+			return
+		
 		if args.action and args.fields:
 			print(u"--fields cannot be used together with actions!")
 			self.exitcode = 1
 			return
+		
+		if args.slices and (args.action or args.snapshot):
+			print(u"--slices cannot be used together with actions or --snapshot!")
+			self.exitcode = 1
+			return
+		
+		if args.distinct and (args.action or args.snapshot or args.slices or args.fields or args.offset or args.limit or args.count):
+			print(u"--distinct cannot be used together with actions, --snapshot, --slices, --fields, --offset, --limit or --count!")
+			self.exitcode = 1
+			return
+		
+		if args.per and not args.distinct:
+			print(u"--per can only be used together with --distinct!")
+			self.exitcode = 1
+			return
+		
+		if args.count_by and (args.action or args.snapshot or args.slices or args.distinct or args.fields or args.offset or args.limit or args.count):
+			print(u"--count-by cannot be used together with actions, --snapshot, --slices, --distinct, --fields, --offset, --limit or --count!")
+			self.exitcode = 1
+			return
+		
+		if args.values and not args.count_by:
+			print(u"--values can only be used together with --count-by!")
+			self.exitcode = 1
+			return
+		
+		if args.count_by and not args.count_by in facet_conditions:
+			print(u"Can't count by '{0}'! Available fields: {1}".format(args.count_by, u", ".join(sorted(facet_conditions))))
+			self.exitcode = 1
+			return
 
 		if args.count and (args.offset or args.limit):
 			print(u"--offset/--limit cannot be used together with --count!")
 			self.exitcode = 1
 			return
 		
-		# Build an array with all supported fields for a particular source
-		supported_fields = ['action', 'actionid', 'cluster', 'from', 'helo', 'ip',
-			'messageid', 'node', 'queueid', 'sasl', 'server', 'size', 'subject',
-			'time', 'to', 'transport']
-		fields = []
+		if args.export and (args.action or args.snapshot or args.slices or args.distinct or args.count_by or args.count or args.offset or args.limit):
+			print(u"--export cannot be used together with actions, --snapshot, --slices, --distinct, --count-by, --count, --offset or --limit!")
+			self.exitcode = 1
+			return
+		
+		if args.read and (args.action or args.snapshot or args.slices or args.distinct or args.count_by or args.count or args.export or args.history or args.filter):
+			print(u"--read cannot be used together with a query, actions, --history, --snapshot, --slices, --distinct, --count-by, --count or --export!")
+			self.exitcode = 1
+			return
 		
+		if args.ids_from and not args.action:
+			print(u"--ids-from can only be used together with actions!")
+			self.exitcode = 1
+			return
+		
+		if args.read:
+			return self.do_read(args)
+		
+		# Snapshots are always of history
+		if args.snapshot:
+			args.history = True
+		
+		# Default fields for a particular source; snapshots only have the ones
+		# returned by the nodes, not the derived ones
+		supported_fields = snapshot_columns if args.snapshot else get_supported_fields(args.history)
 		if args.history:
-			supported_fields += ['historyid']
 			fields = ['cluster', 'node', 'messageid', 'from', 'to', 'subject']
 		else:
-			supported_fields += ['quarantine', 'retry']
 			fields = ['cluster', 'node', 'messageid', 'queueid', 'from', 'to', 'subject']
 		
+		# Archives should have everything
+		if args.export:
+			fields = get_supported_fields(args.history, derived=False)
+		
 		if args.fields:
-			fields = supported_fields if args.fields == '-' else args.fields.split(',')
+			fields = get_supported_fields(args.history, derived=False) if args.fields == '-' else args.fields.split(',')
 			
-		for f in fields:
+		for f in fields + [f for f in (args.distinct, args.per) if f]:
 			if not f in supported_fields:
 				print(u"Field '{0}' is not available!".format(f))
 				print(u"Available fields:")
@@ -103,7 +203,19 @@ class QueryModule(Module):
 			print(hql)
 		
 		# Dispatch!
-		if args.action is None:
+		if args.ids_from:
+			return self.do_ids(nodes, args, hql)
+		elif args.snapshot:
+			return self.do_show_snapshot(nodes, args, hql, fields)
+		elif args.distinct:
+			return self.do_distinct(nodes, args, hql)
+		elif args.count_by:
+			return self.do_count_by(nodes, args, hql)
+		elif args.export:
+			return self.do_export(nodes, args, hql, fields)
+		elif args.action is None and args.slices:
+			return self.do_show_sliced(nodes, args, hql, fields)
+		elif args.action is None:
 			return self.do_show(nodes, args, hql, fields)
 		elif args.action == 'deliver':
 			return self.do_deliver(nodes, args, hql, False)
@@ -120,6 +232,7 @@ class QueryModule(Module):
 		if not args.count:
 			yield fields
 		
+		extract = compile_fields(fields, args.history, args.timezone)
 		source = getattr(nodes.service, 'mailHistory' if args.history else 'mailQueue')
 		totalhits = 0
 		for node, (code, result) in six.iteritems(source(filter=hql, offset=args.offset or None, limit=args.limit or 100, options={'totalhits': True} if args.count else None)):
@@ -129,32 +242,296 @@ class QueryModule(Module):
 				totalhits += result['totalhits']
 			elif 'item' in result['result']:
 				for msg in result['result']['item']:
-					p = []
-					for f in fields:
-						if f == 'action': p.append(getattr(msg, 'msgaction', None))
-						elif f == 'actionid': p.append(getattr(msg, 'msgactionid', None))
-						elif f == 'cluster': p.append(node.cluster.name)
-						elif f == 'from': p.append(getattr(msg, 'msgfrom', None))
-						elif f == 'helo': p.append(getattr(msg, 'msghelo', None)) # Added in 3.3
-						elif f == 'historyid': p.append(getattr(msg, 'id', None))
-						elif f == 'ip': p.append(getattr(msg, 'msgfromserver', None))
-						elif f == 'messageid': p.append(getattr(msg, 'msgid', None))
-						elif f == 'node': p.append(node.name)
-						elif f == 'quarantine': p.append(getattr(msg, 'msgquarantine', None))
-						elif f == 'queueid': p.append(getattr(msg, 'msgqueueid' if args.history else 'id', None))
-						elif f == 'retry': p.append(getattr(msg, 'msgretries', None))
-						elif f == 'sasl': p.append(getattr(msg, 'msgsasl', None))
-						elif f == 'server': p.append(getattr(msg, 'msglistener', None))
-						elif f == 'size': p.append(getattr(msg, 'msgsize', None)) # Added in 3.3
-						elif f == 'subject': p.append(from_base64(getattr(msg, 'msgsubject', None)))
-						elif f == 'time': p.append(UTCDate(getattr(msg, 'msgts0', None), args.timezone))
-						elif f == 'to': p.append(getattr(msg, 'msgto', None))
-						elif f == 'transport': p.append(getattr(msg, 'msgtransport', None))
-					yield p
-
+					yield extract(node, msg)
+		
+		if args.count:
+			print(totalhits)
+	
+	def do_show_sliced(self, nodes, args, hql, fields):
+		try:
+			after, before = get_time_bounds(hql)
+		except ValueError as e:
+			print(u"Can't slice query: {0}".format(e))
+			self.exitcode = 1
+			return
+		
+		if after is None or before is None:
+			print(u"--slices needs a query with a time range, eg. \"time>{...} time<{...}\"")
+			self.exitcode = 1
+			return
+		
+		# Every slice has to return enough messages to fill the requested
+		# page on its own, since we can't know how they're distributed
+		offset = args.offset or 0
+		limit = args.limit or 100
+		filters = [u"({0}) {1}".format(hql, s) if s else hql for s in split_time_range(after, before, args.slices)]
+		kwargs = {
+			'offset': None,
+			'limit': 1 if args.count else offset + limit,
+			'options': {'totalhits': True} if args.count else None,
+		}
+		
+		source = 'mailHistory' if args.history else 'mailQueue'
+		tasks = {}
+		for node in nodes:
+			call = getattr(node.service, source)
+			tasks[node] = { (node, i): (call, [], dict(kwargs, filter=f)) for i, f in enumerate(filters) }
+		results = dict(iter_dispatch_grouped(tasks, args.slice_concurrency, default=(0, None)))
+		
+		if not args.count:
+			yield fields
+		
+		extract = compile_fields(fields, args.history, args.timezone)
+		totalhits = 0
+		for node in nodesort(nodes):
+			msgs = []
+			for i in range(len(filters)):
+				code, result = results[(node, i)]
+				if code != 200:
+					self.partial = True
+				elif args.count:
+					totalhits += result['totalhits']
+				elif 'item' in result['result']:
+					msgs.extend(result['result']['item'])
+			
+			# Merge the slices, newest first
+			msgs.sort(key=lambda msg: getattr(msg, 'msgts0', None) or 0, reverse=True)
+			for msg in msgs[offset:offset + limit]:
+				yield extract(node, msg)
+		
 		if args.count:
 			print(totalhits)
 	
+	def do_distinct(self, nodes, args, hql):
+		extract_value = compile_field(args.distinct, args.history, args.timezone)
+		extract_key = compile_field(args.per, args.history, args.timezone) if args.per else None
+		
+		# Every node makes its own estimates, in a single pass, which are then
+		# merged; only a small, fixed-size estimator is kept per group
+		def count(node):
+			groups = {}
+			code = 0
+			for code, items in iter_pages(node, 'mailHistory' if args.history else 'mailQueue', hql, PAGE_SIZE):
+				for msg in items:
+					key = extract_key(node, msg) if extract_key else None
+					if isinstance(key, Role):
+						key = key.raw()
+					
+					group = groups.get(key)
+					if group is None:
+						group = groups[key] = [0, HyperLogLog()]
+					
+					value = extract_value(node, msg)
+					group[0] += 1
+					group[1].add(value.raw() if isinstance(value, Role) else value)
+			return (code, groups)
+		
+		merged = {}
+		for node, (code, groups) in six.iteritems(async_dispatch({ node: (count, [node]) for node in nodes }, default=(0, None))):
+			if code != 200:
+				self.partial = True
+			for key, (messages, hll) in six.iteritems(groups or {}):
+				if key in merged:
+					merged[key] = [merged[key][0] + messages, merged[key][1].merge(hll)]
+				else:
+					merged[key] = [messages, hll]
+		
+		yield ([args.per] if args.per else []) + [u"messages", u"distinct {0}".format(args.distinct)]
+		
+		results = [(key, messages, hll.count()) for key, (messages, hll) in six.iteritems(merged)]
+		results.sort(key=lambda r: r[2], reverse=True)
+		for key, messages, distinct in results:
+			yield ([key] if args.per else []) + [messages, distinct]
+	
+	def do_count_by(self, nodes, args, hql):
+		source = 'mailHistory' if args.history else 'mailQueue'
+		
+		# Without any values given, count the most common ones in a sample
+		if args.values:
+			values = args.values.split(',')
+		else:
+			extract = compile_field(args.count_by, args.history, args.timezone)
+			counter = Counter()
+			for node, (code, result) in six.iteritems(getattr(nodes.service, source)(filter=hql, limit=PAGE_SIZE)):
+				if code != 200:
+					self.partial = True
+				elif 'item' in result['result']:
+					for msg in result['result']['item']:
+						value = extract(node, msg)
+						if value is not None:
+							counter[value] += 1
+			values = [value for value, _ in counter.most_common(args.facets)]
+		
+		# One query for every value on every node, plus one for the total
+		filters = [u"({0}) {1}".format(hql, c) if hql else c for c in (facet_condition(args.count_by, v) for v in values)] + [hql]
+		tasks = {}
+		for node in nodes:
+			for i, f in enumerate(filters):
+				tasks[(node, i)] = (getattr(node.service, source), [], { 'filter': f, 'offset': None, 'limit': 1, 'options': {'totalhits': True} })
+		results = async_dispatch(tasks, default=(0, None))
+		
+		nodes = nodesort(nodes)
+		counts = {}
+		for (node, i), (code, result) in six.iteritems(results):
+			if code != 200:
+				self.partial = True
+			counts[(node, i)] = result['totalhits'] if code == 200 else None
+		
+		def total(i):
+			node_counts = [counts[(node, i)] for node in nodes]
+			return sum(node_counts) if not None in node_counts else None
+		
+		yield [args.count_by] + [node.name for node in nodes] + [u"total"]
+		for i, value in enumerate(values):
+			yield [value] + [counts[(node, i)] for node in nodes] + [total(i)]
+		
+		# Whatever's left, if the values don't cover everything
+		others = []
+		for node in nodes:
+			node_total = counts[(node, len(values))]
+			node_counted = [counts[(node, i)] for i in range(len(values))]
+			others.append(node_total - sum(node_counted) if node_total is not None and not None in node_counted else None)
+		if any(others):
+			yield [u"(other)"] + others + [sum(others) if not None in others else None]
+	
+	def do_export(self, nodes, args, hql, fields):
+		extract = compile_fields(fields, args.history)
+		try:
+			with Writer(open(args.export, 'wb'), fields) as writer:
+				for node, code, items in iter_all_pages(nodes, 'mailHistory' if args.history else 'mailQueue', hql, PAGE_SIZE):
+					if code != 200:
+						self.partial = True
+					for msg in items:
+						writer.write([v.raw() if isinstance(v, Role) else v for v in extract(node, msg)])
+		except BaseException:
+			# Don't leave half an export lying around
+			if os.path.exists(args.export):
+				os.remove(args.export)
+			raise
+	
+	def do_read(self, args):
+		try:
+			f = open(args.read, 'rb')
+		except IOError as e:
+			print(u"Can't read {0}: {1}".format(args.read, e))
+			self.exitcode = 1
+			return
+		
+		with f:
+			try:
+				reader = Reader(f)
+			except ValueError as e:
+				print(u"Can't read {0}: {1}".format(args.read, e))
+				self.exitcode = 1
+				return
+			
+			fields = reader.columns
+			if args.fields and args.fields != '-':
+				fields = args.fields.split(',')
+				for field in fields:
+					if not field in reader.columns:
+						print(u"Field '{0}' is not in the file! Available: {1}".format(field, u", ".join(reader.columns)))
+						self.exitcode = 1
+						return
+			
+			yield fields
+			
+			indices = [reader.columns.index(field) for field in fields]
+			time_index = fields.index('time') if 'time' in fields else None
+			rows = islice(reader, args.offset or 0, (args.offset or 0) + args.limit if args.limit else None)
+			for row in rows:
+				row = [row[i] for i in indices]
+				if time_index is not None:
+					row[time_index] = UTCDate(row[time_index], args.timezone)
+				yield row
+	
+	def do_show_snapshot(self, nodes, args, hql, fields):
+		try:
+			snapshot = Snapshot(args.snapshot)
+		except IOError as e:
+			print(u"Can't open snapshot: {0}".format(e))
+			self.exitcode = 1
+			return
+		
+		try:
+			if args.count:
+				print(snapshot.count(hql, nodes))
+				return
+			
+			rows = snapshot.query(fields, hql, nodes, offset=args.offset or 0, limit=args.limit or 100)
+		except (ValueError, sqlite3.DatabaseError) as e:
+			print(u"Can't query snapshot: {0}".format(e))
+			self.exitcode = 1
+			return
+		
+		yield fields
+		
+		time_index = fields.index('time') if 'time' in fields else None
+		for row in rows:
+			row = list(row)
+			if time_index is not None:
+				row[time_index] = UTCDate(row[time_index], args.timezone)
+			yield row
+	
+	def do_ids(self, nodes, args, hql):
+		# The confirmation prompt reads from stdin, so it can't hold the IDs too
+		if args.ids_from == '-' and not args.yes:
+			print(u"--ids-from - needs --yes, since it can't ask for confirmation while reading IDs from stdin!")
+			self.exitcode = 1
+			return
+		
+		try:
+			if args.ids_from == '-':
+				ids = read_queue_ids(sys.stdin, nodes)
+			else:
+				with open(args.ids_from) as f:
+					ids = read_queue_ids(f, nodes)
+		except (IOError, ValueError) as e:
+			print(u"Can't read IDs: {0}".format(e))
+			self.exitcode = 1
+			return
+		
+		total = sum(len(node_ids) for node_ids in six.itervalues(ids))
+		verbs = { 'delete': u"delete", 'deliver': u"try to deliver", 'deliver-duplicate': u"try to deliver a copy of" }
+		prompt = u"Do you really want to {0} {1} emails on {2} nodes?".format(verbs[args.action], total, len([n for n in ids if ids[n]]))
+		if not args.yes and not ask_confirm(prompt, False):
+			return
+		
+		# Every chunk is one bulk call, matching its IDs, and the query if any
+		if args.action == 'delete':
+			name, kwargs = 'mailQueueDeleteBulk', {}
+		else:
+			name, kwargs = 'mailQueueRetryBulk', { 'duplicate': args.action == 'deliver-duplicate' }
+		
+		tasks = {}
+		for node, node_ids in six.iteritems(ids):
+			call = getattr(node.service, name)
+			tasks[node] = {}
+			for i in range(0, len(node_ids), args.chunk_size):
+				f = u" or ".join(u"id={0}".format(queueid) for queueid in node_ids[i:i + args.chunk_size])
+				tasks[node][(node, i)] = (call, [], dict(kwargs, filter=u"({0}) ({1})".format(hql, f) if hql else f))
+		total_chunks = sum(len(chunks) for chunks in six.itervalues(tasks))
+		
+		# Report progress as chunks finish, if anyone's watching
+		affected = 0
+		done = 0
+		progress = sys.stderr.isatty()
+		for (node, i), (code, result) in iter_dispatch_grouped(tasks, args.chunk_concurrency, default=(0, None)):
+			done += 1
+			if code != 200:
+				self.partial = True
+				print(u"{0}Failure on {1}: {2}".format(u"\n" if progress else u"", node, result))
+			else:
+				affected += result
+			
+			if progress:
+				print(u"\r{0}/{1} chunks, {2} affected".format(done, total_chunks, affected), file=sys.stderr, end='')
+		
+		if progress and total_chunks:
+			print(u"", file=sys.stderr)
+		if affected:
+			print(affected)
+	
 	def do_deliver(self, nodes, args, hql, duplicate):
 		if not hql and not args.yes and not ask_confirm(u"You have no filter, do you really want to try to deliver everything?", False):
 			return
@@ -0,0 +1,60 @@
+from __future__ import print_function
+import six
+import argparse
+from halonctl.modapi import Module
+from halonctl.util import hql_from_filters, filter_timestamp_re, nodesort
+from halonctl.roles import HTTPStatus
+from halonctl.snapshot import Snapshot
+
+class SnapshotCreateModule(Module):
+	'''Pulls mail history into a local snapshot'''
+	
+	def register_arguments(self, parser):
+		parser.add_argument('file', metavar='FILE',
+			help=u"snapshot file; added to if it already exists")
+		
+		tzgroup = parser.add_mutually_exclusive_group()
+		tzgroup.add_argument('-u', '--utc', dest='timezone', action='store_const', const=0,
+			help=u"timestamps are given in UTC")
+		tzgroup.add_argument('-t', '--timezone', dest='timezone', type=float, metavar='TZ',
+			help=u"timestamps are given in this UTC offset, in hours")
+		
+		parser.add_argument('filter', nargs=argparse.REMAINDER, metavar="...",
+			help=u"HQL query matching the emails to pull, eg. a time window")
+		
+		parser.epilog = u"Query the snapshot with \"query --snapshot FILE\"."
+	
+	def run(self, nodes, args):
+		for s in args.filter:
+			if args.timezone is None and filter_timestamp_re.search(s):
+				print(u"Timestamp placeholders need a --timezone/--utc parameter!")
+				self.exitcode = 1
+				return
+		
+		snapshot = Snapshot(args.file, create=True)
+		results = self.pull(snapshot, nodes, hql_from_filters(args.filter, args.timezone))
+		
+		yield (u"Cluster", u"Name", u"Messages", u"Result")
+		for node, (code, count) in six.iteritems(nodesort(results)):
+			if code != 200:
+				self.partial = True
+			yield (node.cluster, node, count, HTTPStatus(code))
+	
+	def pull(self, snapshot, nodes, hql):
+		return snapshot.pull(nodes, hql)
+
+class SnapshotSyncModule(SnapshotCreateModule):
+	'''Pulls mail history newer than the last sync into a local snapshot'''
+	
+	def pull(self, snapshot, nodes, hql):
+		return snapshot.sync(nodes, hql)
+
+class SnapshotModule(Module):
+	'''Local snapshots of mail history'''
+	
+	submodules = {
+		'create': SnapshotCreateModule(),
+		'sync': SnapshotSyncModule(),
+	}
+
+module = SnapshotModule()
@@ -4,6 +4,9 @@ import re
 from collections import OrderedDict
 from halonctl.modapi import Module
 from halonctl.roles import UTCDate
+from halonctl.models import NodeList
+from halonctl.util import nodesort
+from halonctl import cache
 
 class StatModule(Module):
 	'''Reads stat counters'''
@@ -27,12 +30,34 @@ class StatModule(Module):
 			self.exitcode = 1
 			return self.run_help(nodes, args)
 	
+	def list_counters(self, nodes):
+		'''Returns ``{ node: output }`` of ``statd -l`` on every node, or None
+		for nodes that couldn't run it; cached like a SOAP call, if configured.'''
+		
+		ttl = cache.get_ttl(u"statd -l")
+		keys = { node: cache.make_node_key(node, u"statd -l") for node in nodes }
+		outputs = { node: cache.get_result(keys[node], ttl) for node in nodes }
+		outputs = { node: output if isinstance(output, six.string_types) else None for node, output in six.iteritems(outputs) }
+		
+		missing = NodeList([node for node in nodes if outputs[node] is None])
+		if missing:
+			for node, (code, result) in six.iteritems(missing.command('statd', '-l')):
+				outputs[node] = result.all() if code == 200 else None
+				if ttl and outputs[node] is not None:
+					cache.set_result(keys[node], outputs[node])
+		
+		return nodesort(outputs)
+	
 	def run_help(self, nodes, args):
 		print(u"Available counters (per node):")
-		for node, (code, result) in six.iteritems(nodes.command('statd', '-l')):
+		for node, output in six.iteritems(self.list_counters(nodes)):
+			if output is None:
+				self.partial = True
+				continue
+			
 			print(u"")
 			print(u"{node.name}:".format(node=node))
-			for line in [line.strip() for line in result.all().split('\n')]:
+			for line in [line.strip() for line in output.split('\n')]:
 				if not line:
 					continue
 				print(u"  - {counter}".format(counter=line))
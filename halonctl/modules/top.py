@@ -0,0 +1,86 @@
+from __future__ import print_function
+import six
+import argparse
+from collections import OrderedDict
+from halonctl.modapi import Module
+from halonctl.util import hql_from_filters, filter_timestamp_re, async_dispatch, iter_pages
+from halonctl.fields import compile_field
+from halonctl.sketches import SpaceSaving
+
+# Number of messages to fetch from a node per call
+PAGE_SIZE = 1000
+
+# Dimensions that can be counted, and the fields they're made of
+dimensions = OrderedDict([
+	('sender', 'from'),
+	('sender-domain', 'fromdomain'),
+	('recipient', 'to'),
+	('recipient-domain', 'todomain'),
+	('ip', 'ip'),
+	('helo', 'helo'),
+	('server', 'server'),
+	('transport', 'transport'),
+	('sasl', 'sasl'),
+])
+
+default_dimensions = ['sender', 'recipient-domain', 'ip', 'helo']
+
+class TopModule(Module):
+	'''Shows the most common senders, recipients, IPs, etc.'''
+	
+	def register_arguments(self, parser):
+		parser.add_argument('-b', '--by', action='append', choices=list(dimensions.keys()), metavar='DIMENSION',
+			help=u"count this; may be given multiple times (default: {0}), choices: {1}".format(
+				u", ".join(default_dimensions), u", ".join(dimensions.keys())))
+		parser.add_argument('-n', '--limit', type=int, default=10, metavar='N',
+			help=u"show the top N of each (default: 10)")
+		parser.add_argument('-k', '--capacity', type=int, default=1000, metavar='N',
+			help=u"count at most N distinct values of each at a time; higher is more accurate (default: 1000)")
+		parser.add_argument('-r', '--history', action='store_true',
+			help=u"count history instead of queue")
+		
+		tzgroup = parser.add_mutually_exclusive_group()
+		tzgroup.add_argument('-u', '--utc', dest='timezone', action='store_const', const=0,
+			help=u"timestamps are given in UTC")
+		tzgroup.add_argument('-t', '--timezone', dest='timezone', type=float, metavar='TZ',
+			help=u"timestamps are given in this UTC offset, in hours")
+		
+		parser.add_argument('filter', nargs=argparse.REMAINDER, metavar="...",
+			help=u"HQL query matching the emails to count")
+	
+	def run(self, nodes, args):
+		for s in args.filter:
+			if args.timezone is None and filter_timestamp_re.search(s):
+				print(u"Timestamp placeholders need a --timezone/--utc parameter!")
+				self.exitcode = 1
+				return
+		
+		hql = hql_from_filters(args.filter, args.timezone)
+		names = args.by or default_dimensions
+		extractors = [(name, compile_field(dimensions[name], args.history)) for name in names]
+		
+		# Every node counts its own messages, in a single pass; the summaries
+		# are merged afterwards, so nothing but them is kept in memory
+		def count(node):
+			summaries = { name: SpaceSaving(args.capacity) for name in names }
+			code = 0
+			for code, items in iter_pages(node, 'mailHistory' if args.history else 'mailQueue', hql, PAGE_SIZE):
+				for msg in items:
+					for name, extract in extractors:
+						summaries[name].add(extract(node, msg))
+			return (code, summaries)
+		
+		merged = { name: SpaceSaving(args.capacity) for name in names }
+		for node, (code, summaries) in six.iteritems(async_dispatch({ node: (count, [node]) for node in nodes }, default=(0, None))):
+			if code != 200:
+				self.partial = True
+			if summaries:
+				for name in names:
+					merged[name] = merged[name].merge(summaries[name])
+		
+		yield (u"Field", u"Value", u"Count", u"Error")
+		for name in names:
+			for value, count, error in merged[name].top(args.limit):
+				yield (name, value, count, error)
+
+module = TopModule()
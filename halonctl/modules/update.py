@@ -23,14 +23,13 @@ class UpdateStatusModule(Module):
 	def run(self, nodes, args):
 		yield (u"Cluster", u"Name", u"Address", u"Version", u"Update Status")
 		
-		versions = nodes.service.getVersion()
-		
-		for node, (code, result) in six.iteritems(nodes.service.updateDownloadStatus()):
+		results = nodes.service.batch('getVersion', 'updateDownloadStatus')
+		for node, ((_, version), (code, result)) in six.iteritems(results):
 			if code != 200 and code != 500:
 				self.partial = True
 			
 			status = UpdateStatusCode(int(result) if code == 200 else None)
-			yield (node.cluster, node, node.host, versions[node][1], status)
+			yield (node.cluster, node, node.host, version, status)
 
 class UpdateDownloadModule(Module):
 	'''Downloads an available update'''
@@ -4,8 +4,38 @@ import sys
 import signal
 import inspect
 import requests
-from halonctl.util import async_dispatch, nodesort, from_base64, to_base64, print_ssl_error
+from base64 import b64decode, b64encode
+from halonctl import cache
+from halonctl.util import async_dispatch, nodesort, from_base64, to_base64, print_ssl_error, deadline
 from halonctl.config import config
+from halonctl.stats import stats
+from halonctl.health import health
+from halonctl.ratelimit import ratelimits
+
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 10
+
+def get_timeout(name):
+	'''Returns the ``(connect, read)`` timeouts for an operation.
+	
+	Timeouts are looked up in the ``timeouts`` configuration key, first for
+	the operation itself, then the global defaults, and are capped to what's
+	left of the global deadline, if any. Returns None if the deadline has
+	already expired.'''
+	
+	timeouts = config.get('timeouts', {})
+	op_timeouts = timeouts.get(name, {})
+	connect = op_timeouts.get('connect', timeouts.get('connect', DEFAULT_CONNECT_TIMEOUT))
+	read = op_timeouts.get('read', timeouts.get('read', DEFAULT_READ_TIMEOUT))
+	
+	time_left = deadline.time_left()
+	if time_left is not None:
+		if time_left <= 0:
+			return None
+		connect = min(connect, time_left)
+		read = min(read, time_left)
+	
+	return (connect, read)
 
 
 
@@ -30,26 +60,93 @@ class NodeSoapProxy(object):
 	def __init__(self, node):
 		self.node = node
 	
+	def batch(self, *calls):
+		'''Makes several calls, one after another, returning a list of their
+		``(status, response)`` tuples.
+		
+		Calls are given as ``(name, args, kwargs)`` tuples, where ``args`` and
+		``kwargs`` are optional, or just names. They're made back to back on
+		the node's keep-alive connection; if the node can't be reached, the
+		remaining calls aren't attempted, and fail the same way.
+		
+		Example::
+		
+			(code1, version), (code2, status) = node.service.batch('getVersion', ('updateDownloadStatus', [], {}))
+		'''
+		
+		results = []
+		for call in calls:
+			if isinstance(call, six.string_types):
+				call = (call,)
+			
+			if results and results[-1][0] == 0:
+				results.append((0, None))
+				continue
+			
+			results.append(getattr(self, call[0])(*(call[1] if len(call) >= 2 else []), **(call[2] if len(call) >= 3 else {})))
+		return results
+	
 	def __getattr__(self, name_):
 		def _soap_proxy_executor(*args, **kwargs):
 			# Allow params to constructed by lambda expressions
 			args = [ a(self.node) if callable(a) else a for a in args ]
 			kwargs = { k: a(self.node) if callable(a) else a for k, a in six.iteritems(kwargs) }
 			
-			context = self.node.make_request(name_, *args, **kwargs)
-			try:
-				r = self.node.session.post(context.client.location(),
-					auth=(self.node.username, self.node.password),
-					headers=context.client.headers(), data=context.envelope,
-					timeout=10,
-					verify=False if self.node.no_verify else config.get('verify_ssl', True)
-				)
-				return context.process_reply(r.content, r.status_code, r.reason)
-			except requests.exceptions.SSLError:
-				print_ssl_error(self.node)
-				sys.exit(1)
-			except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+			# Answer from the result cache, if we asked the same thing recently
+			ttl = cache.get_ttl(name_)
+			if ttl:
+				key = cache.make_node_key(self.node, name_, args, kwargs)
+				try:
+					content, status_code, reason = cache.get_result(key, ttl)
+					content = b64decode(content)
+				except (TypeError, ValueError):
+					# Missing, or not something we stored; ask the node
+					pass
+				else:
+					return self.node.make_request(name_, *args, **kwargs).process_reply(content, status_code, reason)
+			
+			# Don't even try if we're out of time
+			timeout = get_timeout(name_)
+			if timeout is None:
+				deadline.missed = True
 				return (0, None)
+			
+			# Fail fast for nodes that were recently unreachable
+			if not health.allow(self.node):
+				return (0, None)
+			
+			# Hold back if we're at the node's or cluster's rate limit
+			with ratelimits.limit(self.node, name_) as allowed:
+				# ...which may have taken a while
+				timeout = get_timeout(name_) if allowed else None
+				if timeout is None:
+					deadline.missed = True
+					return (0, None)
+				
+				context = self.node.make_request(name_, *args, **kwargs)
+				try:
+					r = self.node.session.post(context.client.location(),
+						auth=(self.node.username, self.node.password),
+						headers=context.client.headers(), data=context.envelope,
+						timeout=timeout,
+						verify=False if self.node.no_verify else config.get('verify_ssl', True)
+					)
+					health.record_success(self.node)
+					if stats.enabled:
+						stats.record_call(self.node, name_, len(context.envelope), r)
+					if ttl and r.status_code == 200:
+						cache.set_result(key, [b64encode(r.content).decode('ascii'), r.status_code, r.reason])
+					return context.process_reply(r.content, r.status_code, r.reason)
+				except requests.exceptions.SSLError:
+					print_ssl_error(self.node)
+					sys.exit(1)
+				except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+					health.record_failure(self.node)
+					if stats.enabled:
+						stats.record_call(self.node, name_, len(context.envelope))
+						if isinstance(e, requests.exceptions.Timeout):
+							stats.record_timeout(self.node)
+					return (0, None)
 		
 		return _soap_proxy_executor
 
@@ -79,9 +176,27 @@ class NodeListSoapProxy(object):
 	def __init__(self, nodelist):
 		self.nodelist = nodelist
 	
+	def batch(self, *calls):
+		'''Makes several calls on every node, in a single round.
+		
+		Rather than waiting for the slowest node once per call, every node
+		works through all of the calls on its own, as with
+		:func:`NodeSoapProxy.batch`, which also describes how calls are given.
+		
+		Returns a dictionary of ``{ node: [(status, response), ...] }``, with
+		one result per call, in order.
+		
+		Example::
+		
+			for node, ((code1, version), (code2, status)) in six.iteritems(nodes.service.batch('getVersion', 'updateDownloadStatus')):
+				print(node, version, status)
+		'''
+		
+		return nodesort(async_dispatch({node: (node.service.batch, calls) for node in self.nodelist}, default=[(0, None)] * len(calls)))
+	
 	def __getattr__(self, name_):
 		def _soap_proxy_executor(*args, **kwargs):
-			return nodesort(async_dispatch({node: (getattr(node.service, name_), args, kwargs) for node in self.nodelist}))
+			return nodesort(async_dispatch({node: (getattr(node.service, name_), args, kwargs) for node in self.nodelist}, default=(0, None)))
 		return _soap_proxy_executor
 
 class CommandProxy(six.Iterator):
@@ -0,0 +1,157 @@
+from __future__ import print_function
+import six
+import time
+from contextlib import contextmanager
+from threading import Lock, BoundedSemaphore
+from .config import config
+from .util import deadline
+
+def get_settings():
+	return config.get('rate_limits', {})
+
+class TokenBucket(object):
+	'''Allows ``rate`` calls per second on average, in bursts of up to
+	``burst`` calls.
+	
+	Tokens are handed out in advance; a caller that finds the bucket empty is
+	told how long to wait for its token, rather than polling for it, so
+	waiting callers are served in the order they came.'''
+	
+	def __init__(self, rate, burst=None):
+		self.rate = float(rate)
+		self.burst = burst or max(rate, 1)
+		self.tokens = float(self.burst)
+		self.last = time.time()
+		self.lock = Lock()
+	
+	def reserve(self):
+		'''Takes a token, returning the number of seconds to wait before use.'''
+		
+		with self.lock:
+			now = time.time()
+			self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+			self.last = now
+			self.tokens -= 1
+			return max(-self.tokens / self.rate, 0)
+	
+	def refund(self):
+		'''Gives back a token that ended up not being used.'''
+		
+		with self.lock:
+			self.tokens = min(self.burst, self.tokens + 1)
+
+def acquire(semaphore, timeout):
+	'''Acquires a semaphore, giving up after ``timeout`` seconds, or never if
+	it's None. Returns whether it was acquired.'''
+	
+	if timeout is None:
+		return semaphore.acquire()
+	if six.PY3:
+		return semaphore.acquire(timeout=timeout)
+	
+	# Python 2's semaphores can't time out, so poll instead
+	until = time.time() + timeout
+	while not semaphore.acquire(False):
+		if time.time() >= until:
+			return False
+		time.sleep(0.01)
+	return True
+
+class Limit(object):
+	'''A rate and/or concurrency limit, shared by every call it applies to.'''
+	
+	def __init__(self, rate=None, burst=None, concurrency=None):
+		self.bucket = TokenBucket(rate, burst) if rate else None
+		self.semaphore = BoundedSemaphore(concurrency) if concurrency else None
+
+class RateLimiter(object):
+	'''Keeps calls to nodes within the limits in the ``rate_limits``
+	configuration key.
+	
+	Every node, and every cluster as a whole, can be limited to a number of
+	calls per second (``rate``, with bursts of up to ``burst``) and a number
+	of calls at a time (``concurrency``). The ``node`` and ``cluster`` keys
+	set the defaults, which can be overridden by name under ``nodes`` and
+	``clusters``; if ``operations`` is given, only those calls are limited.
+	
+	Limits are enforced by :class:`halonctl.proxies.NodeSoapProxy`, so they
+	apply to every module.'''
+	
+	def __init__(self):
+		self.lock = Lock()
+		self.limits = {}
+	
+	def get_limit(self, kind, name):
+		'''Returns the limit for a node or cluster, or None if it has none.'''
+		
+		key = (kind, name)
+		with self.lock:
+			if not key in self.limits:
+				settings = get_settings()
+				options = dict(settings.get(kind, {}))
+				options.update(settings.get(kind + 's', {}).get(name, {}))
+				self.limits[key] = Limit(options.get('rate'), options.get('burst'), options.get('concurrency')) if options else None
+			return self.limits[key]
+	
+	def get_limits(self, node):
+		limits = [self.get_limit('node', node.name)]
+		if node.cluster is not None:
+			limits.append(self.get_limit('cluster', node.cluster.name))
+		return [limit for limit in limits if limit is not None]
+	
+	def applies(self, name):
+		operations = get_settings().get('operations')
+		return operations is None or name in operations
+	
+	@contextmanager
+	def limit(self, node, name):
+		'''Waits until a call may be made, and holds its place while it's made.
+		
+		Yields False if the wait would outlast the global
+		:data:`halonctl.util.deadline`; the call shouldn't be made then.
+		
+		Calls through ``node.service`` are already limited, so this is only
+		for making requests some other way; calling ``node.service`` inside
+		it would wait for the limit twice, and never get it if it's a
+		concurrency of 1.
+		
+		Example::
+		
+			with ratelimits.limit(node, 'mailQueue') as allowed:
+				if allowed:
+					send_request(node, 'mailQueue', ...)
+		'''
+		
+		limits = self.get_limits(node) if self.applies(name) else []
+		held = []
+		reserved = []
+		try:
+			# Always in the same order, so calls can't deadlock each other
+			for limit in limits:
+				if limit.semaphore is not None:
+					if not acquire(limit.semaphore, deadline.time_left()):
+						yield False
+						return
+					held.append(limit.semaphore)
+			
+			wait = 0
+			for limit in limits:
+				if limit.bucket is not None:
+					wait = max(wait, limit.bucket.reserve())
+					reserved.append(limit.bucket)
+			
+			time_left = deadline.time_left()
+			if time_left is not None and wait >= time_left:
+				for bucket in reserved:
+					bucket.refund()
+				yield False
+				return
+			
+			if wait:
+				time.sleep(wait)
+			yield True
+		finally:
+			for semaphore in reversed(held):
+				semaphore.release()
+
+ratelimits = RateLimiter()
@@ -1,6 +1,6 @@
 import six
-import arrow
-from dateutil import tz
+from operator import methodcaller
+from .util import register_converter, format_timestamp, from_base64
 
 @six.python_2_unicode_compatible
 class Role(object):
@@ -39,6 +39,8 @@ class Role(object):
 	def __str__(self):
 		return self.human()
 
+register_converter(Role, methodcaller('human'), methodcaller('raw'))
+
 class StatusCode(Role):
 	'''
 	A generic status code.
@@ -145,4 +147,25 @@ class UTCDate(Role):
 		return self.timestamp
 	
 	def human(self):
-		return str(arrow.get(arrow.get(self.timestamp).naive, tz.tzoffset(None, self.timezone * 3600 if self.timezone else 0)))
+		return format_timestamp(self.timestamp, self.timezone)
+
+class Base64Text(Role):
+	'''
+	A Base64-encoded string, decoded only if it's actually output.
+	
+	Both the raw and human representation is the decoded string; decoding
+	is deferred because a lot of values (eg. subjects) are fetched, but
+	never looked at.
+	'''
+	
+	def __init__(self, encoded):
+		self.encoded = encoded
+		self.decoded = None
+	
+	def raw(self):
+		if self.decoded is None:
+			self.decoded = from_base64(self.encoded)
+		return self.decoded
+	
+	def human(self):
+		return self.raw()
@@ -0,0 +1,294 @@
+from __future__ import print_function
+import six
+import math
+import heapq
+import random
+import struct
+import hashlib
+from itertools import count as counter
+
+class SpaceSaving(object):
+	'''Finds the most frequent items in a stream, in bounded memory.
+	
+	At most ``capacity`` items are counted at a time; when a new item comes
+	along and there's no room for it, it replaces the least frequent one, and
+	inherits its count. Every item more frequent than ``total / capacity`` is
+	guaranteed to be counted, and no count is more than ``error`` too high.
+	
+	Summaries of different streams (eg. one per node) can be combined with
+	:func:`merge`.
+	
+	:ivar int total: The number of items seen
+	'''
+	
+	def __init__(self, capacity=1000):
+		self.capacity = capacity
+		self.counts = {}
+		self.errors = {}
+		self.total = 0
+		
+		# Lazily updated min-heap of (count, seq, item); stale entries are
+		# skipped, and seq keeps items of different types from being compared
+		self.heap = []
+		self.seq = counter()
+	
+	def __len__(self):
+		return len(self.counts)
+	
+	def add(self, item, count=1):
+		'''Counts an item.'''
+		
+		self.total += count
+		if item in self.counts:
+			self.counts[item] += count
+		elif len(self.counts) < self.capacity:
+			self.counts[item] = count
+			self.errors[item] = 0
+		else:
+			min_count, min_item = self.pop_min()
+			del self.counts[min_item]
+			del self.errors[min_item]
+			self.counts[item] = min_count + count
+			self.errors[item] = min_count
+		
+		heapq.heappush(self.heap, (self.counts[item], next(self.seq), item))
+		if len(self.heap) > self.capacity * 4:
+			self.rebuild_heap()
+	
+	def min_count(self):
+		'''Returns the lowest count, or 0 if there's still room for more items.'''
+		
+		if len(self.counts) < self.capacity:
+			return 0
+		count, item = self.pop_min()
+		heapq.heappush(self.heap, (count, next(self.seq), item))
+		return count
+	
+	def pop_min(self):
+		while True:
+			count, _, item = heapq.heappop(self.heap)
+			if self.counts.get(item) == count:
+				return (count, item)
+	
+	def rebuild_heap(self):
+		self.heap = [(count, next(self.seq), item) for item, count in six.iteritems(self.counts)]
+		heapq.heapify(self.heap)
+	
+	def merge(self, other):
+		'''Returns a new summary, counting the items of both.
+		
+		Items missing from one summary may still have been seen by it, up to
+		its lowest count times; this is added to their error.'''
+		
+		min_self = self.min_count()
+		min_other = other.min_count()
+		
+		merged = SpaceSaving(max(self.capacity, other.capacity))
+		merged.total = self.total + other.total
+		candidates = []
+		for item in set(self.counts) | set(other.counts):
+			count = self.counts.get(item, min_self) + other.counts.get(item, min_other)
+			error = self.errors.get(item, min_self) + other.errors.get(item, min_other)
+			candidates.append((count, error, item))
+		
+		for count, error, item in heapq.nlargest(merged.capacity, candidates, key=lambda c: c[0]):
+			merged.counts[item] = count
+			merged.errors[item] = error
+		merged.rebuild_heap()
+		return merged
+	
+	def top(self, n):
+		'''Returns the ``n`` most frequent items, as ``(item, count, error)``.'''
+		
+		return [
+			(item, count, self.errors[item])
+			for item, count in heapq.nlargest(n, six.iteritems(self.counts), key=lambda t: t[1])
+		]
+
+class HyperLogLog(object):
+	'''Estimates the number of distinct items in a stream, in bounded memory.
+	
+	Uses ``2 ** precision`` bytes, regardless of how many items there are;
+	the standard error is about ``1.04 / sqrt(2 ** precision)``, or 1.6% with
+	the default precision. Counts of up to a few thousand items are nearly
+	exact.
+	
+	Like :class:`SpaceSaving`, estimators for different streams can be
+	combined with :func:`merge`, as long as they have the same precision.
+	'''
+	
+	def __init__(self, precision=12):
+		self.precision = precision
+		self.m = 1 << precision
+		self.registers = bytearray(self.m)
+	
+	def add(self, item):
+		'''Counts an item. Items are compared by their text representation;
+		None isn't a value, and isn't counted.'''
+		
+		if item is None:
+			return
+		
+		h = struct.unpack('<Q', hashlib.sha1(six.text_type(item).encode('utf-8')).digest()[:8])[0]
+		index = h & (self.m - 1)
+		w = h >> self.precision
+		
+		# Position of the lowest set bit in the remaining bits, counting from 1
+		rank = 1
+		limit = 64 - self.precision
+		while rank <= limit and not w & 1:
+			w >>= 1
+			rank += 1
+		
+		if rank > self.registers[index]:
+			self.registers[index] = rank
+	
+	def merge(self, other):
+		'''Returns a new estimator, counting the items of both.'''
+		
+		if other.precision != self.precision:
+			raise ValueError(u"Can't merge HyperLogLogs of different precision")
+		
+		merged = HyperLogLog(self.precision)
+		merged.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+		return merged
+	
+	def count(self):
+		'''Returns the estimated number of distinct items.'''
+		
+		m = self.m
+		alpha = 0.7213 / (1 + 1.079 / m)
+		estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+		
+		# Use linear counting for small cardinalities, where it's more accurate
+		zeros = self.registers.count(0)
+		if estimate <= 2.5 * m and zeros:
+			estimate = m * math.log(float(m) / zeros)
+		
+		return int(round(estimate))
+
+class KLL(object):
+	'''Estimates quantiles of a stream of numbers, in bounded memory.
+	
+	This is the KLL sketch (Karnin, Lang & Liberty): values are kept in a
+	stack of compactors, where every value on level ``h`` stands for ``2 ** h``
+	values in the stream. When the sketch fills up, the lowest full level is
+	sorted, and every other value in it is promoted to the next level. Memory
+	use is around ``3 * k`` values, no matter how many are added, and the rank
+	error is around ``1.7 / k``, or about 1% with the default ``k``. The exact
+	minimum and maximum are always kept.
+	
+	Like the other sketches here, sketches of different streams can be
+	combined with :func:`merge`.
+	
+	:ivar int count: The number of values seen
+	'''
+	
+	def __init__(self, k=200):
+		self.k = k
+		self.compactors = []
+		self.count = 0
+		self.min = None
+		self.max = None
+		self.size = 0
+		self.max_size = 0
+		self.random = random.Random()
+		self.grow()
+	
+	def __len__(self):
+		return self.count
+	
+	def capacity(self, h):
+		'''Returns the number of values level ``h`` may hold; the top level
+		holds ``k``, and every level below it two thirds of the one above.'''
+		
+		depth = len(self.compactors) - h - 1
+		return int(math.ceil(self.k * (2.0 / 3) ** depth)) + 1
+	
+	def grow(self):
+		self.compactors.append([])
+		self.max_size = sum(self.capacity(h) for h in range(len(self.compactors)))
+	
+	def add(self, value):
+		'''Adds a value to the sketch.'''
+		
+		self.count += 1
+		if self.min is None or value < self.min:
+			self.min = value
+		if self.max is None or value > self.max:
+			self.max = value
+		
+		self.compactors[0].append(value)
+		self.size += 1
+		if self.size >= self.max_size:
+			self.compress()
+	
+	def compress(self):
+		'''Compacts the lowest level that's full.'''
+		
+		for h, compactor in enumerate(self.compactors):
+			if len(compactor) >= self.capacity(h):
+				if h + 1 == len(self.compactors):
+					self.grow()
+				
+				# Keep the odd one out, if any, so no weight is lost
+				compactor.sort()
+				leftover = [compactor.pop()] if len(compactor) % 2 else []
+				self.compactors[h + 1].extend(compactor[self.random.randint(0, 1)::2])
+				self.compactors[h] = leftover
+				break
+		
+		self.size = sum(len(c) for c in self.compactors)
+	
+	def merge(self, other):
+		'''Returns a new sketch, with the values of both.'''
+		
+		merged = KLL(max(self.k, other.k))
+		while len(merged.compactors) < max(len(self.compactors), len(other.compactors)):
+			merged.grow()
+		
+		for sketch in (self, other):
+			for h, compactor in enumerate(sketch.compactors):
+				merged.compactors[h].extend(compactor)
+		
+		merged.count = self.count + other.count
+		if merged.count:
+			merged.min = min(v for v in (self.min, other.min) if v is not None)
+			merged.max = max(v for v in (self.max, other.max) if v is not None)
+		
+		merged.size = sum(len(c) for c in merged.compactors)
+		while merged.size >= merged.max_size:
+			merged.compress()
+		return merged
+	
+	def quantile(self, q):
+		'''Returns the estimated value at quantile ``q`` (0-1), or None if empty.'''
+		
+		return self.quantiles([q])[0]
+	
+	def quantiles(self, qs):
+		'''Returns estimated values at a list of quantiles, in one go.'''
+		
+		if not self.count:
+			return [None] * len(qs)
+		
+		weighted = sorted((v, 1 << h) for h, compactor in enumerate(self.compactors) for v in compactor)
+		total = sum(w for v, w in weighted)
+		
+		results = []
+		for q in qs:
+			if q <= 0:
+				results.append(self.min)
+				continue
+			if q >= 1:
+				results.append(self.max)
+				continue
+			
+			target = q * total
+			cumulative = 0
+			for v, w in weighted:
+				cumulative += w
+				if cumulative >= target:
+					break
+			results.append(v)
+		return results
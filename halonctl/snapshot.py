@@ -0,0 +1,267 @@
+from __future__ import print_function
+import six
+import os
+import errno
+import sqlite3
+from .util import iter_pages, iter_all_pages
+from .roles import Role
+from .fields import get_supported_fields, compile_fields
+from .hql import tokenize_hql
+
+# Number of messages to fetch from a node per call
+PAGE_SIZE = 1000
+
+# Columns in the snapshot, one per history field
+columns = get_supported_fields(True, derived=False)
+
+# Columns that are indexed, for fast lookups
+indexed_columns = ['from', 'to', 'ip', 'messageid', 'time']
+
+# Columns holding numbers, rather than text
+numeric_columns = ['actionid', 'historyid', 'queueid', 'size', 'time']
+
+# HQL field names that aren't the same as their column names
+hql_aliases = {
+	'id': 'historyid',
+}
+
+sql_operators = {
+	'=': u"=",
+	'!=': u"!=",
+	'>': u">",
+	'<': u"<",
+	'>=': u">=",
+	'<=': u"<=",
+	'~': u"LIKE",
+	'!~': u"NOT LIKE",
+}
+
+def quote(name):
+	return u'"{0}"'.format(name)
+
+def hql_to_sql(hql):
+	'''Translates a HQL query into an SQL ``WHERE`` clause for a snapshot.
+	
+	Conditions are ANDed together, unless separated by ``or``; ``and``,
+	``not`` and parentheses work as you'd expect. ``~`` matches with ``%``
+	wildcards, like SQL's ``LIKE``.
+	
+	Returns a tuple of ``(sql, params)``; an empty query gives an empty
+	clause, matching everything.
+	
+	:raises ValueError: If the query can't be parsed, or uses unknown fields
+	'''
+	
+	tokens = tokenize_hql(hql)
+	params = []
+	pos = [0]
+	
+	def peek():
+		return tokens[pos[0]] if pos[0] < len(tokens) else (None, None)
+	
+	def take():
+		token = peek()
+		pos[0] += 1
+		return token
+	
+	def parse_or():
+		parts = [parse_and()]
+		while peek() == ('keyword', 'or'):
+			take()
+			parts.append(parse_and())
+		return parts[0] if len(parts) == 1 else u"({0})".format(u" OR ".join(parts))
+	
+	def parse_and():
+		parts = [parse_unary()]
+		while True:
+			token = peek()
+			if token == ('keyword', 'and'):
+				take()
+			elif token[0] is None or token in (('keyword', 'or'), ('paren', ')')):
+				break
+			parts.append(parse_unary())
+		return parts[0] if len(parts) == 1 else u"({0})".format(u" AND ".join(parts))
+	
+	def parse_unary():
+		kind, value = take()
+		if (kind, value) == ('keyword', 'not'):
+			return u"NOT {0}".format(parse_unary())
+		elif (kind, value) == ('paren', '('):
+			expr = parse_or()
+			if take() != ('paren', ')'):
+				raise ValueError(u"Unbalanced parentheses")
+			return expr
+		elif kind == 'condition':
+			return parse_condition(*value)
+		raise ValueError(u"Unexpected '{0}'".format(value) if kind else u"Unexpected end of query")
+	
+	def parse_condition(field, op, value):
+		column = hql_aliases.get(field, field)
+		if not column in columns:
+			raise ValueError(u"Unknown field: {0}".format(field))
+		
+		if column in numeric_columns and not op in ('~', '!~'):
+			try:
+				value = int(value)
+			except ValueError:
+				raise ValueError(u"Field '{0}' needs a number, not: {1}".format(field, value))
+		
+		params.append(value)
+		return u"{0} {1} ?".format(quote(column), sql_operators[op])
+	
+	if not tokens:
+		return (u"", [])
+	
+	sql = parse_or()
+	if pos[0] != len(tokens):
+		raise ValueError(u"Unexpected '{0}'".format(tokens[pos[0]][1]))
+	return (sql, params)
+
+def iter_history(node, hql, page_size=PAGE_SIZE):
+	'''Pages through a node's history, see :func:`halonctl.util.iter_pages`.'''
+	
+	return iter_pages(node, 'mailHistory', hql, page_size)
+
+class Snapshot(object):
+	'''A local copy of mail history, stored in an SQLite database.
+	
+	Messages are keyed by node and history ID, so pulling the same messages
+	twice doesn't duplicate them. Unless ``create`` is True, the snapshot
+	must already exist.
+	
+	:raises IOError: If the snapshot doesn't exist, and isn't to be created
+	'''
+	
+	def __init__(self, path, create=False):
+		if not create and not os.path.exists(path):
+			raise IOError(errno.ENOENT, u"No such snapshot", path)
+		
+		self.path = path
+		self.db = sqlite3.connect(path)
+		if create:
+			self.create_schema()
+	
+	def create_schema(self):
+		self.db.execute(u"CREATE TABLE IF NOT EXISTS messages ({0}, PRIMARY KEY (node, historyid))".format(
+			u", ".join(u"{0} {1}".format(quote(c), u"INTEGER" if c in numeric_columns else u"TEXT") for c in columns)))
+		self.db.execute(u"CREATE TABLE IF NOT EXISTS cursors (node TEXT PRIMARY KEY, historyid INTEGER)")
+		for c in indexed_columns:
+			self.db.execute(u"CREATE INDEX IF NOT EXISTS messages_{0} ON messages ({1})".format(c, quote(c)))
+		self.db.commit()
+	
+	def insert(self, node, items):
+		'''Inserts ``mailHistory`` items from a node.'''
+		
+		extract = compile_fields(columns, history=True)
+		rows = (
+			[v.raw() if isinstance(v, Role) else v for v in extract(node, msg)]
+			for msg in items
+		)
+		self.db.executemany(u"INSERT OR REPLACE INTO messages ({0}) VALUES ({1})".format(
+			u", ".join(quote(c) for c in columns), u", ".join(u"?" * len(columns))), rows)
+	
+	def commit(self):
+		self.db.commit()
+	
+	def make_where(self, hql, nodes=None):
+		sql, params = hql_to_sql(hql)
+		conditions = [sql] if sql else []
+		if nodes is not None:
+			conditions.append(u"node IN ({0})".format(u", ".join(u"?" * len(nodes))))
+			params += [node.name for node in nodes]
+		return (u" WHERE " + u" AND ".join(conditions) if conditions else u"", params)
+	
+	def query(self, fields, hql, nodes=None, offset=0, limit=None):
+		'''Returns rows of the given fields, for messages matching a query.
+		
+		:param list fields: Field names, as for :func:`halonctl.fields.compile_fields`
+		:param str hql: A HQL query, see :func:`hql_to_sql`
+		:param nodes: Only include messages from these nodes
+		'''
+		
+		for f in fields:
+			if not f in columns:
+				raise ValueError(u"Unknown field: {0}".format(f))
+		
+		where, params = self.make_where(hql, nodes)
+		return self.db.execute(u"SELECT {0} FROM messages{1} ORDER BY time DESC, historyid DESC LIMIT ? OFFSET ?".format(
+			u", ".join(quote(f) for f in fields), where), params + [-1 if limit is None else limit, offset])
+	
+	def count(self, hql, nodes=None):
+		'''Returns the number of messages matching a query.'''
+		
+		where, params = self.make_where(hql, nodes)
+		return self.db.execute(u"SELECT COUNT(*) FROM messages" + where, params).fetchone()[0]
+	
+	def get_cursor(self, node):
+		'''Returns the highest history ID synced from a node, or None.
+		
+		For nodes that have never been synced, this is the highest ID of any of
+		their messages in the snapshot, if there are any.'''
+		
+		row = self.db.execute(u"SELECT historyid FROM cursors WHERE node = ?", [node.name]).fetchone()
+		if row is None:
+			row = self.db.execute(u"SELECT MAX(historyid) FROM messages WHERE node = ?", [node.name]).fetchone()
+		return row[0]
+	
+	def set_cursor(self, node, historyid):
+		self.db.execute(u"INSERT OR REPLACE INTO cursors (node, historyid) VALUES (?, ?)", [node.name, historyid])
+	
+	def pull(self, nodes, hql, page_size=PAGE_SIZE):
+		'''Pulls history matching a query from all nodes, in parallel.
+		
+		Returns a dictionary of ``{ node: (code, count) }``, where ``code`` is
+		the status of the last call made to the node.'''
+		
+		results = self.fetch_all(nodes, hql, page_size)
+		self.commit()
+		return { node: (code, count) for node, (code, count, last_id) in six.iteritems(results) }
+	
+	def sync(self, nodes, hql=u"", page_size=PAGE_SIZE):
+		'''Pulls only history newer than the last sync from all nodes.
+		
+		The highest history ID seen from each node is remembered in the
+		snapshot, and only messages with higher IDs are asked for next time,
+		so syncing often is cheap. The cursor is only moved forward once a
+		node has been completely paged through; if a node fails halfway, the
+		next sync picks up from the same place.
+		
+		Returns the same thing as :func:`pull`.'''
+		
+		cursors = { node: self.get_cursor(node) for node in nodes }
+		
+		def get_filter(node):
+			conditions = [u"({0})".format(hql)] if hql else []
+			if cursors[node] is not None:
+				conditions.append(u"id>{0}".format(cursors[node]))
+			return u" ".join(conditions)
+		
+		results = self.fetch_all(nodes, get_filter, page_size)
+		for node, (code, count, last_id) in six.iteritems(results):
+			if code == 200 and last_id is not None and (cursors[node] is None or last_id > cursors[node]):
+				self.set_cursor(node, last_id)
+		self.commit()
+		
+		return { node: (code, count) for node, (code, count, last_id) in six.iteritems(results) }
+	
+	def fetch_all(self, nodes, hql, page_size):
+		'''Pages through history on all nodes in parallel, inserting it.
+		
+		``hql`` may be a function taking a node, like parameters to
+		:class:`halonctl.proxies.NodeSoapProxy` calls. Returns a dictionary of
+		``{ node: (code, count, last_id) }``, where ``last_id`` is the highest
+		history ID seen. Doesn't commit.'''
+		
+		# Nodes are paged through in the thread pool, while we do all the
+		# writing from this thread; SQLite connections don't like sharing
+		codes = { node: 0 for node in nodes }
+		counts = { node: 0 for node in nodes }
+		last_ids = { node: None for node in nodes }
+		for node, code, items in iter_all_pages(nodes, 'mailHistory', hql, page_size):
+			codes[node] = code
+			if items:
+				self.insert(node, items)
+				counts[node] += len(items)
+				last_ids[node] = max([last_ids[node] or 0] + [getattr(msg, 'id', None) or 0 for msg in items]) or None
+		
+		return { node: (codes[node], counts[node], last_ids[node]) for node in nodes }
@@ -0,0 +1,166 @@
+from __future__ import print_function
+import six
+import heapq
+import tempfile
+from itertools import count
+from six.moves import cPickle as pickle
+
+# Number of items to sort in memory before spilling a sorted run to disk
+BUFFER_SIZE = 100000
+
+def sort_key(value):
+	'''Returns a key that lets values of mixed types be compared.
+	
+	None sorts first, then numbers, then everything else as text, which is
+	what you'd expect for a column that's missing a value here and there.'''
+	
+	if value is None:
+		return (0, 0)
+	elif isinstance(value, six.integer_types + (float,)):
+		return (1, value)
+	elif isinstance(value, six.text_type):
+		return (2, value)
+	return (2, six.text_type(value))
+
+class _Entry(object):
+	'''Heap entry for merging sorted runs, optionally in reverse order.'''
+	
+	__slots__ = ('key', 'seq', 'item', 'reverse', 'run')
+	
+	def __init__(self, key, seq, item, reverse, run):
+		self.key = key
+		self.seq = seq
+		self.item = item
+		self.reverse = reverse
+		self.run = run
+	
+	def __lt__(self, other):
+		if self.key == other.key:
+			return self.seq < other.seq
+		return other.key < self.key if self.reverse else self.key < other.key
+
+def _spill(entries):
+	'''Writes a sorted run of ``(key, seq, item)`` tuples to a temporary file.'''
+	
+	f = tempfile.TemporaryFile()
+	for entry in entries:
+		pickle.dump(entry, f, pickle.HIGHEST_PROTOCOL)
+	f.seek(0)
+	return f
+
+def _read_run(f):
+	try:
+		while True:
+			yield pickle.load(f)
+	except EOFError:
+		f.close()
+
+def external_sort(items, key, reverse=False, buffer_size=BUFFER_SIZE):
+	'''Sorts an iterable of any size, yielding the items in order.
+	
+	Up to ``buffer_size`` items are sorted in memory at a time; anything past
+	that is sorted in runs, which are spilled to temporary files and merged
+	back together at the end. The sort is stable, and items must be picklable
+	if there are more of them than fit in the buffer.
+	
+	:param callable key: Returns the key to sort an item by
+	:param bool reverse: Sort in descending order
+	:param int buffer_size: The maximum number of items held in memory
+	'''
+	
+	seq = count()
+	runs = []
+	buf = []
+	for item in items:
+		buf.append((key(item), next(seq), item))
+		if len(buf) >= buffer_size:
+			buf.sort(key=lambda e: e[0], reverse=reverse)
+			runs.append(_spill(buf))
+			buf = []
+	
+	buf.sort(key=lambda e: e[0], reverse=reverse)
+	if not runs:
+		for entry in buf:
+			yield entry[2]
+		return
+	
+	# Merge all runs, including the one still in memory
+	iterators = [_read_run(f) for f in runs] + [iter(buf)]
+	heap = []
+	for i, it in enumerate(iterators):
+		for k, s, item in it:
+			heap.append(_Entry(k, s, item, reverse, i))
+			break
+	heapq.heapify(heap)
+	
+	while heap:
+		entry = heap[0]
+		yield entry.item
+		for k, s, item in iterators[entry.run]:
+			heapq.heapreplace(heap, _Entry(k, s, item, reverse, entry.run))
+			break
+		else:
+			heapq.heappop(heap)
+
+def top_n(items, key, n, reverse=False):
+	'''Returns the first ``n`` items in sort order, in order.
+	
+	Only ``n`` items are ever held in memory, no matter how many are given.
+	
+	:param callable key: Returns the key to sort an item by
+	:param bool reverse: Take the largest items rather than the smallest
+	'''
+	
+	return (heapq.nlargest if reverse else heapq.nsmallest)(n, items, key=key)
+
+def group_sorted(items, key, unique=False):
+	'''Groups items, yielding ``(key, group)`` tuples in key order.
+	
+	The grouping is done on sorted data, with :func:`external_sort`, so the
+	number of items isn't limited by available memory, though each group has
+	to fit. If ``unique``, the last item with each key is yielded rather than
+	a list of them.'''
+	
+	marker = object()
+	current_key = marker
+	group = None
+	for item in external_sort(items, key=lambda item: sort_key(key(item))):
+		k = key(item)
+		if k != current_key:
+			if current_key is not marker:
+				yield (current_key, group)
+			current_key = k
+			group = None if unique else []
+		
+		if unique:
+			group = item
+		else:
+			group.append(item)
+	
+	if current_key is not marker:
+		yield (current_key, group)
+
+def merge_join(left, right, key):
+	'''Joins two iterables that are sorted by the same key.
+	
+	Yields ``(left_item, right_item)`` for every key, with None for the side
+	it's missing from; keys are expected to be unique on each side. Only one
+	item from each side is held in memory at a time, so combined with
+	:func:`external_sort`, this can join inputs of any size.'''
+	
+	marker = object()
+	left = iter(left)
+	right = iter(right)
+	l = next(left, marker)
+	r = next(right, marker)
+	while l is not marker or r is not marker:
+		if r is marker or (l is not marker and key(l) < key(r)):
+			yield (l, None)
+			l = next(left, marker)
+		elif l is marker or key(r) < key(l):
+			yield (None, r)
+			r = next(right, marker)
+		else:
+			yield (l, r)
+			l = next(left, marker)
+			r = next(right, marker)
@@ -0,0 +1,131 @@
+from __future__ import print_function
+import six
+import os
+import sys
+import time
+from collections import defaultdict
+from threading import Lock
+from .util import nodesort
+
+try:
+	import resource
+except ImportError:
+	# We're on Windows, no getrusage() for us
+	resource = None
+
+class RunStats(object):
+	'''Collects resource usage counters for a single halonctl invocation.
+	
+	Counters are only updated while :attr:`enabled` is True; callers are
+	expected to check it before calling any of the ``record_*`` methods, so
+	that the cost of a disabled collector is a single attribute lookup.
+	
+	:ivar bool enabled: Whether counters are being collected
+	'''
+	
+	enabled = False
+	
+	def __init__(self):
+		self.lock = Lock()
+		self.started = time.time()
+		self.calls = defaultdict(int)
+		self.failures = defaultdict(int)
+		self.timeouts = defaultdict(int)
+		self.bytes_sent = 0
+		self.bytes_received = 0
+		self.pools = {}
+	
+	def enable(self):
+		'''Starts collecting counters.
+		
+		The wall clock is measured from when this module was first imported,
+		so that startup costs are included.'''
+		
+		self.enabled = True
+	
+	def record_call(self, node, name, sent, response=None):
+		'''Records a SOAP call made to a node.
+		
+		:param str name: The name of the called operation
+		:param int sent: The size of the request body, in bytes
+		:param response: The :class:`requests.Response`, if there was one
+		'''
+		
+		with self.lock:
+			self.calls[name] += 1
+			self.bytes_sent += sent
+			if response is not None:
+				self.bytes_received += len(response.content)
+				
+				# Keep a reference to the connection pool, so we can read its
+				# connection counters at exit even if it's been evicted
+				pool = getattr(response.raw, '_pool', None)
+				if pool is not None:
+					self.pools[id(pool)] = pool
+			
+			if response is None or response.status_code != 200:
+				self.failures[node] += 1
+	
+	def record_timeout(self, node):
+		'''Records a call to a node that timed out.'''
+		
+		with self.lock:
+			self.timeouts[node] += 1
+	
+	def get_connection_counts(self):
+		'''Returns a tuple of ``(opened, reused)`` connection counts.'''
+		
+		opened = sum(getattr(pool, 'num_connections', 0) for pool in six.itervalues(self.pools))
+		requests = sum(getattr(pool, 'num_requests', 0) for pool in six.itervalues(self.pools))
+		return (opened, max(requests - opened, 0))
+	
+	def get_peak_rss(self):
+		'''Returns the peak resident set size in bytes, or None if unknown.'''
+		
+		if resource is None:
+			return None
+		
+		# ru_maxrss is in bytes on OSX, but kilobytes everywhere else
+		rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+		return rss if sys.platform == 'darwin' else rss * 1024
+	
+	def summary(self):
+		'''Returns the collected counters as a list of lines.'''
+		
+		times = os.times()
+		opened, reused = self.get_connection_counts()
+		rss = self.get_peak_rss()
+		
+		lines = [
+			u"Wall time:     {0:.3f}s".format(time.time() - self.started),
+			u"CPU time:      {0:.3f}s (user {1:.3f}s, system {2:.3f}s)".format(times[0] + times[1], times[0], times[1]),
+			u"Peak RSS:      {0}".format(u"{0:.1f} MiB".format(rss / 1048576.0) if rss is not None else u"-"),
+			u"Bytes sent:    {0}".format(self.bytes_sent),
+			u"Bytes recv:    {0}".format(self.bytes_received),
+			u"Connections:   {0} opened, {1} reused".format(opened, reused),
+			u"SOAP calls:    {0}".format(sum(six.itervalues(self.calls))),
+		]
+		
+		for name, count in sorted(six.iteritems(self.calls)):
+			lines.append(u"  {name}: {count}".format(name=name, count=count))
+		
+		problem_nodes = nodesort(list(set(self.failures) | set(self.timeouts)))
+		if problem_nodes:
+			lines.append(u"Node failures:")
+			for node in problem_nodes:
+				lines.append(u"  {node}: {failures} failed, {timeouts} timed out".format(node=node,
+					failures=self.failures.get(node, 0), timeouts=self.timeouts.get(node, 0)))
+		
+		return lines
+	
+	def print_summary(self, file=sys.stderr):
+		'''Prints a summary of the collected counters.'''
+		
+		if not self.enabled:
+			return
+		
+		print(u"", file=file)
+		for line in self.summary():
+			print(line, file=file)
+
+stats = RunStats()
@@ -3,18 +3,49 @@ import six
 import sys
 import os
 import re
+import time
+import inspect
 import datetime
 import arrow
 from base64 import b64decode, b64encode
 from collections import OrderedDict
-from concurrent.futures import ThreadPoolExecutor, wait
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+from six.moves.queue import Queue, Empty, Full
+from threading import Event
 from dateutil import tz
 from natsort import natsorted
 from .config import config
 
 executor = ThreadPoolExecutor(64)
 
-def async_dispatch(tasks):
+class Deadline(object):
+	'''A global time budget for the whole invocation.
+	
+	Once started, :func:`async_dispatch` will stop waiting for jobs when it
+	runs out, and SOAP calls will have their timeouts capped to what's left.
+	
+	:ivar float at: The UNIX time the deadline expires at, or None
+	:ivar bool missed: Set to True if anything was cut short by the deadline
+	'''
+	
+	at = None
+	missed = False
+	
+	def start(self, seconds):
+		'''Starts the deadline, expiring the given number of seconds from now.'''
+		self.at = time.time() + seconds
+	
+	def time_left(self):
+		'''Returns the number of seconds left, or None if there's no deadline.'''
+		return max(self.at - time.time(), 0) if self.at is not None else None
+	
+	@property
+	def expired(self):
+		return self.at is not None and time.time() >= self.at
+
+deadline = Deadline()
+
+def async_dispatch(tasks, timeout=None, default=None):
 	'''Dispatches jobs into a thread pool.
 	
 	This will take a set of jobs as a dictionary in the form::
@@ -22,15 +53,217 @@ def async_dispatch(tasks):
 	    { 'key': (callable, args, kwargs) }
 	
 	And dispatch it into a thread pool, completing the tasks asynchronously,
-	and returning the results. This will take as long as the slowest job.'''
+	and returning the results. This will take as long as the slowest job.
+	
+	If the global :data:`deadline` (or the given timeout, whichever comes
+	first) runs out before all jobs are done, the remaining ones are cancelled
+	and their results are reported as ``default``.
+	
+	:param float timeout: The maximum number of seconds to wait
+	:param default: The result for jobs that didn't finish in time
+	'''
+	
+	return dict(iter_dispatch(tasks, timeout, default))
+
+def iter_dispatch(tasks, timeout=None, default=None):
+	'''Like :func:`async_dispatch`, but yields ``(key, result)`` tuples as
+	jobs finish, rather than waiting for all of them; for reporting progress
+	on long-running jobs as it's made.'''
+	
+	time_left = deadline.time_left()
+	limited_by_deadline = time_left is not None and (timeout is None or time_left <= timeout)
+	if limited_by_deadline:
+		timeout = time_left
 	
 	futures = {
 		executor.submit(v[0], *(v[1] if len(v) >= 2 else []), **(v[2] if len(v) >= 3 else {})): k
 		for k, v in six.iteritems(tasks)
 	}
-	done, not_done = wait(futures)
 	
-	return { futures[future]: future.result() for future in done }
+	done = set()
+	try:
+		for future in as_completed(futures, timeout=timeout):
+			done.add(future)
+			yield (futures[future], future.result())
+	except FuturesTimeoutError:
+		if limited_by_deadline:
+			deadline.missed = True
+		for future in futures:
+			if not future in done:
+				future.cancel()
+				yield (futures[future], default)
+
+def iter_dispatch_grouped(groups, concurrency, timeout=None, default=None):
+	'''Like :func:`iter_dispatch`, but runs at most ``concurrency`` jobs from
+	each group at a time; eg. to not overload a node with calls.
+	
+	Jobs are given as ``{ group: { key: (callable, args, kwargs) } }``, and
+	keys must be unique across groups. Every group gets up to ``concurrency``
+	workers in the thread pool, which take its jobs in turn, so no pool
+	threads are left waiting for a busy group while other groups could run.'''
+	
+	time_left = deadline.time_left()
+	limited_by_deadline = time_left is not None and (timeout is None or time_left <= timeout)
+	if limited_by_deadline:
+		timeout = time_left
+	until = time.time() + timeout if timeout is not None else None
+	
+	results = Queue()
+	cancelled = Event()
+	
+	def work(jobs):
+		while not cancelled.is_set():
+			try:
+				key, v = jobs.get_nowait()
+			except Empty:
+				return
+			try:
+				results.put((key, v[0](*(v[1] if len(v) >= 2 else []), **(v[2] if len(v) >= 3 else {})), None))
+			except Exception:
+				results.put((key, None, sys.exc_info()))
+	
+	pending = set()
+	for tasks in six.itervalues(groups):
+		jobs = Queue()
+		for key, v in six.iteritems(tasks):
+			jobs.put((key, v))
+			pending.add(key)
+		for _ in range(min(concurrency, len(tasks))):
+			executor.submit(work, jobs)
+	
+	try:
+		while pending:
+			try:
+				key, result, error = results.get(timeout=max(until - time.time(), 0) if until is not None else None)
+			except Empty:
+				if limited_by_deadline:
+					deadline.missed = True
+				for key in list(pending):
+					yield (key, default)
+				return
+			
+			pending.discard(key)
+			if error is not None:
+				six.reraise(*error)
+			yield (key, result)
+	finally:
+		# Don't start any more jobs if we're not waiting for them
+		cancelled.set()
+
+def iter_pages(node, name, hql, page_size):
+	'''Pages through a node's queue or history, yielding ``(code, items)``.
+	
+	``name`` is the call to make, ``mailQueue`` or ``mailHistory``. Stops
+	after the last page, or the first failed call. ``hql`` may be a function
+	taking the node, and returning the query to use for it.'''
+	
+	if callable(hql):
+		hql = hql(node)
+	
+	offset = 0
+	call = getattr(node.service, name)
+	while True:
+		code, result = call(filter=hql, offset=offset or None, limit=page_size)
+		if code != 200:
+			yield (code, [])
+			return
+		
+		items = result['result']['item'] if 'item' in result['result'] else []
+		yield (code, items)
+		if len(items) < page_size:
+			return
+		offset += page_size
+
+def iter_all_pages(nodes, name, hql, page_size):
+	'''Pages through the queue or history of many nodes at once.
+	
+	Every node is paged through with :func:`iter_pages` in the thread pool,
+	and pages are yielded as ``(node, code, items)`` in the calling thread as
+	they arrive, so they can be processed or written somewhere that isn't
+	thread safe. The last page from each node has the final status code.
+	
+	If the generator isn't consumed to the end (eg. because the consumer
+	raised an exception), the threads fetching pages stop after the page
+	they're on.'''
+	
+	queue = Queue(maxsize=len(nodes) * 4)
+	cancelled = Event()
+	
+	def put(item):
+		# Don't wait forever for a consumer that's gone
+		while not cancelled.is_set():
+			try:
+				queue.put(item, timeout=0.1)
+				return True
+			except Full:
+				pass
+		return False
+	
+	def fetch(node):
+		try:
+			for code, items in iter_pages(node, name, hql, page_size):
+				if not put((node, code, items)):
+					return
+		finally:
+			put((node, None, None))
+	
+	futures = [executor.submit(fetch, node) for node in nodes]
+	remaining = len(futures)
+	try:
+		while remaining:
+			node, code, items = queue.get()
+			if items is None:
+				remaining -= 1
+			else:
+				yield (node, code, items)
+	finally:
+		cancelled.set()
+	
+	# Pass on anything that went wrong
+	for future in futures:
+		future.result()
+
+def read_queue_ids(lines, nodes):
+	'''Reads a list of queue IDs, returning ``{ node: [id, ...] }``.
+	
+	Every line is a node name followed by an ID, separated by whitespace or a
+	comma, so the output of eg. ``-f csv query -f node,queueid`` works. Queue
+	IDs are only unique within a node, so a line may only be just an ID if
+	there's a single node to look for it on. Blank
+	lines and lines starting with ``#`` are skipped, as is a first line
+	that isn't an ID, taken to be a header.
+	
+	:raises ValueError: On lines that can't be parsed, or unknown nodes
+	'''
+	
+	by_name = { node.name: node for node in nodes }
+	ids = OrderedDict((node, []) for node in nodes)
+	for i, line in enumerate(lines):
+		line = line.strip()
+		if not line or line.startswith('#'):
+			continue
+		
+		parts = [p for p in re.split(r'[\s,]+', line) if p]
+		try:
+			if len(parts) > 2:
+				raise ValueError()
+			queueid = int(parts[-1])
+		except ValueError:
+			if i == 0:
+				continue
+			raise ValueError(u"Line {0}: expected an ID, or a node and an ID: {1}".format(i + 1, line))
+		
+		if len(parts) == 1:
+			if len(ids) != 1:
+				raise ValueError(u"Line {0}: queue IDs are per node, so with more than one node, give the node too: {1}".format(i + 1, line))
+			for node_ids in six.itervalues(ids):
+				node_ids.append(queueid)
+		elif parts[0] in by_name:
+			ids[by_name[parts[0]]].append(queueid)
+		else:
+			raise ValueError(u"Line {0}: '{1}' isn't one of the selected nodes".format(i + 1, parts[0]))
+	
+	return ids
 
 def nodesort(nodes):
 	'''Sorts a list or dictionary of nodes, by cluster and name.'''
@@ -69,9 +302,49 @@ def ask_confirm(prompt, default=True):
 			continue
 		return answers[answer]
 
+_tzoffsets = {}
+_offset_suffixes = {}
+_day_strings = {}
+_epoch_ordinal = datetime.date(1970, 1, 1).toordinal()
+
+def get_tzoffset(timezone):
+	'''Returns a tzinfo object for a UTC offset, in hours.
+	
+	These are cached, as there are only ever a handful of distinct offsets in
+	use, but they may be needed for hundreds of thousands of values.'''
+	
+	try:
+		return _tzoffsets[timezone]
+	except KeyError:
+		tzinfo = _tzoffsets[timezone] = tz.tzoffset(None, timezone*60*60 if timezone else 0)
+		return tzinfo
+
 def get_date(s, timezone=0):
 	'''Returns a timezone-adjusted date as an arrow object.'''
-	return arrow.get(arrow.get(s).naive, tz.tzoffset(None, timezone*60*60 if timezone else 0))
+	return arrow.get(arrow.get(s).naive, get_tzoffset(timezone))
+
+def format_timestamp(timestamp, timezone=0):
+	'''Formats a UNIX timestamp as an ISO 8601 string, with a UTC offset.
+	
+	This gives the same result as ``str(get_date(timestamp, timezone))``, but
+	integer timestamps are formatted arithmetically, with the date part and
+	UTC offset cached, rather than going through arrow for every value.'''
+	
+	if not isinstance(timestamp, six.integer_types) or isinstance(timestamp, bool):
+		return six.text_type(get_date(timestamp, timezone))
+	
+	try:
+		suffix = _offset_suffixes[timezone]
+	except KeyError:
+		suffix = _offset_suffixes[timezone] = datetime.datetime(2000, 1, 1, tzinfo=get_tzoffset(timezone)).isoformat()[19:]
+	
+	days, seconds = divmod(timestamp, 86400)
+	try:
+		day = _day_strings[days]
+	except KeyError:
+		day = _day_strings[days] = datetime.date.fromordinal(_epoch_ordinal + days).isoformat()
+	
+	return u"{0}T{1:02d}:{2:02d}:{3:02d}{4}".format(day, seconds // 3600, seconds // 60 % 60, seconds % 60, suffix)
 
 filter_timestamp_re = re.compile(r'\{([^}]*)\}')
 def hql_from_filters(filters, timezone=0):
@@ -111,7 +384,72 @@ def to_base64(s):
 		s = s.encode('utf-8', 'replace')
 	return b64encode(s).decode('utf-8', 'replace')
 
-def textualize(item, raw=False):
+converters = {}
+_resolved_converters = {}
+
+def format_timedelta(item):
+	'''Formats a timedelta as a short, human-readable duration.'''
+	
+	s = u""
+	if item > datetime.timedelta(days=1):
+		s += u"{d}d "
+	if item > datetime.timedelta(hours=1):
+		s += u"{h}h "
+	if item > datetime.timedelta(minutes=1):
+		s += u"{m}m "
+	if not s:
+		s = u"{s}s"
+	return s.rstrip().format(d=item.days, h=item.seconds // 3600, m=(item.seconds // 60) % 60, s=item.seconds)
+
+def register_converter(type_, human, raw=None):
+	'''Registers output converters for a type, and its subclasses.
+	
+	Converters are single-argument functions, taking a value and returning its
+	output form; ``human`` is used by default, and ``raw`` when the user asks
+	for raw output (defaults to ``human``). A converter registered for a
+	subclass takes priority over one for its parent class, so for instance a
+	:class:`halonctl.roles.Role` subclass can provide a faster path than the
+	generic one, which calls :func:`human() <halonctl.roles.Role.human>` or
+	:func:`raw() <halonctl.roles.Role.raw>`.
+	'''
+	
+	converters[type_] = (human, raw or human)
+	_resolved_converters.clear()
+
+def get_converter(type_, raw=False, native=False):
+	'''Returns the output converter for a type.
+	
+	Lookups are cached, so calling this for every value is cheap, but
+	formatters should rather look up a converter once per column.
+	
+	:param bool raw: Get the raw (machine-readable) converter
+	:param bool native: Leave numbers, booleans and None as they are, rather than making them text
+	'''
+	
+	key = (type_, raw, native)
+	try:
+		return _resolved_converters[key]
+	except KeyError:
+		pass
+	
+	# Machine-readable formats have their own null and booleans, and a field
+	# shouldn't change type from one row to the next depending on its value
+	if native and (type_ is type(None) or issubclass(type_, six.integer_types + (float,))):
+		converter = _identity
+	else:
+		converter = six.text_type
+		for t in inspect.getmro(type_):
+			if t in converters:
+				converter = converters[t][1 if raw else 0]
+				break
+	
+	_resolved_converters[key] = converter
+	return converter
+
+def _identity(item):
+	return item
+
+def textualize(item, raw=False, native=False):
 	'''
 	Performs output conversion of the given item.
 	
@@ -123,36 +461,18 @@ def textualize(item, raw=False):
 	* :class:`halonctl.models.Node`
 	* :class:`halonctl.models.NodeList`
 	
+	More can be added with :func:`register_converter`.
+	
 	:param bool raw: Be explicit and machine-readable over human-readable
+	:param bool native: Leave numbers, booleans and None as they are, rather than making them text
 	'''
 	
-	from .roles import Role
-	from .models import Node, NodeList
-	
-	if item is None:
-		return u"-" if not raw else None
-	elif item is True:
-		return u"Yes" if not raw else True
-	elif item is False:
-		return u"No" if not raw else False
-	elif isinstance(item, datetime.timedelta):
-		if not raw:
-			s = u""
-			if item > datetime.timedelta(days=1):
-				s += u"{d}d "
-			if item > datetime.timedelta(hours=1):
-				s += u"{h}h "
-			if item > datetime.timedelta(minutes=1):
-				s += u"{m}m "
-			return s.rstrip().format(d=item.days, h=item.seconds // 3600, m=(item.seconds // 60) % 60)
-		else:
-			return int(item.total_seconds())
-	elif isinstance(item, Role):
-		return item.human() if not raw else item.raw()
-	elif isinstance(item, Node) or isinstance(item, NodeList):
-		return item.name
-	return six.text_type(item)
-	
+	return get_converter(type(item), raw, native)(item)
+
+register_converter(type(None), lambda item: u"-", lambda item: None)
+register_converter(bool, lambda item: u"Yes" if item else u"No", _identity)
+register_converter(datetime.timedelta, format_timedelta, lambda item: int(item.total_seconds()))
+
 def group_by(data, key, unique):
 	'''Groups a set of data by a key.
 	
@@ -165,7 +485,7 @@ def group_by(data, key, unique):
 	d = {}
 	for row in data:
 		k = row.get(key, None)
-		if not key:
+		if not unique:
 			if not k in d:
 				d[k] = []
 			d[k].append(row)
@@ -196,6 +516,21 @@ def get_terminal_size(fd=sys.stderr, fallback=(80, 24)):
 			pass
 	return size
 
+def rename_atomic(src, dst):
+	'''Renames a file, replacing the destination if it exists.
+	
+	On POSIX systems, readers of ``dst`` will see either the old or the new
+	file, never a partially written one.'''
+	
+	replace = getattr(os, 'replace', None)
+	if replace:
+		replace(src, dst)
+	else:
+		# Python 2 lacks os.replace(), and os.rename() won't overwrite on Windows
+		if os.name == 'nt' and os.path.exists(dst):
+			os.remove(dst)
+		os.rename(src, dst)
+
 def open_fuzzy(name, *args, **kwargs):
 	'''Opens a file, expanding tildes and creating intermediary directories.'''
 	path = os.path.abspath(os.path.expanduser(name))
@@ -38,11 +38,14 @@ setup(name='halonctl',
 		'keyring',		# Secure credential storage
 		'natsort',		# Natural sorting of node names
 		'suds-jurko',	# SOAP client library; improved fork of suds
-		'prettytable',	# Fancy ASCII tables, feat. Py3 compatibility
 		'blessings',	# Portable TTY abstractions
 		'requests',		# "HTTP for Humans"
 		'six',			# Python 2/3 compatibility utilities
 	],
+	extras_require={
+		'msgpack': ['msgpack'],	# MessagePack output format
+		'numpy': ['numpy'],		# Loading query exports into NumPy arrays
+	},
 	package_data={
 		'': ['*.json']
 	},
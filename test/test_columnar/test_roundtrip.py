@@ -0,0 +1,72 @@
+import unittest
+import io
+from halonctl.columnar import Writer, Reader, encode_column, decode_column, expand_column, INT, STR
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+class Buffer(io.BytesIO):
+	'''Keeps its contents around after being closed.'''
+	
+	def close(self):
+		self.data = self.getvalue()
+		io.BytesIO.close(self)
+
+class TestColumnar(unittest.TestCase):
+	columns = ['node', 'time', 'size', 'to']
+	rows = [
+		[u"n{0}".format(i % 3), 1400000000 + i, None if i % 7 == 0 else i * 3, None if i % 5 == 0 else u"r{0}.org".format(i % 4)]
+		for i in range(2500)
+	]
+	
+	def write(self, rows, row_group_size=1000):
+		f = Buffer()
+		with Writer(f, self.columns, row_group_size) as writer:
+			for row in rows:
+				writer.write(row)
+		return f.data
+	
+	def test_columns(self):
+		self.assertEqual(encode_column([1, None, 3])[0], INT)
+		self.assertEqual(encode_column([1, u"a"])[0], STR)
+		for values in ([1, None, -3], [u"a", None, u"b", u"a", 5]):
+			type_, blocks = encode_column(values)
+			self.assertEqual(expand_column(type_, decode_column(type_, blocks)), [u"5" if v == 5 else v for v in values])
+	
+	def test_roundtrip(self):
+		reader = Reader(io.BytesIO(self.write(self.rows)))
+		self.assertEqual(reader.columns, self.columns)
+		self.assertEqual(list(reader), self.rows)
+	
+	def test_empty(self):
+		self.assertEqual(list(Reader(io.BytesIO(self.write([])))), [])
+	
+	def test_compact(self):
+		self.assertLess(len(self.write(self.rows)), 2500 * 8)
+	
+	def test_invalid(self):
+		with self.assertRaises(ValueError):
+			Reader(io.BytesIO(b"node,time\n"))
+		with self.assertRaises(ValueError):
+			list(Reader(io.BytesIO(self.write(self.rows)[:-100])))
+	
+	def test_aborted(self):
+		f = Buffer()
+		with self.assertRaises(KeyError):
+			with Writer(f, self.columns, 1000) as writer:
+				for row in self.rows:
+					writer.write(row)
+				raise KeyError()
+		with self.assertRaises(ValueError):
+			list(Reader(io.BytesIO(f.data)))
+	
+	@unittest.skipIf(numpy is None, "NumPy is not installed")
+	def test_numpy(self):
+		arrays = Reader(io.BytesIO(self.write(self.rows))).to_numpy()
+		self.assertEqual(arrays['time'].dtype, numpy.int64)
+		self.assertEqual(len(arrays['size']), 2500)
+		self.assertTrue(arrays['size'].mask[0])
+		self.assertEqual(arrays['size'][1], 3)
+		self.assertEqual(list(arrays['to'][:2]), [None, u"r1.org"])
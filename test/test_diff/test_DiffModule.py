@@ -0,0 +1,86 @@
+import unittest
+import os
+import shutil
+import tempfile
+from argparse import Namespace
+from halonctl.columnar import Writer
+from halonctl.modules.diff import DiffModule
+
+COLUMNS = ['node', 'queueid', 'to', 'retry']
+
+class TestDiffModule(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+	
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+	
+	def write(self, name, rows, columns=COLUMNS):
+		path = os.path.join(self.dir, name)
+		with Writer(open(path, 'wb'), columns) as writer:
+			for row in rows:
+				writer.write(row)
+		return path
+	
+	def diff(self, before, after, **kwargs):
+		module = DiffModule()
+		args = Namespace(before=before, after=after, by=kwargs.get('by', 'domain'), list=kwargs.get('list', False))
+		rows = [list(row) for row in module.run(None, args)]
+		return module.exitcode, rows
+	
+	def write_pair(self):
+		before = self.write('before', [
+			[u"n1", 1, u"a@x.org", 0],
+			[u"n1", 2, u"b@y.org", 0],
+			[u"n2", 1, u"c@x.org", 1],
+		])
+		after = self.write('after', [
+			[u"n2", 1, u"c@x.org", 2],
+			[u"n1", 1, u"a@x.org", 0],
+			[u"n2", 3, u"d@x.org", 0],
+		])
+		return before, after
+	
+	def test_summarize(self):
+		exitcode, rows = self.diff(*self.write_pair())
+		self.assertEqual(exitcode, 0)
+		self.assertEqual(rows, [
+			[u"Domain", u"Before", u"After", u"Added", u"Removed", u"Retried"],
+			[u"x.org", 2, 3, 1, 0, 1],
+			[u"y.org", 1, 0, 0, 1, 0],
+		])
+	
+	def test_summarize_by_node(self):
+		exitcode, rows = self.diff(*self.write_pair(), by='node')
+		self.assertEqual(rows[1:], [
+			[u"n2", 1, 2, 1, 0, 1],
+			[u"n1", 2, 1, 0, 1, 0],
+		])
+	
+	def test_list_changes(self):
+		exitcode, rows = self.diff(*self.write_pair(), list=True)
+		self.assertEqual(exitcode, 0)
+		self.assertEqual(rows, [
+			[u"Change", u"Node", u"Queue ID", u"From", u"To", u"Retries"],
+			[u"removed", u"n1", 2, None, u"b@y.org", 0],
+			[u"retried", u"n2", 1, None, u"c@x.org", 2],
+			[u"added", u"n2", 3, None, u"d@x.org", 0],
+		])
+	
+	def test_duplicates(self):
+		before, after = self.write_pair()
+		duplicated = self.write('duplicated', [
+			[u"n1", 1, u"a@x.org", 0],
+			[u"n1", 1, u"b@x.org", 0],
+		])
+		self.assertEqual(self.diff(before, duplicated)[0], 1)
+		self.assertEqual(self.diff(duplicated, after, list=True)[0], 1)
+	
+	def test_history(self):
+		before, after = self.write_pair()
+		history = self.write('history', [[u"n1", 1, u"a@x.org", 7]], ['node', 'queueid', 'to', 'historyid'])
+		self.assertEqual(self.diff(before, history), (1, []))
+	
+	def test_missing(self):
+		before, after = self.write_pair()
+		self.assertEqual(self.diff(before, os.path.join(self.dir, 'nope')), (1, []))
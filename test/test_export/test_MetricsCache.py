@@ -0,0 +1,84 @@
+import unittest
+from argparse import Namespace
+from halonctl.modules.export import MetricsCache, Poller, escape_label
+from halonctl.models import Node, NodeList
+
+class FakeService(object):
+	def __init__(self):
+		self.uptime = (200, 3600)
+	
+	def getUptime(self):
+		if isinstance(self.uptime, Exception):
+			raise self.uptime
+		return self.uptime
+	
+	def statList(self, *keys, **kwargs):
+		return (500, None)
+
+class FakeCommand(object):
+	def all(self):
+		return u"queue=5\nqueue.deferred=2\n"
+
+class FakeNode(Node):
+	fake_service = None
+	
+	@property
+	def service(self):
+		return self.fake_service
+	
+	def command(self, *args):
+		return (200, FakeCommand())
+
+class TestMetricsCache(unittest.TestCase):
+	def setUp(self):
+		self.cache = MetricsCache()
+		self.cluster = NodeList()
+		self.cluster.name = u"c1"
+		self.node = FakeNode("http://0.0.0.1", 'n1', self.cluster)
+		self.node.fake_service = FakeService()
+		self.poller = Poller([self.node], Namespace(counters=['queue'], stats=[['.', '.', '.']], interval=15), self.cache)
+	
+	def poll_all(self):
+		for query in self.poller.get_queries():
+			self.poller.poll(self.node, query)
+	
+	def test_escape_label(self):
+		self.assertEqual(escape_label(u'a "b"\\c\nd'), u'a \\"b\\"\\\\c\\nd')
+	
+	def test_render(self):
+		self.cache.update(('n1', 'x'), [('halon_up', [('node', u'n"1')], 1), ('halon_uptime_seconds', [('node', u'n"1')], 60)])
+		self.assertEqual(self.cache.render(), u"\n".join([
+			u"# HELP halon_up Whether the node answered the last uptime poll",
+			u"# TYPE halon_up gauge",
+			u'halon_up{node="n\\"1"} 1',
+			u"# HELP halon_uptime_seconds Node uptime, in seconds",
+			u"# TYPE halon_uptime_seconds gauge",
+			u'halon_uptime_seconds{node="n\\"1"} 60',
+		]) + u"\n")
+	
+	def test_poll(self):
+		self.poll_all()
+		rendered = self.cache.render()
+		self.assertIn(u'halon_up{cluster="c1",node="n1"} 1', rendered)
+		self.assertIn(u'halon_uptime_seconds{cluster="c1",node="n1"} 3600', rendered)
+		self.assertIn(u'halon_statd{cluster="c1",node="n1",counter="queue",key="queue.deferred"} 2', rendered)
+		
+		# The failed statList poll just doesn't show up
+		self.assertNotIn(u"halon_stat_count", rendered)
+	
+	def test_poll_down(self):
+		self.poll_all()
+		self.node.fake_service.uptime = (0, None)
+		self.poller.poll(self.node, ('uptime', None))
+		self.assertEqual(self.cache.render().splitlines()[2:], [u'halon_up{cluster="c1",node="n1"} 0'])
+	
+	def test_poll_exception(self):
+		self.poll_all()
+		self.node.fake_service.uptime = ValueError("boom")
+		self.poller.poll(self.node, ('uptime', None))
+		self.assertEqual(self.cache.render().splitlines()[2:], [u'halon_up{cluster="c1",node="n1"} 0'])
+		
+		# It's back
+		self.node.fake_service.uptime = (200, 10)
+		self.poll_all()
+		self.assertIn(u'halon_up{cluster="c1",node="n1"} 1', self.cache.render())
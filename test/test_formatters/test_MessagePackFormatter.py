@@ -0,0 +1,43 @@
+import unittest
+import io
+from halonctl.formatters.msgpack_ import formatter
+
+try:
+	import msgpack
+except ImportError:
+	msgpack = None
+
+class Args(object):
+	raw = False
+	group_by = None
+	group_key = False
+
+@unittest.skipIf(msgpack is None, "msgpack is not installed")
+class TestMessagePackFormatter(unittest.TestCase):
+	def setUp(self):
+		self.args = Args()
+		self.data = [(u"Name", u"Queue Size"), (u"a", 1), (u"b", None)]
+	
+	def unpack(self, data):
+		return list(msgpack.Unpacker(io.BytesIO(data), raw=False))
+	
+	def test_run(self):
+		self.assertEqual(self.unpack(formatter.run(self.data, self.args)),
+			[{u"name": u"a", u"queue_size": 1}, {u"name": u"b", u"queue_size": None}])
+	
+	def test_raw(self):
+		self.args.raw = True
+		self.assertEqual(self.unpack(formatter.run(self.data, self.args))[1], {u"name": u"b", u"queue_size": None})
+	
+	def test_bool(self):
+		data = [(u"Name", u"Online"), (u"a", True)]
+		self.assertEqual(self.unpack(formatter.run(data, self.args)), [{u"name": u"a", u"online": True}])
+	
+	def test_stream(self):
+		buf = io.BytesIO()
+		formatter.stream(iter(self.data), self.args, buf)
+		self.assertEqual(buf.getvalue(), formatter.run(self.data, self.args))
+	
+	def test_grouped(self):
+		self.args.group_by = u"name"
+		self.assertEqual(len(self.unpack(formatter.run(self.data, self.args))), 2)
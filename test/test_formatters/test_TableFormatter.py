@@ -0,0 +1,30 @@
+# -*- coding=utf-8 -*-
+import unittest
+from six.moves import StringIO
+from halonctl.formatters.table import formatter, display_width
+
+class Args(object):
+	raw = False
+
+class TestTableFormatter(unittest.TestCase):
+	def test_display_width(self):
+		self.assertEqual(display_width(u"abc"), 3)
+		self.assertEqual(display_width(u"åäö"), 3)
+		self.assertEqual(display_width(u"日本"), 4)
+		self.assertEqual(display_width(u"é"), 1)
+	
+	def test_format(self):
+		data = [(u"Name", u"Uptime"), (u"n1", None), (u"nodename2", u"5d")]
+		expected = u"Name       Uptime  \nn1         -       \nnodename2  5d      "
+		self.assertEqual(formatter.run(data, Args()), expected)
+	
+	def test_wide_characters(self):
+		data = [(u"Subject", u"X"), (u"日本", u"a"), (u"abcde", u"b")]
+		expected = u"Subject  X  \n日本     a  \nabcde    b  "
+		self.assertEqual(formatter.run(data, Args()), expected)
+	
+	def test_stream(self):
+		data = [(u"Name", u"Uptime"), (u"n1", None), (u"nodename2", u"5d")]
+		buf = StringIO()
+		formatter.stream(iter(data), Args(), buf)
+		self.assertEqual(buf.getvalue(), formatter.run(data, Args()) + u"\n")
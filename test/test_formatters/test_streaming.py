@@ -0,0 +1,48 @@
+import unittest
+from six.moves import StringIO
+from halonctl.formatters.csv_ import formatter as csv_formatter
+from halonctl.formatters.json_ import formatter as json_formatter
+from halonctl.formatters.ndjson_ import formatter as ndjson_formatter
+
+class Args(object):
+	raw = False
+	group_by = None
+	group_key = False
+
+class TestStreaming(unittest.TestCase):
+	def setUp(self):
+		self.args = Args()
+		self.data = [(u"Name", u"Value"), (u"a", 1), (u"b", None)]
+	
+	def stream(self, formatter, data):
+		buf = StringIO()
+		formatter.stream(iter(data), self.args, buf)
+		return buf.getvalue()
+	
+	def test_csv(self):
+		self.assertEqual(self.stream(csv_formatter, self.data), csv_formatter.run(self.data, self.args))
+	
+	def test_json(self):
+		self.assertEqual(self.stream(json_formatter, self.data), json_formatter.run(self.data, self.args) + u"\n")
+	
+	def test_json_empty(self):
+		self.assertEqual(self.stream(json_formatter, self.data[:1]), u"[]\n")
+	
+	def test_json_grouped(self):
+		self.args.group_by = u"name"
+		self.args.group_key = True
+		self.assertEqual(self.stream(json_formatter, self.data), json_formatter.run(self.data, self.args) + u"\n")
+	
+	def test_ndjson(self):
+		expected = u'{"name":"a","value":1}\n{"name":"b","value":null}\n'
+		self.assertEqual(self.stream(ndjson_formatter, self.data), expected)
+	
+	def test_ndjson_bool(self):
+		expected = u'{"name":"a","value":true}\n{"name":"b","value":false}\n'
+		self.assertEqual(self.stream(ndjson_formatter, [(u"Name", u"Value"), (u"a", True), (u"b", False)]), expected)
+	
+	def test_generator(self):
+		def gen():
+			for row in self.data:
+				yield row
+		self.assertEqual(self.stream(csv_formatter, gen()), csv_formatter.run(self.data, self.args))
@@ -0,0 +1,79 @@
+import unittest
+import socket
+import time
+from halonctl.health import HealthStore, probe
+from halonctl.models import Node
+from halonctl.config import config
+
+class TestHealthStore(unittest.TestCase):
+	def setUp(self):
+		self.store = HealthStore()
+		self.node = Node("http://127.0.0.1:1", 'n1')
+	
+	def tearDown(self):
+		config.pop('health', None)
+	
+	def test_not_tripped(self):
+		self.assertFalse(self.store.is_tripped(self.node))
+		self.assertTrue(self.store.allow(self.node))
+	
+	def test_tripped(self):
+		self.store.record_failure(self.node)
+		self.assertTrue(self.store.is_tripped(self.node))
+	
+	def test_threshold(self):
+		config['health'] = { 'threshold': 2 }
+		self.store.record_failure(self.node)
+		self.assertFalse(self.store.is_tripped(self.node))
+		self.store.record_failure(self.node)
+		self.assertTrue(self.store.is_tripped(self.node))
+	
+	def test_cooldown(self):
+		self.store.record_failure(self.node)
+		self.store.entries[self.store.get_key(self.node)]['last_failure'] = time.time() - 3600
+		self.assertFalse(self.store.is_tripped(self.node))
+	
+	def test_success_resets(self):
+		self.store.record_failure(self.node)
+		self.store.record_success(self.node)
+		self.assertFalse(self.store.is_tripped(self.node))
+	
+	def test_force(self):
+		self.store.record_failure(self.node)
+		self.store.force = True
+		self.assertTrue(self.store.allow(self.node))
+	
+	def test_get_address(self):
+		self.assertEqual(self.store.get_address(self.node), ('127.0.0.1', 1))
+		self.assertEqual(self.store.get_address(Node("https://10.2.0.30")), ('10.2.0.30', 443))
+		self.assertEqual(self.store.get_address(Node("10.2.0.30")), ('10.2.0.30', 80))
+	
+	def test_probe(self):
+		listener = socket.socket()
+		listener.bind(('127.0.0.1', 0))
+		listener.listen(1)
+		try:
+			self.assertTrue(probe('127.0.0.1', listener.getsockname()[1], 1))
+		finally:
+			listener.close()
+	
+	def test_tripped_probe_fails(self):
+		self.store.record_failure(self.node)
+		self.assertFalse(self.store.allow(self.node))
+	
+	def test_probe_expires(self):
+		listener = socket.socket()
+		listener.bind(('127.0.0.1', 0))
+		node = Node("http://127.0.0.1:{0}".format(listener.getsockname()[1]), 'n2')
+		try:
+			self.store.record_failure(node)
+			self.assertFalse(self.store.allow(node))
+			
+			# The node comes back, but only gets a real call after the
+			# cooldown, which fails; that shouldn't leave it tripped by the
+			# old probe once it's listening again
+			listener.listen(1)
+			self.store.record_failure(node)
+			self.assertTrue(self.store.allow(node))
+		finally:
+			listener.close()
@@ -0,0 +1,17 @@
+import unittest
+from halonctl.hql import tokenize_hql, facet_condition, quote_value
+
+class TestFacetCondition(unittest.TestCase):
+	def test_quote_value(self):
+		self.assertEqual(quote_value(u"a@b.com"), u"a@b.com")
+		self.assertEqual(quote_value(u""), u'""')
+		self.assertEqual(quote_value(u"a b"), u'"a b"')
+	
+	def test_facet_condition(self):
+		self.assertEqual(facet_condition('transport', u"mailtransport:1"), u"transport=mailtransport:1")
+		self.assertEqual(facet_condition('todomain', u"example.com"), u"to~%@example.com")
+		self.assertEqual(tokenize_hql(facet_condition('from', u'a "b" (c)')), [('condition', (u"from", u"=", u'a "b" (c)'))])
+		self.assertEqual(facet_condition('todomain', u"a_b%.com"), u'to~"%@a\\\\_b\\\\%.com"')
+		self.assertEqual(tokenize_hql(facet_condition('fromdomain', u"we ird.com")), [('condition', (u"from", u"~", u"%@we ird.com"))])
+		with self.assertRaises(KeyError):
+			facet_condition('subject', u"hi")
@@ -0,0 +1,39 @@
+import unittest
+from halonctl.hql import tokenize_hql, get_time_bounds, split_time_range
+
+class TestTimeSlices(unittest.TestCase):
+	def test_tokenize(self):
+		self.assertEqual(tokenize_hql(u'(from=a OR to="b c") time>1'), [
+			('paren', u"("),
+			('condition', (u"from", u"=", u"a")),
+			('keyword', u"or"),
+			('condition', (u"to", u"=", u"b c")),
+			('paren', u")"),
+			('condition', (u"time", u">", u"1")),
+		])
+		with self.assertRaises(ValueError):
+			tokenize_hql(u"from")
+	
+	def test_time_bounds(self):
+		self.assertEqual(get_time_bounds(u"from=a"), (None, None))
+		self.assertEqual(get_time_bounds(u"time>100 time<200"), (100, 200))
+		self.assertEqual(get_time_bounds(u"time>=100 time<=200"), (99, 201))
+		self.assertEqual(get_time_bounds(u"time>100 time>150 time<300 time<200"), (150, 200))
+		with self.assertRaises(ValueError):
+			get_time_bounds(u"time>yesterday")
+	
+	def test_split(self):
+		self.assertEqual(split_time_range(100, 201, 4), [u"time<126", u"time>125 time<151", u"time>150 time<176", u"time>175"])
+		self.assertEqual(split_time_range(100, 103, 4), [u"time<102", u"time>101"])
+		self.assertEqual(split_time_range(100, 101, 4), [u""])
+	
+	def test_split_covers_range(self):
+		# Every timestamp in the range must fall into exactly one slice
+		slices = split_time_range(1000, 1100, 7)
+		for ts in range(990, 1110):
+			matches = 0
+			for s in slices:
+				conditions = [c.partition('>') if '>' in c else c.partition('<') for c in s.split()]
+				if all(ts > int(v) if op == '>' else ts < int(v) for _, op, v in conditions):
+					matches += 1
+			self.assertEqual(matches, 1)
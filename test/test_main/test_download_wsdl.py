@@ -0,0 +1,81 @@
+import unittest
+import os
+import shutil
+import tempfile
+import time
+import requests
+import halonctl.__main__
+from halonctl.__main__ import download_wsdl
+from halonctl.models import Node
+
+class FakeResponse(object):
+	def __init__(self, status_code, chunks, delay=0):
+		self.status_code = status_code
+		self.chunks = chunks
+		self.delay = delay
+		self.closed = False
+	
+	def iter_content(self, chunk_size):
+		for chunk in self.chunks:
+			time.sleep(self.delay)
+			yield chunk
+	
+	def close(self):
+		self.closed = True
+
+class TestDownloadWSDL(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.old_tempdir = tempfile.tempdir
+		tempfile.tempdir = self.dir
+		self.old_get = halonctl.__main__.requests.get
+		halonctl.__main__.requests.get = self.get
+		self.responses = {}
+	
+	def tearDown(self):
+		halonctl.__main__.requests.get = self.old_get
+		tempfile.tempdir = self.old_tempdir
+		shutil.rmtree(self.dir)
+	
+	def get(self, url, **kwargs):
+		response = self.responses[url.split('/')[2]]
+		if isinstance(response, Exception):
+			raise response
+		return response
+	
+	def read(self):
+		with open(os.path.join(self.dir, u"halonctl_wsdl.xml"), 'rb') as f:
+			return f.read()
+	
+	def test_fastest_wins(self):
+		self.responses = {
+			'slow': FakeResponse(200, [b"slow"] * 10, 0.1),
+			'fast': FakeResponse(200, [b"fast"]),
+			'ssl': requests.exceptions.SSLError(),
+		}
+		start = time.time()
+		download_wsdl([Node("slow"), Node("fast"), Node("ssl")], True)
+		self.assertLess(time.time() - start, 0.5)
+		self.assertEqual(self.read(), b"fast")
+		
+		# The loser gives up on its next chunk, and cleans up after itself
+		time.sleep(0.3)
+		self.assertTrue(self.responses['slow'].closed)
+		self.assertEqual(os.listdir(self.dir), [u"halonctl_wsdl.xml"])
+	
+	def test_ssl_error(self):
+		self.responses = {
+			'broken': FakeResponse(500, []),
+			'ssl': requests.exceptions.SSLError(),
+		}
+		with self.assertRaises(SystemExit) as cm:
+			download_wsdl([Node("broken"), Node("ssl")], True)
+		self.assertEqual(cm.exception.code, 1)
+		self.assertTrue(self.responses['broken'].closed)
+		self.assertEqual(os.listdir(self.dir), [])
+	
+	def test_none_available(self):
+		self.responses = { 'broken': FakeResponse(500, []) }
+		with self.assertRaises(SystemExit) as cm:
+			download_wsdl([Node("broken")], True)
+		self.assertNotEqual(cm.exception.code, 1)
@@ -0,0 +1,40 @@
+import unittest
+from halonctl.proxies import NodeSoapProxy, NodeListSoapProxy
+from halonctl.models import Node, NodeList
+
+class FakeProxy(NodeSoapProxy):
+	def getVersion(self):
+		return (200, u"3.5") if self.node.name != 'down' else (0, None)
+	
+	def mailQueue(self, filter=None, limit=None):
+		self.node.calls.append('mailQueue')
+		return (200, (filter, limit))
+
+class FakeNode(Node):
+	@property
+	def service(self):
+		return FakeProxy(self)
+
+class TestBatch(unittest.TestCase):
+	def setUp(self):
+		self.cluster = NodeList()
+		self.cluster.name = 'c1'
+		for name in ('n1', 'down'):
+			node = FakeNode("http://0.0.0.1", name, self.cluster)
+			node.calls = []
+			self.cluster.append(node)
+		self.n1, self.down = self.cluster
+	
+	def test_node(self):
+		results = self.n1.service.batch('getVersion', ('mailQueue', [], { 'filter': u"from=a" }), ('mailQueue', [u"to=b", 5]))
+		self.assertEqual(results, [(200, u"3.5"), (200, (u"from=a", None)), (200, (u"to=b", 5))])
+	
+	def test_unreachable(self):
+		self.assertEqual(self.down.service.batch('getVersion', 'mailQueue'), [(0, None), (0, None)])
+		self.assertEqual(self.down.calls, [])
+	
+	def test_nodelist(self):
+		results = NodeListSoapProxy(self.cluster).batch('getVersion', ('mailQueue', [], { 'limit': 1 }))
+		self.assertEqual(list(results), [self.down, self.n1])
+		self.assertEqual(results[self.n1], [(200, u"3.5"), (200, (None, 1))])
+		self.assertEqual(results[self.down], [(0, None), (0, None)])
@@ -0,0 +1,31 @@
+import unittest
+from halonctl.proxies import get_timeout, DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT
+from halonctl.config import config
+from halonctl.util import deadline
+
+class TestGetTimeout(unittest.TestCase):
+	def tearDown(self):
+		config.pop('timeouts', None)
+		deadline.at = None
+	
+	def test_defaults(self):
+		self.assertEqual(get_timeout('getUptime'), (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT))
+	
+	def test_global(self):
+		config['timeouts'] = { 'connect': 1, 'read': 2 }
+		self.assertEqual(get_timeout('getUptime'), (1, 2))
+	
+	def test_per_operation(self):
+		config['timeouts'] = { 'connect': 1, 'read': 2, 'mailQueue': { 'read': 60 } }
+		self.assertEqual(get_timeout('getUptime'), (1, 2))
+		self.assertEqual(get_timeout('mailQueue'), (1, 60))
+	
+	def test_deadline(self):
+		deadline.start(3)
+		connect, read = get_timeout('getUptime')
+		self.assertTrue(2 < connect <= 3)
+		self.assertTrue(2 < read <= 3)
+	
+	def test_deadline_expired(self):
+		deadline.start(-1)
+		self.assertIsNone(get_timeout('getUptime'))
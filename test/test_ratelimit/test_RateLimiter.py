@@ -0,0 +1,111 @@
+import unittest
+import time
+import threading
+from halonctl.ratelimit import RateLimiter, TokenBucket
+from halonctl.models import Node, NodeList
+from halonctl.config import config
+from halonctl.util import deadline
+
+class TestTokenBucket(unittest.TestCase):
+	def test_burst(self):
+		bucket = TokenBucket(10, 3)
+		self.assertEqual([bucket.reserve() for _ in range(3)], [0, 0, 0])
+		self.assertAlmostEqual(bucket.reserve(), 0.1, places=2)
+		self.assertAlmostEqual(bucket.reserve(), 0.2, places=2)
+	
+	def test_refund(self):
+		bucket = TokenBucket(10, 1)
+		bucket.reserve()
+		bucket.refund()
+		self.assertEqual(bucket.reserve(), 0)
+
+class TestRateLimiter(unittest.TestCase):
+	def setUp(self):
+		self.limiter = RateLimiter()
+		self.cluster = NodeList([Node(name="n1"), Node(name="n2")])
+		self.cluster.name = "c1"
+		for node in self.cluster:
+			node.cluster = self.cluster
+		self.n1, self.n2 = self.cluster
+	
+	def tearDown(self):
+		config.pop('rate_limits', None)
+		deadline.at = None
+		deadline.missed = False
+	
+	def test_unlimited(self):
+		self.assertEqual(self.limiter.get_limits(self.n1), [])
+		with self.limiter.limit(self.n1, 'mailQueue') as allowed:
+			self.assertTrue(allowed)
+	
+	def test_overrides(self):
+		config['rate_limits'] = { 'node': { 'rate': 5 }, 'nodes': { 'n2': { 'concurrency': 1 } }, 'cluster': { 'rate': 20 } }
+		n1_node, n1_cluster = self.limiter.get_limits(self.n1)
+		self.assertEqual(n1_node.bucket.rate, 5)
+		self.assertIsNone(n1_node.semaphore)
+		self.assertEqual(n1_cluster.bucket.rate, 20)
+		
+		n2_node, n2_cluster = self.limiter.get_limits(self.n2)
+		self.assertIsNotNone(n2_node.semaphore)
+		self.assertIs(n2_cluster, n1_cluster)
+	
+	def test_operations(self):
+		config['rate_limits'] = { 'node': { 'rate': 1, 'burst': 1 }, 'operations': ['mailQueue'] }
+		start = time.time()
+		for _ in range(3):
+			with self.limiter.limit(self.n1, 'getUptime') as allowed:
+				self.assertTrue(allowed)
+		self.assertLess(time.time() - start, 0.5)
+	
+	def test_rate(self):
+		config['rate_limits'] = { 'node': { 'rate': 20, 'burst': 1 } }
+		start = time.time()
+		for _ in range(3):
+			with self.limiter.limit(self.n1, 'mailQueue'):
+				pass
+		self.assertGreaterEqual(time.time() - start, 0.09)
+	
+	def test_concurrency(self):
+		config['rate_limits'] = { 'cluster': { 'concurrency': 2 } }
+		state = { 'active': 0, 'peak': 0 }
+		lock = threading.Lock()
+		
+		def call(node):
+			with self.limiter.limit(node, 'mailQueue'):
+				with lock:
+					state['active'] += 1
+					state['peak'] = max(state['peak'], state['active'])
+				time.sleep(0.05)
+				with lock:
+					state['active'] -= 1
+		
+		threads = [threading.Thread(target=call, args=(node,)) for node in list(self.cluster) * 3]
+		for t in threads:
+			t.start()
+		for t in threads:
+			t.join()
+		self.assertEqual(state['peak'], 2)
+	
+	def test_deadline(self):
+		config['rate_limits'] = { 'node': { 'rate': 1, 'burst': 1 } }
+		with self.limiter.limit(self.n1, 'mailQueue') as allowed:
+			self.assertTrue(allowed)
+		
+		deadline.start(0.1)
+		with self.limiter.limit(self.n1, 'mailQueue') as allowed:
+			self.assertFalse(allowed)
+	
+	def test_concurrency_deadline(self):
+		config['rate_limits'] = { 'node': { 'concurrency': 1 } }
+		with self.limiter.limit(self.n1, 'mailQueue') as allowed:
+			self.assertTrue(allowed)
+			
+			deadline.start(0.1)
+			start = time.time()
+			with self.limiter.limit(self.n1, 'mailQueue') as waited:
+				self.assertFalse(waited)
+			self.assertLess(time.time() - start, 0.5)
+		
+		deadline.at = None
+		with self.limiter.limit(self.n1, 'mailQueue') as allowed:
+			self.assertTrue(allowed)
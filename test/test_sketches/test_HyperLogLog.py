@@ -0,0 +1,36 @@
+import unittest
+from halonctl.sketches import HyperLogLog
+
+class TestHyperLogLog(unittest.TestCase):
+	def test_empty(self):
+		self.assertEqual(HyperLogLog().count(), 0)
+	
+	def test_small(self):
+		hll = HyperLogLog()
+		for i in range(100):
+			hll.add(u"user{0}@example.com".format(i % 10))
+		self.assertEqual(hll.count(), 10)
+	
+	def test_none(self):
+		hll = HyperLogLog()
+		for value in (None, u"a", None, u"b"):
+			hll.add(value)
+		self.assertEqual(hll.count(), 2)
+	
+	def test_large(self):
+		hll = HyperLogLog()
+		for i in range(50000):
+			hll.add(u"user{0}@example.com".format(i))
+		self.assertAlmostEqual(hll.count() / 50000.0, 1, delta=0.05)
+	
+	def test_merge(self):
+		a = HyperLogLog()
+		b = HyperLogLog()
+		for i in range(20000):
+			a.add(i)
+			b.add(i + 10000)
+		self.assertAlmostEqual(a.merge(b).count() / 30000.0, 1, delta=0.05)
+	
+	def test_merge_precision(self):
+		with self.assertRaises(ValueError):
+			HyperLogLog(10).merge(HyperLogLog(12))
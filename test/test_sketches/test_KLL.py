@@ -0,0 +1,44 @@
+import unittest
+import random
+import bisect
+from halonctl.sketches import KLL
+
+class TestKLL(unittest.TestCase):
+	def setUp(self):
+		rng = random.Random(7)
+		self.data = [rng.expovariate(1 / 600.0) for _ in range(100000)]
+		self.sorted = sorted(self.data)
+	
+	def assertRank(self, value, q):
+		rank = bisect.bisect(self.sorted, value) / float(len(self.sorted))
+		self.assertAlmostEqual(rank, q, delta=0.02)
+	
+	def test_empty(self):
+		self.assertEqual(KLL().quantile(0.5), None)
+	
+	def test_small(self):
+		sketch = KLL()
+		for v in [5, 1, 3]:
+			sketch.add(v)
+		self.assertEqual(sketch.quantiles([0, 0.5, 1]), [1, 3, 5])
+	
+	def test_quantiles(self):
+		sketch = KLL()
+		for v in self.data:
+			sketch.add(v)
+		self.assertEqual(len(sketch), len(self.data))
+		self.assertLess(sum(len(c) for c in sketch.compactors), 1000)
+		self.assertEqual(sketch.quantile(1), self.sorted[-1])
+		for q in (0.5, 0.9, 0.99):
+			self.assertRank(sketch.quantile(q), q)
+	
+	def test_merge(self):
+		a = KLL()
+		b = KLL()
+		for i, v in enumerate(self.data):
+			(a if i % 3 else b).add(v)
+		merged = a.merge(b)
+		self.assertEqual(len(merged), len(self.data))
+		self.assertEqual(merged.quantile(0), self.sorted[0])
+		for q in (0.5, 0.9, 0.99):
+			self.assertRank(merged.quantile(q), q)
@@ -0,0 +1,43 @@
+import unittest
+import random
+from collections import Counter
+from halonctl.sketches import SpaceSaving
+
+class TestSpaceSaving(unittest.TestCase):
+	def setUp(self):
+		rng = random.Random(42)
+		self.data = [int(rng.paretovariate(1.2)) for _ in range(20000)] + [None] * 100
+		self.expected = Counter(self.data).most_common(5)
+	
+	def test_exact_when_room(self):
+		s = SpaceSaving(100)
+		for item in [u"a", u"b", u"a", None]:
+			s.add(item)
+		self.assertEqual(s.top(2), [(u"a", 2, 0), (u"b", 1, 0)])
+		self.assertEqual(s.total, 4)
+		self.assertEqual(s.min_count(), 0)
+	
+	def test_bounded(self):
+		s = SpaceSaving(50)
+		for item in self.data:
+			s.add(item)
+		self.assertEqual(len(s), 50)
+		self.assertEqual([(item, count) for item, count, error in s.top(5)], self.expected)
+	
+	def test_error_bound(self):
+		s = SpaceSaving(10)
+		for item in self.data:
+			s.add(item)
+		actual = Counter(self.data)
+		for item, count, error in s.top(10):
+			self.assertGreaterEqual(count, actual[item])
+			self.assertLessEqual(count - error, actual[item])
+	
+	def test_merge(self):
+		a = SpaceSaving(50)
+		b = SpaceSaving(50)
+		for i, item in enumerate(self.data):
+			(a if i % 2 else b).add(item)
+		merged = a.merge(b)
+		self.assertEqual(merged.total, len(self.data))
+		self.assertEqual([(item, count) for item, count, error in merged.top(5)], self.expected)
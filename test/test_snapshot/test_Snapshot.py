@@ -0,0 +1,114 @@
+import unittest
+import os
+import tempfile
+from halonctl.snapshot import Snapshot, hql_to_sql
+from halonctl.util import to_base64
+
+class Message(object):
+	def __init__(self, id, sender, ts):
+		self.id = id
+		self.msgqueueid = id * 10
+		self.msgfrom = sender
+		self.msgto = u"someone@example.com"
+		self.msgts0 = ts
+		self.msgsubject = to_base64(u"Message {0}".format(id))
+
+class Service(object):
+	def __init__(self, messages, code=200):
+		self.messages = messages
+		self.code = code
+	
+	def mailHistory(self, filter, offset, limit):
+		if self.code != 200:
+			return (self.code, None)
+		items = self.messages[offset or 0:(offset or 0) + limit]
+		return (200, { 'result': { 'item': items } if items else {} })
+
+class Cluster(object):
+	name = u"c1"
+
+class Node(object):
+	cluster = Cluster()
+	
+	def __init__(self, name, service):
+		self.name = name
+		self.service = service
+
+class TestHQLToSQL(unittest.TestCase):
+	def test_empty(self):
+		self.assertEqual(hql_to_sql(u""), (u"", []))
+	
+	def test_conditions(self):
+		self.assertEqual(hql_to_sql(u"from~%@halon.se time>100"),
+			(u'("from" LIKE ? AND "time" > ?)', [u"%@halon.se", 100]))
+		self.assertEqual(hql_to_sql(u'id=3 or (not to="a b")'),
+			(u'("historyid" = ? OR NOT "to" = ?)', [3, u"a b"]))
+	
+	def test_errors(self):
+		for hql in [u"bogus=1", u"(from=a", u"from=a)", u"size=big", u"or"]:
+			with self.assertRaises(ValueError):
+				hql_to_sql(hql)
+
+class TestSnapshot(unittest.TestCase):
+	def test_missing(self):
+		with self.assertRaises(IOError):
+			Snapshot(os.path.join(tempfile.gettempdir(), u"halonctl_no_such_snapshot.db"))
+	
+	def setUp(self):
+		self.snapshot = Snapshot(':memory:', create=True)
+		self.n1 = Node(u"n1", Service([Message(i, u"a{0}@example.com".format(i % 3), 1000 + i) for i in range(25)]))
+		self.n2 = Node(u"n2", Service([], 500))
+	
+	def test_pull(self):
+		results = self.snapshot.pull([self.n1, self.n2], u"", page_size=10)
+		self.assertEqual(results[self.n1], (200, 25))
+		self.assertEqual(results[self.n2], (500, 0))
+		
+		# Pulling again shouldn't duplicate anything
+		self.snapshot.pull([self.n1], u"", page_size=10)
+		self.assertEqual(self.snapshot.count(u""), 25)
+	
+	def test_query(self):
+		self.snapshot.pull([self.n1], u"", page_size=10)
+		self.assertEqual(self.snapshot.count(u"from=a1@example.com"), 8)
+		self.assertEqual(self.snapshot.count(u"from=a1@example.com", [self.n2]), 0)
+		
+		rows = list(self.snapshot.query(['historyid', 'queueid', 'subject', 'time'], u"time>=1020", limit=2))
+		self.assertEqual(rows, [(24, 240, u"Message 24", 1024), (23, 230, u"Message 23", 1023)])
+
+class HistoryService(Service):
+	'''Understands just enough HQL to filter on "id>N".'''
+	
+	def mailHistory(self, filter, offset, limit):
+		self.last_filter = filter
+		after = int(filter.split('id>')[1]) if 'id>' in filter else 0
+		items = [msg for msg in self.messages if msg.id > after][offset or 0:(offset or 0) + limit]
+		return (self.code, { 'result': { 'item': items } if items else {} })
+
+class TestSync(unittest.TestCase):
+	def setUp(self):
+		self.snapshot = Snapshot(':memory:', create=True)
+		self.service = HistoryService([Message(i, u"a@example.com", 1000 + i) for i in range(1, 6)])
+		self.node = Node(u"n1", self.service)
+	
+	def test_sync(self):
+		self.assertEqual(self.snapshot.sync([self.node], page_size=2), { self.node: (200, 5) })
+		self.assertEqual(self.service.last_filter, u"")
+		self.assertEqual(self.snapshot.get_cursor(self.node), 5)
+		
+		self.service.messages.append(Message(6, u"a@example.com", 1006))
+		self.assertEqual(self.snapshot.sync([self.node], u"from=a@example.com"), { self.node: (200, 1) })
+		self.assertEqual(self.service.last_filter, u"(from=a@example.com) id>5")
+		self.assertEqual(self.snapshot.get_cursor(self.node), 6)
+		self.assertEqual(self.snapshot.count(u""), 6)
+	
+	def test_sync_failure(self):
+		self.snapshot.sync([self.node])
+		self.service.messages.append(Message(6, u"a@example.com", 1006))
+		self.service.code = 500
+		self.assertEqual(self.snapshot.sync([self.node]), { self.node: (500, 0) })
+		self.assertEqual(self.snapshot.get_cursor(self.node), 5)
+	
+	def test_cursor_from_pull(self):
+		self.snapshot.pull([self.node], u"")
+		self.assertEqual(self.snapshot.get_cursor(self.node), 5)
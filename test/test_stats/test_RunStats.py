@@ -0,0 +1,52 @@
+import unittest
+from halonctl.stats import RunStats
+from halonctl.models import Node
+
+class FakePool(object):
+	num_connections = 2
+	num_requests = 5
+
+class FakeRaw(object):
+	_pool = FakePool()
+
+class FakeResponse(object):
+	def __init__(self, status_code=200, content=b'abcd'):
+		self.status_code = status_code
+		self.content = content
+		self.raw = FakeRaw()
+
+class TestRunStats(unittest.TestCase):
+	def setUp(self):
+		self.stats = RunStats()
+		self.node = Node("http://0.0.0.1", 'n1')
+	
+	def test_disabled_by_default(self):
+		self.assertFalse(self.stats.enabled)
+	
+	def test_record_call(self):
+		self.stats.record_call(self.node, 'getUptime', 10, FakeResponse())
+		self.stats.record_call(self.node, 'getUptime', 10, FakeResponse())
+		self.stats.record_call(self.node, 'login', 5, FakeResponse(401, b''))
+		
+		self.assertEqual(self.stats.calls, {'getUptime': 2, 'login': 1})
+		self.assertEqual(self.stats.bytes_sent, 25)
+		self.assertEqual(self.stats.bytes_received, 8)
+		self.assertEqual(self.stats.failures[self.node], 1)
+	
+	def test_record_failure(self):
+		self.stats.record_call(self.node, 'getUptime', 10)
+		self.stats.record_timeout(self.node)
+		
+		self.assertEqual(self.stats.failures[self.node], 1)
+		self.assertEqual(self.stats.timeouts[self.node], 1)
+	
+	def test_connection_counts(self):
+		self.stats.record_call(self.node, 'getUptime', 10, FakeResponse())
+		self.stats.record_call(self.node, 'getUptime', 10, FakeResponse())
+		self.assertEqual(self.stats.get_connection_counts(), (2, 3))
+	
+	def test_summary(self):
+		self.stats.record_call(self.node, 'getUptime', 10)
+		lines = self.stats.summary()
+		self.assertIn(u"  getUptime: 1", lines)
+		self.assertIn(u"  n1 (0.0.0.1): 1 failed, 0 timed out", lines)
@@ -1,9 +1,15 @@
 import unittest
-from halonctl.util import async_dispatch
+import time
+import threading
+from halonctl.util import async_dispatch, iter_dispatch, iter_dispatch_grouped, deadline
 
 def f(n=3, m=2):
 	return n*m
 
+def slow(n=3):
+	time.sleep(0.5)
+	return n
+
 class TestDispatchAsync(unittest.TestCase):
 	def test_full_dispatches(self):
 		query = { '3*2': (f, [3], {'m': 2}), '2*4': (f, [2], {'m': 4}) }
@@ -19,3 +25,57 @@ class TestDispatchAsync(unittest.TestCase):
 		query = { '3*2': (f,) }
 		expected = { '3*2': 6 }
 		self.assertEqual(async_dispatch(query), expected)
+	
+	def test_timeout(self):
+		query = { 'fast': (f, [3]), 'slow': (slow, [3]) }
+		expected = { 'fast': 6, 'slow': (0, None) }
+		self.assertEqual(async_dispatch(query, timeout=0.1, default=(0, None)), expected)
+	
+	def test_deadline(self):
+		deadline.start(0.1)
+		try:
+			query = { 'fast': (f, [3]), 'slow': (slow, [3]) }
+			expected = { 'fast': 6, 'slow': None }
+			self.assertEqual(async_dispatch(query), expected)
+			self.assertTrue(deadline.missed)
+		finally:
+			deadline.at = None
+			deadline.missed = False
+	
+	def test_iter_dispatch(self):
+		query = { 'fast': (f, [3]), 'slow': (slow, [3]) }
+		self.assertEqual(list(iter_dispatch(query)), [('fast', 6), ('slow', 3)])
+		self.assertEqual(list(iter_dispatch(query, timeout=0.1)), [('fast', 6), ('slow', None)])
+	
+	def test_grouped(self):
+		lock = threading.Lock()
+		active = {}
+		peak = {}
+		
+		def job(group):
+			with lock:
+				active[group] = active.get(group, 0) + 1
+				peak[group] = max(peak.get(group, 0), active[group])
+			time.sleep(0.05)
+			with lock:
+				active[group] -= 1
+			return group
+		
+		groups = { g: { (g, i): (job, [g]) for i in range(10) } for g in range(4) }
+		start = time.time()
+		results = dict(iter_dispatch_grouped(groups, 2))
+		
+		# Groups run side by side, each two at a time
+		self.assertLess(time.time() - start, 0.45)
+		self.assertEqual(peak, { g: 2 for g in range(4) })
+		self.assertEqual(results, { (g, i): g for g in range(4) for i in range(10) })
+	
+	def test_grouped_timeout(self):
+		groups = { 'a': { 'fast': (f, [3]), 'slow': (slow, [3]) } }
+		self.assertEqual(dict(iter_dispatch_grouped(groups, 2, timeout=0.1)), { 'fast': 6, 'slow': None })
+	
+	def test_grouped_error(self):
+		def fail():
+			raise KeyError()
+		with self.assertRaises(KeyError):
+			list(iter_dispatch_grouped({ 'a': { 'fail': (fail,) } }, 1))
@@ -0,0 +1,56 @@
+import unittest
+import datetime
+from halonctl import util
+from halonctl.util import textualize, register_converter
+from halonctl.modapi import Formatter
+from halonctl.roles import Role, HTTPStatus
+from halonctl.models import Node
+
+class Args(object):
+	raw = False
+
+class MyRole(Role):
+	def __init__(self, value):
+		self.value = value
+	
+	def raw(self):
+		return self.value
+	
+	def human(self):
+		return u"slow"
+
+class TestConverters(unittest.TestCase):
+	def tearDown(self):
+		util.converters.pop(MyRole, None)
+		util._resolved_converters.clear()
+	
+	def test_builtin(self):
+		self.assertEqual(textualize(None), u"-")
+		self.assertEqual(textualize(None, True), None)
+		self.assertEqual(textualize(True), u"Yes")
+		self.assertEqual(textualize(False, True), False)
+		self.assertEqual(textualize(5), u"5")
+		self.assertEqual(textualize(5, native=True), 5)
+		self.assertEqual(textualize(True, native=True), True)
+		self.assertEqual(textualize(None, native=True), None)
+		self.assertEqual(textualize(None, True, native=True), None)
+		self.assertEqual(textualize(datetime.timedelta(days=2, hours=3)), u"2d 3h 0m")
+		self.assertEqual(textualize(datetime.timedelta(minutes=2), True), 120)
+		self.assertEqual(textualize(datetime.timedelta(seconds=42)), u"42s")
+		self.assertEqual(textualize(Node(name=u"n1")), u"n1")
+	
+	def test_role_subclass(self):
+		self.assertEqual(textualize(HTTPStatus(200)), u"OK")
+		self.assertEqual(textualize(HTTPStatus(200), True), 200)
+		self.assertEqual(textualize(MyRole(1)), u"slow")
+	
+	def test_register(self):
+		register_converter(MyRole, lambda item: u"fast")
+		self.assertEqual(textualize(MyRole(1)), u"fast")
+		self.assertEqual(textualize(MyRole(1), True), u"fast")
+	
+	def test_row_converter(self):
+		convert = Formatter().make_row_converter(Args())
+		self.assertEqual(convert([None, 1, HTTPStatus(0)]), [u"-", u"1", u"Unreachable"])
+		self.assertEqual(convert([u"a", None, HTTPStatus(200)]), [u"a", u"-", u"OK"])
+		self.assertEqual(convert([True, u"b", MyRole(1)]), [u"Yes", u"b", u"slow"])
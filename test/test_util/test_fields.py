@@ -0,0 +1,46 @@
+import unittest
+from halonctl.fields import compile_fields, compile_field, get_supported_fields
+from halonctl.util import to_base64, textualize
+
+class Cluster(object):
+	name = u"c1"
+
+class Node(object):
+	name = u"n1"
+	cluster = Cluster()
+
+class Message(object):
+	id = 12
+	msgid = u"<abc@example.com>"
+	msgqueueid = 34
+	msgfrom = u"a@example.com"
+	msgts0 = 1400000000
+	msgsubject = to_base64(u"Hello world")
+
+class TestFields(unittest.TestCase):
+	def test_supported(self):
+		self.assertIn('historyid', get_supported_fields(True))
+		self.assertNotIn('historyid', get_supported_fields(False))
+		self.assertIn('retry', get_supported_fields(False))
+	
+	def test_compile(self):
+		extract = compile_fields(['cluster', 'node', 'queueid', 'from', 'helo', 'time'], history=True, timezone=0)
+		values = extract(Node(), Message())
+		self.assertEqual(values[:5], [u"c1", u"n1", 34, u"a@example.com", None])
+		self.assertEqual(values[5].raw(), 1400000000)
+		
+		self.assertEqual(compile_field('queueid')(Node(), Message()), 12)
+	
+	def test_subject(self):
+		subject = compile_field('subject')(Node(), Message())
+		self.assertIsNone(subject.decoded)
+		self.assertEqual(textualize(subject), u"Hello world")
+		self.assertEqual(textualize(compile_field('subject')(Node(), object())), u"")
+	
+	def test_unsupported(self):
+		with self.assertRaises(KeyError):
+			compile_fields(['retry'], history=True)
+	
+	def test_derived(self):
+		self.assertEqual(compile_fields(['fromdomain', 'todomain'])(Node(), Message()), [u"example.com", None])
+		self.assertNotIn('fromdomain', get_supported_fields(True, derived=False))
@@ -0,0 +1,37 @@
+import unittest
+import time
+from halonctl.util import iter_all_pages
+
+class Service(object):
+	def __init__(self, total):
+		self.total = total
+		self.calls = 0
+	
+	def mailQueue(self, filter=None, offset=None, limit=None):
+		self.calls += 1
+		offset = offset or 0
+		return (200, { 'result': { 'item': list(range(offset, min(offset + limit, self.total))) } })
+
+class Node(object):
+	def __init__(self, total):
+		self.service = Service(total)
+
+class TestIterAllPages(unittest.TestCase):
+	def test_all(self):
+		nodes = [Node(25), Node(3)]
+		pages = list(iter_all_pages(nodes, 'mailQueue', u"", 10))
+		self.assertEqual(sorted(len(items) for node, code, items in pages), [3, 5, 10, 10])
+	
+	def test_consumer_fails(self):
+		nodes = [Node(100000), Node(100000)]
+		with self.assertRaises(ValueError):
+			for node, code, items in iter_all_pages(nodes, 'mailQueue', u"", 1):
+				raise ValueError()
+		
+		# The fetching threads give up, rather than filling the queue and
+		# waiting for someone to empty it
+		time.sleep(0.5)
+		calls = [node.service.calls for node in nodes]
+		time.sleep(0.3)
+		self.assertEqual([node.service.calls for node in nodes], calls)
+		self.assertLess(sum(calls), 100)
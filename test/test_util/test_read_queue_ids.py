@@ -0,0 +1,33 @@
+import unittest
+from halonctl.util import read_queue_ids
+from halonctl.models import Node
+
+class TestReadQueueIds(unittest.TestCase):
+	def setUp(self):
+		self.n1 = Node(name="n1")
+		self.n2 = Node(name="n2")
+		self.nodes = [self.n1, self.n2]
+	
+	def test_node_and_id(self):
+		ids = read_queue_ids([u"n1 5", u"n2,6", u"n1\t7"], self.nodes)
+		self.assertEqual(ids[self.n1], [5, 7])
+		self.assertEqual(ids[self.n2], [6])
+	
+	def test_bare_id(self):
+		ids = read_queue_ids([u"5", u"n1 6"], [self.n1])
+		self.assertEqual(ids[self.n1], [5, 6])
+	
+	def test_bare_id_many_nodes(self):
+		with self.assertRaises(ValueError):
+			read_queue_ids([u"n1 5", u"6"], self.nodes)
+	
+	def test_skipped_lines(self):
+		ids = read_queue_ids([u"node,queueid", u"", u"# comment", u"n1,5"], self.nodes)
+		self.assertEqual(ids[self.n1], [5])
+		self.assertEqual(ids[self.n2], [])
+	
+	def test_invalid(self):
+		with self.assertRaises(ValueError):
+			read_queue_ids([u"n1 5", u"n1 x"], self.nodes)
+		with self.assertRaises(ValueError):
+			read_queue_ids([u"n3 5"], self.nodes)
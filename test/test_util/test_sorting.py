@@ -0,0 +1,102 @@
+import unittest
+import random
+from argparse import Namespace
+from halonctl.sorting import external_sort, top_n, group_sorted, merge_join, sort_key
+from halonctl.util import group_by
+from halonctl.modapi import Formatter, DictFormatter
+
+class TestSorting(unittest.TestCase):
+	def test_sort_key(self):
+		values = [u"b", 3, None, 1.5, u"a"]
+		self.assertEqual(sorted(values, key=sort_key), [None, 1.5, 3, u"a", u"b"])
+	
+	def test_external_sort(self):
+		items = [(random.randint(0, 50), i) for i in range(1000)]
+		for reverse in (False, True):
+			result = list(external_sort(items, lambda x: x[0], reverse, buffer_size=77))
+			self.assertEqual(result, sorted(items, key=lambda x: x[0], reverse=reverse))
+	
+	def test_external_sort_empty(self):
+		self.assertEqual(list(external_sort([], lambda x: x, buffer_size=2)), [])
+	
+	def test_top_n(self):
+		items = list(range(100))
+		random.shuffle(items)
+		self.assertEqual(top_n(items, sort_key, 3), [0, 1, 2])
+		self.assertEqual(top_n(items, sort_key, 3, reverse=True), [99, 98, 97])
+	
+	def test_group_sorted(self):
+		rows = [{ 'k': i % 3, 'v': i } for i in range(10)]
+		self.assertEqual(dict(group_sorted(rows, lambda r: r['k'])), group_by(rows, 'k', False))
+		self.assertEqual(dict(group_sorted(rows, lambda r: r['k'], True)), group_by(rows, 'k', True))
+		self.assertEqual([k for k, _ in group_sorted(rows, lambda r: r['k'])], [0, 1, 2])
+	
+	def test_merge_join(self):
+		left = [(1, u"a"), (2, u"b"), (4, u"d")]
+		right = [(2, u"B"), (3, u"C"), (4, u"D"), (5, u"E")]
+		self.assertEqual(list(merge_join(left, right, lambda i: i[0])), [
+			((1, u"a"), None),
+			((2, u"b"), (2, u"B")),
+			(None, (3, u"C")),
+			((4, u"d"), (4, u"D")),
+			(None, (5, u"E")),
+		])
+		self.assertEqual(list(merge_join([], right[:1], lambda i: i[0])), [(None, (2, u"B"))])
+	
+	def test_merge_join_external(self):
+		left = list(range(0, 300, 2))
+		right = list(range(0, 300, 3))
+		random.shuffle(left)
+		random.shuffle(right)
+		joined = list(merge_join(external_sort(left, int, buffer_size=16), external_sort(right, int, buffer_size=16), int))
+		self.assertEqual(sum(1 for l, r in joined if l is not None and r is not None), 50)
+		self.assertEqual(len(joined), 150 + 100 - 50)
+
+class ListFormatter(Formatter):
+	def format(self, data, args):
+		return data
+
+class TestSortedRows(unittest.TestCase):
+	rows = [(u"Name", u"Uptime"), (u"n1", 50), (u"n2", None), (u"n3", 7)]
+	
+	def run_formatter(self, **kwargs):
+		args = Namespace(raw=True, sort_by=None, top=None, reverse=False)
+		args.__dict__.update(kwargs)
+		return ListFormatter().run(self.rows, args)
+	
+	def test_unsorted(self):
+		self.assertEqual([r[0] for r in self.run_formatter()[1:]], [u"n1", u"n2", u"n3"])
+	
+	def test_sort_by(self):
+		self.assertEqual([r[0] for r in self.run_formatter(sort_by='uptime')[1:]], [u"n2", u"n3", u"n1"])
+		self.assertEqual([r[0] for r in self.run_formatter(sort_by='Uptime', reverse=True)[1:]], [u"n1", u"n3", u"n2"])
+	
+	def test_top(self):
+		self.assertEqual(self.run_formatter(sort_by='uptime', top=1, reverse=True), [[u"Name", u"Uptime"], [u"n1", u"50"]])
+	
+	def test_unknown_column(self):
+		with self.assertRaises(SystemExit):
+			self.run_formatter(sort_by='nope')
+
+class ListDictFormatter(DictFormatter):
+	def format(self, data, args):
+		return data
+
+class TestSortedDicts(unittest.TestCase):
+	rows = TestSortedRows.rows
+	
+	def run_formatter(self, **kwargs):
+		args = Namespace(raw=True, sort_by=None, top=None, reverse=False, group_by=None, group_key=False)
+		args.__dict__.update(kwargs)
+		return ListDictFormatter().run(self.rows, args)
+	
+	def test_sort_by(self):
+		self.assertEqual([r[u"Name"] for r in self.run_formatter(sort_by='uptime')], [u"n2", u"n3", u"n1"])
+		self.assertEqual([r[u"Name"] for r in self.run_formatter(sort_by='uptime', reverse=True)], [u"n1", u"n3", u"n2"])
+	
+	def test_top(self):
+		self.assertEqual(self.run_formatter(sort_by='uptime', top=1, reverse=True), [{ u"Name": u"n1", u"Uptime": u"50" }])
+	
+	def test_unknown_column(self):
+		with self.assertRaises(SystemExit):
+			self.run_formatter(sort_by='nope')
@@ -0,0 +1,24 @@
+import unittest
+import arrow
+from dateutil import tz
+from halonctl.util import format_timestamp, get_tzoffset
+from halonctl.roles import UTCDate
+
+def reference(timestamp, timezone):
+	return str(arrow.get(arrow.get(timestamp).naive, tz.tzoffset(None, timezone * 3600 if timezone else 0)))
+
+class TestTimestamps(unittest.TestCase):
+	def setUp(self):
+		self.timestamps = [0, 1262439425, 1262476799, -86401, 2**33, 1262439425.5, '1262439425']
+		self.timezones = [None, 0, 1, -7, 5.5, -3.5]
+	
+	def test_format_timestamp(self):
+		for timezone in self.timezones:
+			for timestamp in self.timestamps:
+				self.assertEqual(format_timestamp(timestamp, timezone), reference(timestamp, timezone))
+	
+	def test_utcdate(self):
+		self.assertEqual(UTCDate(1262439425, 1).human(), u"2010-01-02T13:37:05+01:00")
+	
+	def test_tzoffset_cached(self):
+		self.assertIs(get_tzoffset(2), get_tzoffset(2))